@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Categoria, Producto
+from . import busqueda
+from .models import Categoria, Pedido, PedidoItem, Producto
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -12,3 +13,34 @@ class ProductoAdmin(admin.ModelAdmin):
     list_filter = ('categoria', 'disponible')
     search_fields = ('nombre', 'descripcion')
     list_editable = ('disponible',)
+
+    # Tope de resultados de la búsqueda del admin con el índice
+    limite_busqueda = 1000
+
+    def get_search_results(self, request, queryset, search_term):
+        """Usa el índice de búsqueda en lugar de icontains sobre toda la tabla"""
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        ids = busqueda.buscar(search_term, self.limite_busqueda)
+        return queryset.filter(pk__in=ids), False
+
+
+class PedidoItemInline(admin.TabularInline):
+    model = PedidoItem
+    extra = 0
+    raw_id_fields = ('producto',)
+    readonly_fields = ('producto', 'nombre', 'cantidad', 'precio_unitario')
+
+    # Los items son el registro de lo vendido: ni altas ni bajas desde el admin
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(Pedido)
+class PedidoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'referencia', 'usuario', 'total', 'created_at')
+    search_fields = ('referencia',)
+    readonly_fields = ('usuario', 'referencia', 'total', 'created_at')
+    inlines = [PedidoItemInline]
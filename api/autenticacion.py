@@ -0,0 +1,212 @@
+import copy
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import LRUCache
+from .checks import cache_compartido
+
+
+def _config():
+    return getattr(settings, 'JWT_USUARIOS', {})
+
+
+class CacheUsuarios:
+    """
+    Usuarios autenticados por JWT de este proceso, por id y con TTL.
+
+    Los signals de api.signals borran al usuario cuando se guarda o se
+    borra (cambio de contraseña, desactivación). Con un cache `compartido`
+    (CACHE_URL) además se incrementa una versión por usuario que los demás
+    workers comparan en cada get(); sin él, los cambios hechos desde otro
+    worker, y los hechos con update(), se ven al vencer el TTL.
+    """
+
+    def __init__(self, max_entries=1024, timeout=60, compartido=None):
+        self._usuarios = LRUCache(max_entries=max_entries, timeout=timeout)
+        self._compartido = compartido
+        self._invalidaciones = 0
+        self._lock = threading.Lock()
+
+    # El claim user_id del token es un string: las claves siempre son str(pk)
+
+    def get(self, user_id):
+        guardado = self._usuarios.get(str(user_id))
+        if guardado is None:
+            return None
+        version, usuario = guardado
+        if version != self._version(user_id):
+            return None
+        return usuario
+
+    def generacion(self, user_id=None):
+        """Se toma antes de leer al usuario de la base y se le pasa a set()"""
+        return self._invalidaciones, self._version(user_id)
+
+    def set(self, user_id, usuario, generacion):
+        # Si hubo una invalidación mientras se leía de la base, la copia
+        # leída puede estar vieja: no se guarda
+        invalidaciones, version = generacion
+        with self._lock:
+            if invalidaciones == self._invalidaciones:
+                self._usuarios.set(str(user_id), (version, usuario))
+
+    def invalidar(self, user_id):
+        with self._lock:
+            self._invalidaciones += 1
+            self._usuarios.delete(str(user_id))
+        if self._compartido is not None:
+            clave = self._clave(user_id)
+            if not self._compartido.add(clave, 1, None):
+                try:
+                    self._compartido.incr(clave)
+                except ValueError:  # venció o la desalojaron entre add e incr
+                    self._compartido.set(clave, 1, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._invalidaciones += 1
+            self._usuarios.clear()
+
+    def __len__(self):
+        return len(self._usuarios)
+
+    def _clave(self, user_id):
+        return 'jwt:usuario:%s' % user_id
+
+    def _version(self, user_id):
+        if self._compartido is None or user_id is None:
+            return None
+        return self._compartido.get(self._clave(user_id), 0)
+
+
+def _cache_compartido():
+    alias = _config().get('CACHE_ALIAS', 'default')
+    return caches[alias] if cache_compartido(alias) else None
+
+
+usuarios = CacheUsuarios(
+    max_entries=_config().get('CACHE_MAX_ENTRIES', 1024),
+    timeout=_config().get('CACHE_TIMEOUT', 60),
+    compartido=_cache_compartido(),
+)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication que no consulta auth_user en cada request.
+
+    El usuario se guarda en `usuarios` la primera vez; en los siguientes
+    requests con un token del mismo usuario se vuelven a chequear is_active y
+    la revocación por cambio de contraseña contra la copia cacheada.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('El token no identifica a un usuario')
+
+        usuario = usuarios.get(user_id)
+        if usuario is None:
+            generacion = usuarios.generacion(user_id)
+            usuario = super().get_user(validated_token)
+            usuarios.set(user_id, usuario, generacion)
+        else:
+            self._verificar(usuario, validated_token)
+        # Cada request recibe su copia: nada de estado compartido entre threads
+        return copy.copy(usuario)
+
+    def _verificar(self, usuario, validated_token):
+        """Los mismos chequeos que JWTAuthentication.get_user, sin ir a la base"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not usuario.is_active:
+            raise AuthenticationFailed('El usuario está inactivo', code='user_inactive')
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(usuario.password):
+                raise AuthenticationFailed(
+                    'La contraseña del usuario cambió', code='password_changed'
+                )
+
+
+class StatelessReadJWTAuthentication(CachedJWTAuthentication):
+    """
+    En GET/HEAD/OPTIONS el usuario se arma con los claims del token
+    (TokenUser), sin base ni cache; las escrituras usan el usuario real.
+
+    Pensado para las lecturas públicas del catálogo, que no miran al
+    usuario. Las vistas que necesitan is_staff o permisos en un GET declaran
+    AUTENTICACION_CON_USUARIO.
+    """
+
+    # DRF crea una instancia del autenticador por request
+    request = None
+
+    def authenticate(self, request):
+        self.request = request
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.request is not None and self.request.method in SAFE_METHODS:
+            if api_settings.USER_ID_CLAIM not in validated_token:
+                raise InvalidToken('El token no identifica a un usuario')
+            return api_settings.TOKEN_USER_CLASS(validated_token)
+        return super().get_user(validated_token)
+
+
+def id_usuario(request):
+    """
+    Id (str) del usuario del request antes de llegar a DRF, para los
+    middlewares: el claim del JWT (se valida la firma, sin ir a la base) o
+    el de la sesión. None si es anónimo o el token no es válido; DRF lo
+    rechaza después.
+    """
+    try:
+        return request._id_usuario
+    except AttributeError:
+        pass
+    request._id_usuario = _leer_id_usuario(request)
+    return request._id_usuario
+
+
+async def aid_usuario(request):
+    """
+    id_usuario para los middlewares async: el JWT se lee sin I/O; la
+    sesión, que puede estar en la base, en un thread
+    """
+    if hasattr(request, '_id_usuario'):
+        return request._id_usuario
+    if (
+        api_settings.AUTH_HEADER_NAME not in request.META
+        and settings.SESSION_COOKIE_NAME in request.COOKIES
+    ):
+        return await sync_to_async(id_usuario)(request)
+    return id_usuario(request)
+
+
+def _leer_id_usuario(request):
+    autenticacion = JWTAuthentication()
+    cabecera = autenticacion.get_header(request)
+    if cabecera is not None:
+        try:
+            crudo = autenticacion.get_raw_token(cabecera)
+            if crudo is not None:
+                return str(autenticacion.get_validated_token(crudo)[api_settings.USER_ID_CLAIM])
+        except (AuthenticationFailed, KeyError):
+            return None
+    sesion = getattr(request, 'session', None)
+    if sesion is not None and sesion.get(SESSION_KEY) is not None:
+        return str(sesion[SESSION_KEY])
+    return None
+
+
+# Para vistas que leen is_staff o permisos del usuario también en GET
+AUTENTICACION_CON_USUARIO = [CachedJWTAuthentication, SessionAuthentication]
@@ -0,0 +1,444 @@
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .conditional import estado_productos
+from .models import Categoria, Producto
+
+logger = logging.getLogger('api')
+
+STOPWORDS = frozenset((
+    'a', 'al', 'con', 'de', 'del', 'el', 'en', 'la', 'las', 'lo', 'los',
+    'para', 'por', 'sin', 'un', 'una', 'y',
+))
+
+# Peso de cada campo y calidad de cada tipo de coincidencia en el ranking
+PESO_NOMBRE = 3
+PESO_OTROS = 1
+CALIDAD_EXACTA = 1.0
+CALIDAD_PREFIJO = 0.8
+CALIDAD_APROXIMADA = 0.5
+
+# Columnas de Producto que alimentan el índice (más el nombre de la categoría)
+CAMPOS_INDEXADOS = frozenset(('nombre', 'descripcion', 'categoria'))
+
+MIN_PREFIJO = 2
+MAX_EXPANSION_PREFIJO = 50
+MIN_APROXIMADA = 4
+
+_NO_ALFANUMERICO = re.compile(r'[^0-9a-z]+')
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni signos: 'Ñoquis caseros!' -> 'noquis caseros'"""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(' ', texto.lower()).strip()
+
+
+def tokenizar(texto):
+    return [t for t in normalizar(texto).split() if t not in STOPWORDS]
+
+
+def _borrados(token):
+    """Variantes de token con una letra menos (SymSpell con distancia 1)"""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _a_distancia_uno(a, b):
+    """True si a y b difieren en una inserción, borrado, sustitución o transposición"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return (
+        a[i + 1:] == b[i + 1:]
+        or (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:])
+    )
+
+
+def _unir(conjuntos):
+    """Unión de una lista de conjuntos (el mismo conjunto si hay uno solo)"""
+    return conjuntos[0] if len(conjuntos) == 1 else set().union(*conjuntos)
+
+
+class IndiceProductos:
+    """
+    Índice invertido en memoria sobre nombre y descripción del producto y
+    nombre de su categoría.
+
+    Cada token apunta a {peso: ids de productos}, así el ranking se arma con
+    operaciones de conjuntos y no producto por producto. Para búsqueda por prefijo se
+    mantiene el vocabulario ordenado (bisect) y para tolerar errores de tipeo
+    un mapa de borrados al estilo SymSpell: un término con un error comparte
+    alguna variante "con una letra menos" con el token correcto.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._limpiar()
+
+    def _limpiar(self):
+        self._postings = {}
+        self._vocabulario = []
+        self._variantes = {}
+        self._tokens_producto = {}
+        self._categoria_producto = {}
+        self._datos_producto = {}
+        self._categorias = {}
+
+    def __len__(self):
+        return len(self._tokens_producto)
+
+    # Escritura
+
+    def construir(self):
+        """Reconstruye el índice completo con dos consultas"""
+        self.cargar(
+            dict(Categoria.objects.values_list('id', 'nombre')),
+            Producto.objects.values_list(
+                'id', 'nombre', 'descripcion', 'categoria_id'
+            ).iterator(chunk_size=2000),
+        )
+
+    def cargar(self, categorias, filas):
+        """Reemplaza el contenido: {id: nombre} de categorías y (id, nombre, descripcion, categoria_id)"""
+        with self._lock:
+            self._limpiar()
+            self._categorias = dict(categorias)
+            for pk, nombre, descripcion, categoria_id in filas:
+                self._indexar(pk, nombre, descripcion, categoria_id)
+
+    def actualizar_producto(self, pk, nombre, descripcion, categoria_id):
+        with self._lock:
+            self._quitar(pk)
+            self._indexar(pk, nombre, descripcion, categoria_id)
+
+    def quitar_producto(self, pk):
+        with self._lock:
+            self._quitar(pk)
+
+    def actualizar_categoria(self, pk, nombre):
+        """Registra el nombre de la categoría y reindexa sus productos si cambió"""
+        with self._lock:
+            if self._categorias.get(pk) == nombre:
+                return
+            self._categorias[pk] = nombre
+            afectados = [p for p, c in self._categoria_producto.items() if c == pk]
+            for producto in afectados:
+                nombre_producto, descripcion = self._datos_producto[producto]
+                self._quitar(producto)
+                self._indexar(producto, nombre_producto, descripcion, pk)
+
+    def quitar_categoria(self, pk):
+        # Sus productos se borran en cascada y llegan por quitar_producto
+        with self._lock:
+            self._categorias.pop(pk, None)
+
+    def _indexar(self, pk, nombre, descripcion, categoria_id):
+        pesos = {}
+        for token in tokenizar(descripcion) + tokenizar(self._categorias.get(categoria_id, '')):
+            pesos[token] = PESO_OTROS
+        for token in tokenizar(nombre):
+            pesos[token] = PESO_NOMBRE
+
+        for token, peso in pesos.items():
+            por_peso = self._postings.get(token)
+            if por_peso is None:
+                por_peso = self._postings[token] = {}
+                insort(self._vocabulario, token)
+                for variante in _borrados(token) | {token}:
+                    self._variantes.setdefault(variante, set()).add(token)
+            por_peso.setdefault(peso, set()).add(pk)
+        self._tokens_producto[pk] = tuple(pesos.items())
+        self._categoria_producto[pk] = categoria_id
+        self._datos_producto[pk] = (nombre, descripcion)
+
+    def _quitar(self, pk):
+        for token, peso in self._tokens_producto.pop(pk, ()):
+            por_peso = self._postings[token]
+            por_peso[peso].discard(pk)
+            if not por_peso[peso]:
+                del por_peso[peso]
+            if por_peso:
+                continue
+            del self._postings[token]
+            del self._vocabulario[bisect_left(self._vocabulario, token)]
+            for variante in _borrados(token) | {token}:
+                tokens = self._variantes[variante]
+                tokens.discard(token)
+                if not tokens:
+                    del self._variantes[variante]
+        self._categoria_producto.pop(pk, None)
+        self._datos_producto.pop(pk, None)
+
+    # Lectura
+
+    def buscar(self, consulta, limite=20):
+        """
+        ids de productos ordenados por relevancia.
+
+        Todos los términos tienen que coincidir (exacto o con un error de
+        tipeo); el último además se completa por prefijo para el typeahead.
+        """
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return []
+
+        # Los conjuntos son los del índice: se recorren con el lock tomado
+        with self._lock:
+            niveles = [
+                self._niveles(self._tokens_termino(termino, prefijo=posicion == len(terminos) - 1))
+                for posicion, termino in enumerate(terminos)
+            ]
+            if not all(niveles):
+                return []
+            if len(niveles) == 1:
+                return self._mejores(
+                    [(puntaje, _unir(conjuntos)) for puntaje, conjuntos in niveles[0]], limite
+                )
+            return self._combinar(niveles, limite)
+
+    def _combinar(self, niveles, limite):
+        """Los `limite` ids de mejor puntaje total entre los que coinciden con todos los términos"""
+        # Se arranca por el término más selectivo: cada intersección cuesta lo
+        # que el conjunto más chico, así que los términos comunes y las
+        # expansiones de prefijo (hasta MAX_EXPANSION_PREFIJO tokens) nunca se unen enteros
+        selectivos = sorted(
+            niveles, key=lambda nivel: sum(len(ids) for _, conjuntos in nivel for ids in conjuntos)
+        )
+        candidatos = _unir([ids for _, conjuntos in selectivos[0] for ids in conjuntos])
+        for nivel in selectivos[1:]:
+            candidatos = _unir([candidatos & ids for _, conjuntos in nivel for ids in conjuntos])
+            if not candidatos:
+                return []
+
+        # Puntaje total por grupos y no producto por producto: cada término
+        # reparte los candidatos de cada grupo según el mejor nivel en que aparecen
+        grupos = {0: candidatos}
+        for nivel in niveles:
+            siguientes = {}
+            for total, grupo in grupos.items():
+                for puntaje, conjuntos in nivel:
+                    comunes = _unir([grupo & ids for ids in conjuntos])
+                    if not comunes:
+                        continue
+                    grupo = grupo - comunes
+                    clave = total + puntaje
+                    siguientes[clave] = siguientes[clave] | comunes if clave in siguientes else comunes
+                    if not grupo:
+                        break
+            grupos = siguientes
+        return self._mejores(sorted(grupos.items(), reverse=True), limite)
+
+    @staticmethod
+    def _mejores(nivel, limite):
+        """Los `limite` ids de mejor puntaje, recorriendo [(puntaje, ids)] de mayor a menor"""
+        resultado = []
+        vistos = set()
+        for _, ids in nivel:
+            nuevos = ids - vistos
+            if limite and len(resultado) + len(nuevos) >= limite:
+                resultado.extend(heapq.nsmallest(limite - len(resultado), nuevos))
+                break
+            resultado.extend(sorted(nuevos))
+            vistos |= nuevos
+        return resultado
+
+    def _tokens_termino(self, termino, prefijo):
+        """(token, calidad) para cada token del vocabulario que coincide con el término"""
+        encontrados = {}
+        if termino in self._postings:
+            encontrados[termino] = CALIDAD_EXACTA
+
+        if prefijo and len(termino) >= MIN_PREFIJO:
+            inicio = bisect_left(self._vocabulario, termino)
+            fin = min(inicio + MAX_EXPANSION_PREFIJO, len(self._vocabulario))
+            for token in self._vocabulario[inicio:fin]:
+                if not token.startswith(termino):
+                    break
+                encontrados.setdefault(token, CALIDAD_PREFIJO)
+
+        if len(termino) >= MIN_APROXIMADA:
+            for variante in _borrados(termino) | {termino}:
+                for token in self._variantes.get(variante, ()):
+                    if token not in encontrados and _a_distancia_uno(termino, token):
+                        encontrados[token] = CALIDAD_APROXIMADA
+        return encontrados
+
+    def _niveles(self, tokens):
+        """[(puntaje, [conjuntos de ids])] de un término, de mayor a menor puntaje"""
+        por_puntaje = {}
+        for token, calidad in tokens.items():
+            for peso, ids in self._postings[token].items():
+                por_puntaje.setdefault(peso * calidad, []).append(ids)
+        return sorted(por_puntaje.items(), reverse=True)
+
+
+class CambiosLocales:
+    """
+    Escrituras de este proceso ya aplicadas al índice desde el último chequeo:
+    el updated_at que escribió cada una y cuánto cambió la cantidad de filas
+    de cada tabla. Alcanzan para saber si un cambio en estado_productos es
+    sólo de este worker o si también escribió otro.
+    """
+    # Más escrituras que esto entre dos chequeos: se reconstruye sin comparar
+    MAX_MODIFICADOS = 500
+
+    def __init__(self):
+        self.modificados = {Producto: set(), Categoria: set()}
+        self.diferencia = {Producto: 0, Categoria: 0}
+        self.completos = True
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return not self.completos or any(self.modificados.values()) or any(self.diferencia.values())
+
+    def registrar(self, modelo, modificado=None, diferencia=0):
+        with self._lock:
+            if modificado is not None:
+                self.modificados[modelo].add(modificado)
+            elif not diferencia:
+                # Una modificación sin updated_at no se puede reconocer después
+                self.completos = False
+            self.diferencia[modelo] += diferencia
+
+    def explican(self, anterior, estado):
+        """
+        Si el paso de `anterior` a `estado` se debe sólo a estas escrituras:
+        las cantidades coinciden y ninguna fila modificada después de
+        `anterior` lleva un updated_at ajeno (una consulta por tabla)
+        """
+        with self._lock:
+            if not self.completos or any(len(m) > self.MAX_MODIFICADOS for m in self.modificados.values()):
+                return False
+            if estado['total_productos'] != anterior['total_productos'] + self.diferencia[Producto]:
+                return False
+            if estado['total_categorias'] != anterior['total_categorias'] + self.diferencia[Categoria]:
+                return False
+            modificados = {modelo: list(fechas) for modelo, fechas in self.modificados.items()}
+        for modelo, clave in ((Producto, 'productos_modificados'), (Categoria, 'categorias_modificadas')):
+            if estado[clave] == anterior[clave]:
+                continue
+            filas = modelo.objects.exclude(updated_at__in=modificados[modelo])
+            if anterior[clave] is not None:
+                filas = filas.filter(updated_at__gt=anterior[clave])
+            if filas.exists():
+                return False
+        return True
+
+
+class MotorBusqueda:
+    """
+    Mantiene el índice de un proceso (worker de gunicorn).
+
+    Se construye en la primera búsqueda. Las escrituras del propio proceso lo
+    actualizan por signals y quedan registradas en CambiosLocales; cada
+    `intervalo` segundos se compara el estado del catálogo (una consulta
+    agregada) y, si cambió por algo más que esas escrituras (otro worker,
+    un UPDATE sin signals), se reconstruye.
+    """
+
+    def __init__(self, intervalo=5.0):
+        self.intervalo = intervalo
+        self.indice = IndiceProductos()
+        self._estado = None
+        self._proximo_chequeo = 0.0
+        self._locales = CambiosLocales()
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        if self._estado is not None and time.monotonic() < self._proximo_chequeo:
+            return self.indice
+
+        with self._lock:
+            # Antes del estado: una escritura local entre las dos cosas queda
+            # en el estado pero no en `locales`, y se reconstruye
+            locales, self._locales = self._locales, CambiosLocales()
+            estado = estado_productos(None)
+            if self._estado is None or (estado != self._estado and not locales.explican(self._estado, estado)):
+                inicio = time.perf_counter()
+                # Se arma un índice nuevo y se reemplaza: las búsquedas en
+                # curso siguen usando el anterior sin esperar
+                indice = IndiceProductos()
+                indice.construir()
+                self.indice = indice
+                # Lo que este proceso escribió mientras tanto fue al índice
+                # anterior: si cambia el estado, se vuelve a construir
+                if self._locales:
+                    self._locales.completos = False
+                logger.info(
+                    "Índice de búsqueda reconstruido: %d productos en %.1f ms",
+                    len(self.indice), (time.perf_counter() - inicio) * 1000,
+                )
+            self._estado = estado
+            self._proximo_chequeo = time.monotonic() + self.intervalo
+        return self.indice
+
+    def construido(self):
+        return self._estado is not None
+
+    def cambio_local(self, modelo, modificado=None, diferencia=0):
+        """
+        Una escritura de este proceso ya aplicada al índice (o que no lo
+        afecta, como las reservas): el modelo, el updated_at que escribió y
+        +1 / -1 si agregó o borró una fila
+        """
+        self._locales.registrar(modelo, modificado, diferencia)
+
+    def invalidar(self):
+        """Fuerza una reconstrucción completa en la próxima búsqueda"""
+        self._estado = None
+        self._proximo_chequeo = 0.0
+
+
+def _config():
+    return getattr(settings, 'BUSQUEDA', {})
+
+
+motor = MotorBusqueda(intervalo=_config().get('INTERVALO', 5.0))
+
+
+def usa_fulltext():
+    """MOTOR='fulltext' busca con el índice FULLTEXT de MySQL en lugar del índice en memoria"""
+    return _config().get('MOTOR') == 'fulltext' and connection.vendor == 'mysql'
+
+
+def buscar_fulltext(consulta, limite=20):
+    terminos = [t for t in normalizar(consulta).split() if t not in STOPWORDS]
+    if not terminos:
+        return []
+    # Modo booleano: todos los términos obligatorios y el último como prefijo
+    expresion = ' '.join('+%s' % t for t in terminos) + '*'
+    tabla = connection.ops.quote_name(Producto._meta.db_table)
+    relevancia = RawSQL(
+        'MATCH (%s.nombre, %s.descripcion) AGAINST (%%s IN BOOLEAN MODE)' % (tabla, tabla),
+        (expresion,),
+    )
+    ids = (
+        Producto.objects.annotate(relevancia=relevancia)
+        .filter(relevancia__gt=0)
+        .order_by('-relevancia', 'id')
+        .values_list('id', flat=True)
+    )
+    return list(ids[:limite] if limite else ids)
+
+
+def buscar(consulta, limite=20):
+    """ids de productos que coinciden con la consulta, del más al menos relevante"""
+    if usa_fulltext():
+        return buscar_fulltext(consulta, limite)
+    return motor.obtener().buscar(consulta, limite)
@@ -0,0 +1,290 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from comida_al_paso.db import router
+
+VERSION_PREFIX = 'catalogo:version:'
+CABECERAS_GUARDADAS = ('ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+# JSON y las representaciones compactas de api.renderers
+TIPOS_GUARDADOS = ('application/json', 'application/vnd.comidaalpaso.', 'application/msgpack')
+
+
+class LRUCache:
+    """Cache en memoria del proceso, acotada por cantidad de entradas y con TTL opcional"""
+
+    def __init__(self, max_entries=512, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expira, valor = self._datos[key]
+            except KeyError:
+                return default
+            if expira is not None and expira < time.monotonic():
+                del self._datos[key]
+                return default
+            self._datos.move_to_end(key)
+            return valor
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        expira = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._datos[key] = (expira, value)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.max_entries:
+                self._datos.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._datos.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+
+class DjangoCacheBackend:
+    """Adaptador sobre el framework de cache de Django (Redis, Memcached, etc.)"""
+
+    def __init__(self, alias='default', timeout=None):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, self.timeout if timeout is None else timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        # Las claves llevan la versión de cada tabla, así que no hace falta
+        # borrar nada: las entradas viejas quedan inalcanzables y expiran.
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class Estadisticas:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+        }
+
+
+_SinCache = object()
+_backend = None
+_backend_lock = threading.Lock()
+estadisticas = Estadisticas()
+
+
+def _config():
+    return getattr(settings, 'CATALOGO_CACHE', {})
+
+
+def get_backend():
+    """Backend configurado en CATALOGO_CACHE['BACKEND']: 'lru' (por defecto), 'django' u 'off'"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = _config()
+                nombre = config.get('BACKEND', 'lru')
+                if nombre == 'off':
+                    _backend = _SinCache
+                elif nombre == 'django':
+                    _backend = DjangoCacheBackend(
+                        alias=config.get('ALIAS', 'default'),
+                        timeout=config.get('TIMEOUT'),
+                    )
+                else:
+                    _backend = LRUCache(
+                        max_entries=config.get('MAX_ENTRIES', 512),
+                        timeout=config.get('TIMEOUT'),
+                    )
+    return None if _backend is _SinCache else _backend
+
+
+def _versiones():
+    return caches[_config().get('ALIAS', 'default')]
+
+
+def obtener_version(tabla):
+    cache = _versiones()
+    key = VERSION_PREFIX + tabla
+    version = cache.get(key)
+    if version is None:
+        # Se arranca desde un valor basado en el reloj para no reutilizar
+        # versiones viejas si la clave se pierde (reinicio o desalojo).
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def incrementar_version(tabla):
+    cache = _versiones()
+    key = VERSION_PREFIX + tabla
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _clave(request, tablas):
+    versiones = ':'.join('%s=%s' % (t, obtener_version(t)) for t in tablas)
+    params = sorted(request.GET.lists())
+    base = '%s?%s|%s' % (request.path, params, request.META.get('HTTP_ACCEPT', ''))
+    # Con réplicas, lo leído de la primaria (clientes que acaban de escribir)
+    # no se mezcla con lo leído de una réplica que puede estar atrasada
+    return 'catalogo:%s:%s:%s' % (
+        versiones, router.origen_lecturas(), hashlib.md5(base.encode('utf-8')).hexdigest()
+    )
+
+
+def _timeout(backend):
+    """
+    Lo leído de una réplica puede venir atrasado respecto de la versión de
+    la clave: se guarda a lo sumo por la ventana sticky, que cubre el
+    retraso de la replicación (None: el timeout del backend)
+    """
+    if router.origen_lecturas() != 'replica':
+        return None
+    return min(backend.timeout or router.ventana(), router.ventana())
+
+
+def cache_catalogo(*tablas):
+    """
+    Cache read-through para GETs del catálogo.
+
+    La clave combina endpoint, query params, Accept y la versión de cada
+    tabla indicada; los signals de api.signals incrementan la versión en
+    cada escritura, así que nunca se sirve una respuesta de una versión vieja
+    dentro del mismo proceso. Sólo se guardan respuestas JSON (o compactas)
+    con status 200.
+
+    También decora las vistas async de api/views_async.py. Cuando una de
+    ellas delega en la vista sync (decorada igual), el request ya viene
+    marcado y la cache no se revisa dos veces.
+    """
+    def decorator(vista):
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura_async(request, *args, **kwargs):
+                backend = _backend_del_request(request)
+                if backend is None:
+                    return await vista(request, *args, **kwargs)
+                clave = _clave(request, tablas)
+                guardada = _leer(request, backend, clave)
+                if guardada is not None:
+                    return guardada
+                respuesta = await vista(request, *args, **kwargs)
+                # Las Response de DRF (vistas sync delegadas) se renderizan en un thread
+                if respuesta.status_code == 200 and hasattr(respuesta, 'render') and not respuesta.is_rendered:
+                    await sync_to_async(respuesta.render)()
+                return _guardar(backend, clave, respuesta)
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            backend = _backend_del_request(request)
+            if backend is None:
+                return vista(request, *args, **kwargs)
+            clave = _clave(request, tablas)
+            guardada = _leer(request, backend, clave)
+            if guardada is not None:
+                return guardada
+            return _guardar(backend, clave, vista(request, *args, **kwargs))
+        return envoltura
+    return decorator
+
+
+def _backend_del_request(request):
+    """El backend si el request se cachea y ninguna otra envoltura lo revisó, o None"""
+    backend = get_backend()
+    if backend is None or request.method not in ('GET', 'HEAD'):
+        return None
+    if getattr(request, '_cache_catalogo', False):
+        return None
+    request._cache_catalogo = True
+    return backend
+
+
+def _leer(request, backend, clave):
+    """Respuesta guardada (HIT, o 304 si el cliente ya la tiene) o None"""
+    guardada = backend.get(clave)
+    if guardada is None:
+        estadisticas.miss()
+        return None
+    estadisticas.hit()
+    content_type, contenido, cabeceras = guardada
+    respuesta = HttpResponse(contenido, content_type=content_type)
+    for nombre, valor in cabeceras:
+        respuesta[nombre] = valor
+    respuesta['X-Cache'] = 'HIT'
+    # Las peticiones condicionales se resuelven con las cabeceras
+    # guardadas, sin tocar la base de datos
+    return get_conditional_response(
+        request,
+        etag=respuesta.get('ETag'),
+        last_modified=parse_http_date_safe(respuesta.get('Last-Modified')),
+        response=respuesta,
+    )
+
+
+def _guardar(backend, clave, respuesta):
+    if respuesta.status_code == 200 and not respuesta.streaming:
+        # El Content-Type de una Response de DRF se define al renderizar
+        if hasattr(respuesta, 'render'):
+            respuesta.render()
+        if respuesta.get('Content-Type', '').startswith(TIPOS_GUARDADOS):
+            cabeceras = [
+                (nombre, respuesta[nombre])
+                for nombre in CABECERAS_GUARDADAS if respuesta.has_header(nombre)
+            ]
+            backend.set(
+                clave, (respuesta['Content-Type'], respuesta.content, cabeceras),
+                _timeout(backend),
+            )
+    respuesta['X-Cache'] = 'MISS'
+    return respuesta
@@ -0,0 +1,249 @@
+"""
+Feed de cambios del catálogo (/api/productos/cambios/).
+
+HubCambios guarda por proceso una foto compacta de productos y categorías.
+Cuando el catálogo cambia, la compara contra la base y publica los deltas
+(alta/modificación o baja de cada fila) en un buffer circular. Los
+clientes reciben sólo esos deltas: por Server-Sent Events o con
+?since=<version>. Reanudan desde el Last-Event-ID o la última versión
+que vieron.
+
+Los signals de api.signals avisan de las escrituras del propio proceso.
+Las de otros workers se detectan comparando, cada `intervalo` segundos, la
+consulta agregada de conditional.estado_productos. Así también se ven las
+escrituras masivas con update() (reservas de stock, importación), que no
+traen los valores nuevos en el signal.
+
+Las versiones (ids de los eventos) son microsegundos de reloj tomados
+antes de las consultas que detectaron el cambio: lo confirmado antes de
+una versión ya está en la foto, y lo que se confirme después recibe en
+cualquier worker una versión mayor. Así un cliente puede reanudar en otro
+worker. Lo que ya recibió puede volver a llegar con otro id, pero los
+eventos son idempotentes. Si la versión pedida es más vieja que el buffer,
+o más nueva que la de este proceso (la dio otro worker que ya vio cambios
+que éste todavía no), se manda el catálogo completo.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+
+from .conditional import estado_productos
+from .models import Categoria, Producto
+from .serializers import productos_values, representador
+
+logger = logging.getLogger('api')
+
+CAMPOS_PRODUCTO = ('id', 'nombre', 'categoria', 'precio', 'stock', 'disponible')
+CAMPOS_CATEGORIA = ('id', 'nombre', 'descripcion')
+_representar_producto = representador(CAMPOS_PRODUCTO)
+
+
+def _json(datos):
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':'))
+
+
+class Evento:
+    """Un delta publicado; el JSON se codifica una vez para todos los clientes"""
+    __slots__ = ('id', 'datos', 'json')
+
+    def __init__(self, id, tipo, accion, datos):
+        self.id = id
+        self.datos = {'tipo': tipo, 'accion': accion, 'datos': datos}
+        self.json = _json(self.datos)
+
+    def sse(self):
+        return 'id: %d\nevent: cambio\ndata: %s\n\n' % (self.id, self.json)
+
+
+class HubCambios:
+
+    def __init__(self, capacidad=1000, intervalo=1.0, margen=5.0):
+        self.intervalo = intervalo
+        # Filas modificadas hasta `margen` segundos antes de la última vista:
+        # cubre transacciones que confirmaron tarde con un updated_at anterior
+        self.margen = timedelta(seconds=margen)
+        self._eventos = deque(maxlen=capacidad)
+        self._productos = None
+        self._categorias = None
+        self._estado = None
+        self._marca = None
+        self._version = 0
+        # Versiones anteriores a esta no se pueden reconstruir con el buffer
+        self._base = 0
+        self._proximo_sondeo = 0.0
+        self._lock = threading.Lock()
+        self._lock_eventos = threading.Lock()
+        self._suscriptores = {}
+
+    def version(self):
+        return self._version
+
+    def _nuevas_versiones(self, momento, cantidad=1):
+        """
+        Primera de `cantidad` versiones seguidas que terminan en `momento`
+        (antes de consultar la base), siempre posteriores a la actual
+        """
+        primera = max(self._version + 1, momento - cantidad + 1)
+        self._version = primera + cantidad - 1
+        return primera
+
+    # Detección de cambios
+
+    def toca_sondear(self):
+        return time.monotonic() >= self._proximo_sondeo
+
+    def sondear(self):
+        """Compara con la base, a lo sumo una vez por intervalo (salvo invalidar())"""
+        if not self.toca_sondear():
+            return
+        with self._lock:
+            if time.monotonic() < self._proximo_sondeo:
+                return
+            self._proximo_sondeo = time.monotonic() + self.intervalo
+            momento = time.time_ns() // 1000
+            estado = estado_productos(None)
+            if self._productos is None:
+                self._cargar(estado, momento)
+                return
+            if estado == self._estado:
+                return
+            eventos = self._diferencias(estado)
+            self._estado = estado
+            self._marca = self._marca_de(estado)
+            self._publicar(eventos, momento)
+
+    def invalidar(self):
+        """Una escritura de este proceso: sondear enseguida y despertar a los clientes"""
+        self._proximo_sondeo = 0.0
+        self._avisar()
+
+    def _marca_de(self, estado):
+        fechas = [estado['categorias_modificadas'], estado['productos_modificados']]
+        fechas = [fecha for fecha in fechas if fecha is not None]
+        return max(fechas) if fechas else None
+
+    def _cargar(self, estado, momento):
+        inicio = time.perf_counter()
+        self._categorias = {
+            fila['id']: fila for fila in Categoria.objects.values(*CAMPOS_CATEGORIA)
+        }
+        self._productos = {}
+        for fila in productos_values(Producto.objects.all(), campos=CAMPOS_PRODUCTO):
+            datos = _representar_producto(fila)
+            self._productos[datos['id']] = datos
+        self._estado = estado
+        self._marca = self._marca_de(estado)
+        with self._lock_eventos:
+            self._base = self._nuevas_versiones(momento)
+        logger.info(
+            "Feed de cambios: foto de %d productos en %.1f ms",
+            len(self._productos), (time.perf_counter() - inicio) * 1000,
+        )
+
+    def _diferencias(self, estado):
+        """Deltas entre la foto y la base; la foto queda actualizada"""
+        desde = self._marca - self.margen if self._marca is not None else None
+        eventos = []
+
+        categorias = Categoria.objects.all()
+        if desde is not None:
+            categorias = categorias.filter(updated_at__gte=desde)
+        renombradas = []
+        for fila in categorias.values(*CAMPOS_CATEGORIA):
+            anterior = self._categorias.get(fila['id'])
+            if anterior != fila:
+                self._categorias[fila['id']] = fila
+                eventos.append(('categoria', 'upsert', fila))
+                if anterior is not None and anterior['nombre'] != fila['nombre']:
+                    renombradas.append(fila['id'])
+
+        # Los productos de una categoría renombrada cambian aunque su fila no
+        productos = Producto.objects.all()
+        if desde is not None:
+            productos = productos.filter(Q(updated_at__gte=desde) | Q(categoria_id__in=renombradas))
+        for fila in productos_values(productos, campos=CAMPOS_PRODUCTO):
+            datos = _representar_producto(fila)
+            if self._productos.get(datos['id']) != datos:
+                self._productos[datos['id']] = datos
+                eventos.append(('producto', 'upsert', datos))
+
+        # Con las altas ya en la foto, si sobran filas es que hubo bajas
+        if len(self._productos) != estado['total_productos']:
+            eventos.extend(self._bajas('producto', self._productos, Producto))
+        if len(self._categorias) != estado['total_categorias']:
+            eventos.extend(self._bajas('categoria', self._categorias, Categoria))
+        return eventos
+
+    def _bajas(self, tipo, foto, modelo):
+        borrados = foto.keys() - set(modelo.objects.values_list('id', flat=True))
+        for pk in sorted(borrados):
+            del foto[pk]
+            yield tipo, 'delete', {'id': pk}
+
+    # Publicación y lectura
+
+    def _publicar(self, eventos, momento):
+        if not eventos:
+            return
+        with self._lock_eventos:
+            primera = self._nuevas_versiones(momento, len(eventos))
+            for version, (tipo, accion, datos) in enumerate(eventos, start=primera):
+                if len(self._eventos) == self._eventos.maxlen:
+                    # El que sale del buffer ya no se puede reenviar
+                    self._base = self._eventos[0].id
+                self._eventos.append(Evento(version, tipo, accion, datos))
+        self._avisar()
+
+    def desde(self, version):
+        """
+        Eventos posteriores a `version`, o None si el buffer no llega tan atrás
+        o si la versión es posterior a la de este proceso
+        """
+        with self._lock_eventos:
+            if self._productos is None or not self._base <= version <= self._version:
+                return None
+            return [evento for evento in self._eventos if evento.id > version]
+
+    def completo(self):
+        """(versión, catálogo completo) para clientes sin versión o que quedaron atrás"""
+        with self._lock:
+            return self._version, {
+                'categorias': list(self._categorias.values()),
+                'productos': list(self._productos.values()),
+            }
+
+    # Clientes SSE esperando eventos (un asyncio.Event por conexión)
+
+    def suscribir(self):
+        evento = asyncio.Event()
+        self._suscriptores[evento] = asyncio.get_running_loop()
+        return evento
+
+    def desuscribir(self, evento):
+        self._suscriptores.pop(evento, None)
+
+    def _avisar(self):
+        for evento, loop in list(self._suscriptores.items()):
+            try:
+                loop.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                # Loop cerrado: la conexión ya no existe
+                self._suscriptores.pop(evento, None)
+
+
+def _config():
+    return getattr(settings, 'CAMBIOS', {})
+
+
+hub = HubCambios(
+    capacidad=_config().get('BUFFER', 1000),
+    intervalo=_config().get('INTERVALO', 1.0),
+    margen=_config().get('MARGEN', 5.0),
+)
@@ -0,0 +1,53 @@
+"""
+System checks de la configuración de la API (corren con check, migrate y
+runserver; entrypoint.sh migra antes de levantar gunicorn, así que un error
+acá frena el arranque).
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Backends de Django que guardan en la memoria de cada proceso
+CACHES_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_compartido(alias):
+    """Si CACHES[alias] lo ven todos los workers (Redis, Memcached, base, archivo)"""
+    config = settings.CACHES.get(alias)
+    return config is not None and config['BACKEND'] not in CACHES_LOCALES
+
+
+@register()
+def revisar_cache_catalogo(app_configs, **kwargs):
+    config = getattr(settings, 'CATALOGO_CACHE', {})
+    if getattr(settings, 'WORKERS', 1) <= 1 or config.get('BACKEND', 'lru') == 'off':
+        return []
+    alias = config.get('ALIAS', 'default')
+    if cache_compartido(alias):
+        return []
+    return [Error(
+        'La cache del catálogo está activa con %d workers y sus versiones en un '
+        'cache local (CACHES[%r]): una escritura sólo invalida en el worker que '
+        'la hizo.' % (settings.WORKERS, alias),
+        hint='Configurar CACHE_URL (Redis o Memcached) o CATALOGO_CACHE_BACKEND=off.',
+        id='api.E001',
+    )]
+
+
+@register()
+def revisar_cache_replicas(app_configs, **kwargs):
+    config = getattr(settings, 'REPLICAS', {})
+    if getattr(settings, 'WORKERS', 1) <= 1 or not config.get('ALIAS'):
+        return []
+    alias = config.get('CACHE_ALIAS', 'default')
+    if cache_compartido(alias):
+        return []
+    return [Error(
+        'Hay réplicas (DB_REPLICAS) con %d workers y la ventana sticky de '
+        'ReplicasMiddleware en un cache local (CACHES[%r]): después de escribir, '
+        'los otros workers leen de la réplica y el cliente no ve su cambio.' % (settings.WORKERS, alias),
+        hint='Configurar CACHE_URL (Redis o Memcached).',
+        id='api.E002',
+    )]
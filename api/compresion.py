@@ -0,0 +1,113 @@
+"""
+Compresión de respuestas de la API con gzip o, si está instalado, brotli
+(ver CompresionMiddleware en api/middleware.py).
+
+Las respuestas con ETag (los GETs del catálogo) guardan el cuerpo
+comprimido en memoria por ETag y codificación. Cada versión del menú se
+comprime una sola vez por worker y después se sirven esos bytes. Así se
+puede usar un nivel de compresión más alto que en las respuestas que se
+comprimen en cada request.
+"""
+import gzip
+
+from django.conf import settings
+
+from .cache import Estadisticas, LRUCache
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli sólo se ofrece gzip
+    brotli = None
+
+# Sólo respuestas de datos: el HTML (browsable API, admin) lleva el token
+# CSRF y comprimirlo lo expone a BREACH
+TIPOS_COMPRIMIBLES = (
+    'application/json',
+    'application/vnd.comidaalpaso.',
+    'application/msgpack',
+    'application/x-ndjson',
+    'text/plain',
+    'text/csv',
+)
+
+
+def _config():
+    return getattr(settings, 'COMPRESION', {})
+
+
+def codificaciones():
+    """Codificaciones que ofrece el servidor, de la preferida a la menos"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negociar(accept_encoding):
+    """La codificación de Accept-Encoding con mayor q entre las disponibles, o None"""
+    pesos = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        peso = 1.0
+        parametros = parametros.strip()
+        if parametros.startswith('q='):
+            try:
+                peso = float(parametros[2:])
+            except ValueError:
+                continue
+        pesos[nombre.strip().lower()] = peso
+    comodin = pesos.get('*', 0.0)
+    mejor = None
+    mejor_peso = 0.0
+    for codificacion in codificaciones():
+        peso = pesos.get(codificacion, comodin)
+        if peso > mejor_peso:
+            mejor, mejor_peso = codificacion, peso
+    return mejor
+
+
+def comprimible(content_type):
+    return content_type.startswith(TIPOS_COMPRIMIBLES)
+
+
+def comprimir(contenido, codificacion, nivel=None):
+    config = _config()
+    if codificacion == 'br':
+        return brotli.compress(contenido, quality=nivel or config.get('NIVEL_BROTLI', 5))
+    # mtime=0: mismos bytes para el mismo contenido
+    return gzip.compress(contenido, compresslevel=nivel or config.get('NIVEL_GZIP', 6), mtime=0)
+
+
+_cuerpos = None
+estadisticas = Estadisticas()
+
+
+def _cache():
+    global _cuerpos
+    if _cuerpos is None:
+        _cuerpos = LRUCache(max_entries=_config().get('CACHE_ENTRADAS', 64))
+    return _cuerpos
+
+
+def comprimir_respuesta(contenido, codificacion, etag=None):
+    """Cuerpo comprimido; con ETag se reutiliza el de la misma versión"""
+    if etag is None:
+        return comprimir(contenido, codificacion)
+    cuerpos = _cache()
+    clave = (etag, codificacion, len(contenido))
+    comprimido = cuerpos.get(clave)
+    if comprimido is not None:
+        estadisticas.hit()
+        return comprimido
+    estadisticas.miss()
+    config = _config()
+    nivel = config.get('NIVEL_BROTLI_CACHE' if codificacion == 'br' else 'NIVEL_GZIP_CACHE')
+    comprimido = comprimir(contenido, codificacion, nivel)
+    cuerpos.set(clave, comprimido)
+    return comprimido
+
+
+def resumen():
+    """Entradas y hits/misses de los cuerpos comprimidos guardados"""
+    return {
+        'codificaciones': list(codificaciones()),
+        'entradas': len(_cuerpos) if _cuerpos is not None else 0,
+        **estadisticas.as_dict(),
+    }
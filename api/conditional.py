@@ -0,0 +1,115 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+
+from .models import Categoria
+
+
+AGREGADOS_PRODUCTOS = {
+    'total_categorias': Count('id', distinct=True),
+    'categorias_modificadas': Max('updated_at'),
+    'total_productos': Count('productos'),
+    'productos_creados': Max('productos__created_at'),
+    'productos_modificados': Max('productos__updated_at'),
+}
+
+
+def _categorias(categoria_nombre):
+    categorias = Categoria.objects.all()
+    if categoria_nombre is not None:
+        categorias = categorias.por_nombre(categoria_nombre)
+    return categorias
+
+
+def estado_productos(request, categoria_nombre=None, **kwargs):
+    """Cantidad y última modificación de productos y categorías en una sola consulta"""
+    return _categorias(categoria_nombre).aggregate(**AGREGADOS_PRODUCTOS)
+
+
+async def aestado_productos(request, categoria_nombre=None, **kwargs):
+    """Versión async de estado_productos para las vistas ASGI"""
+    return await _categorias(categoria_nombre).aaggregate(**AGREGADOS_PRODUCTOS)
+
+
+def estado_categorias(request, pk=None, **kwargs):
+    """Cantidad y última modificación de las categorías (o de una sola); None si el pk no es válido"""
+    categorias = Categoria.objects.all()
+    if pk is not None:
+        try:
+            categorias = categorias.filter(pk=pk)
+        except (ValueError, TypeError):
+            return None
+    return categorias.aggregate(
+        total_categorias=Count('id'),
+        categorias_modificadas=Max('updated_at'),
+    )
+
+
+def calcular_etag(request, estado):
+    """ETag fuerte: depende del estado de las tablas y de la representación pedida"""
+    base = '%s|%s|%s|%s' % (
+        sorted(estado.items()),
+        request.path,
+        sorted(request.GET.lists()),
+        request.META.get('HTTP_ACCEPT', ''),
+    )
+    return '"%s"' % hashlib.sha1(base.encode('utf-8')).hexdigest()
+
+
+def calcular_last_modified(estado):
+    fechas = [valor for valor in estado.values() if hasattr(valor, 'timestamp')]
+    if not fechas:
+        return None
+    return int(max(fechas).timestamp())
+
+
+def aplicar_cabeceras(respuesta, etag, last_modified):
+    respuesta['ETag'] = etag
+    if last_modified is not None:
+        respuesta['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(respuesta, **getattr(settings, 'CATALOGO_CACHE_CONTROL', {}))
+    patch_vary_headers(respuesta, ('Accept',))
+    return respuesta
+
+
+def condicional(calcular_estado):
+    """
+    Soporte de If-None-Match / If-Modified-Since para GETs del catálogo.
+
+    El estado se obtiene con una consulta agregada antes de llamar a la vista,
+    así un menú sin cambios responde 304 sin serializar nada. Si el estado
+    es None (p. ej. un pk inválido) responde la vista, con su 404. La vista
+    lo recibe en request.estado_catalogo: lo que responda tiene que ser de
+    ese estado (ver api/snapshot.py).
+    """
+    def decorator(vista):
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return vista(request, *args, **kwargs)
+
+            estado = calcular_estado(request, *args, **kwargs)
+            if estado is None:
+                return vista(request, *args, **kwargs)
+            request.estado_catalogo = estado
+            etag = calcular_etag(request, estado)
+            last_modified = calcular_last_modified(estado)
+
+            respuesta = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if respuesta is None:
+                respuesta = vista(request, *args, **kwargs)
+                if respuesta.status_code != 200:
+                    return respuesta
+            return aplicar_cabeceras(respuesta, etag, last_modified)
+        return envoltura
+    return decorator
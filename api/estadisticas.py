@@ -0,0 +1,79 @@
+"""
+Estadísticas del catálogo para el panel del encargado y /api/test/.
+
+Todo sale de una sola consulta agrupada por categoría (LEFT JOIN con los
+productos); los totales se suman en Python sobre esas filas. El resultado
+se guarda unos segundos en memoria con las versiones del catálogo en la
+clave (api.cache): una escritura lo invalida enseguida y los monitores que
+consultan /api/test/ cada pocos segundos no llegan a la base.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from comida_al_paso.db import router
+from .cache import LRUCache, obtener_version
+from .models import Categoria
+
+_resultados = LRUCache(
+    max_entries=4, timeout=getattr(settings, 'ESTADISTICAS', {}).get('TIMEOUT', 5)
+)
+
+
+def _ratio(parte, total):
+    return round(parte / total, 4) if total else None
+
+
+def consulta():
+    """Una fila por categoría con cantidades, stock y valor del stock"""
+    return Categoria.objects.annotate(
+        cantidad=Count('productos'),
+        disponibles=Count('productos', filter=Q(productos__disponible=True)),
+        stock=Coalesce(Sum('productos__stock'), 0),
+        valor_stock=Coalesce(
+            Sum(F('productos__precio') * F('productos__stock')),
+            Decimal('0'),
+            output_field=DecimalField(max_digits=16, decimal_places=2),
+        ),
+    ).order_by('nombre').values('id', 'nombre', 'cantidad', 'disponibles', 'stock', 'valor_stock')
+
+
+def calcular():
+    categorias = []
+    totales = {'categorias': 0, 'productos': 0, 'disponibles': 0, 'stock': 0, 'valor_stock': Decimal('0')}
+    for fila in consulta():
+        # SQLite devuelve la suma de decimales como float
+        valor = Decimal(str(fila['valor_stock'])).quantize(Decimal('0.01'))
+        categorias.append({
+            'id': fila['id'],
+            'categoria': fila['nombre'],
+            'productos': fila['cantidad'],
+            'disponibles': fila['disponibles'],
+            'ratio_disponibles': _ratio(fila['disponibles'], fila['cantidad']),
+            'stock': fila['stock'],
+            'valor_stock': str(valor),
+        })
+        totales['categorias'] += 1
+        totales['productos'] += fila['cantidad']
+        totales['disponibles'] += fila['disponibles']
+        totales['stock'] += fila['stock']
+        totales['valor_stock'] += valor
+
+    totales['ratio_disponibles'] = _ratio(totales['disponibles'], totales['productos'])
+    totales['valor_stock'] = str(totales['valor_stock'])
+    return {'categorias': categorias, 'totales': totales, 'generado': timezone.now()}
+
+
+def obtener():
+    """Las estadísticas de la versión actual del catálogo (cacheadas unos segundos)"""
+    clave = '%s:%s:%s' % (
+        obtener_version('producto'), obtener_version('categoria'), router.origen_lecturas()
+    )
+    resultado = _resultados.get(clave)
+    if resultado is None:
+        resultado = calcular()
+        _resultados.set(clave, resultado)
+    return resultado
@@ -0,0 +1,130 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Value
+from django.db.models.functions import Lower
+from rest_framework.exceptions import ValidationError
+
+from .serializers import CAMPOS_PRODUCTO
+
+# ?ordering= acepta estos campos (con '-' para orden descendente)
+ORDENES_PRODUCTO = ('nombre', 'precio', 'stock', 'created_at')
+
+VERDADEROS = ('1', 'true', 'si', 'sí')
+FALSOS = ('0', 'false', 'no')
+
+# Rango de la columna stock (IntegerField: INT en MySQL); fuera de él la
+# base no puede comparar el valor
+STOCK_MIN, STOCK_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+class FiltroProductos:
+    """
+    Traduce los query params del listado de productos a un queryset.
+
+    Todos los filtros se resuelven en SQL: precio_min/precio_max (usa el
+    índice sobre precio), disponible, stock_gt y categoria__in (nombres
+    separados por coma, sin distinguir mayúsculas). ?ordering= admite los
+    campos de ORDENES_PRODUCTO y ?fields= elige qué campos devolver, lo que
+    también achica el SELECT.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.errores = {}
+        self.filtros = self._leer_filtros()
+        self.orden = self._leer_orden()
+        self.campos = self._leer_campos()
+        if self.errores:
+            raise ValidationError(self.errores)
+
+    def filtrar(self, queryset):
+        queryset = queryset.filter(**self.filtros)
+        if self.orden:
+            queryset = queryset.order_by(*self.orden)
+        return queryset
+
+    def _leer_filtros(self):
+        filtros = {}
+        for param, lookup in (('precio_min', 'precio__gte'), ('precio_max', 'precio__lte')):
+            valor = self._valor(param)
+            if valor is None:
+                continue
+            try:
+                numero = Decimal(valor)
+            except InvalidOperation:
+                numero = None
+            # NaN e Infinity no se pueden comparar contra la columna
+            if numero is None or not numero.is_finite():
+                self.errores[param] = ['Debe ser un número']
+            else:
+                filtros[lookup] = numero
+
+        valor = self._valor('disponible')
+        if valor is not None:
+            if valor.lower() in VERDADEROS:
+                filtros['disponible'] = True
+            elif valor.lower() in FALSOS:
+                filtros['disponible'] = False
+            else:
+                self.errores['disponible'] = ['Debe ser true o false']
+
+        valor = self._valor('stock_gt')
+        if valor is not None:
+            try:
+                numero = int(valor)
+            except ValueError:
+                self.errores['stock_gt'] = ['Debe ser un entero']
+            else:
+                if STOCK_MIN <= numero <= STOCK_MAX:
+                    filtros['stock__gt'] = numero
+                else:
+                    self.errores['stock_gt'] = [
+                        'Debe estar entre %d y %d' % (STOCK_MIN, STOCK_MAX)
+                    ]
+
+        nombres = self._lista('categoria__in')
+        if nombres:
+            # Compara contra el índice sobre LOWER(nombre), igual que por_nombre():
+            # los dos lados los pasa a minúsculas la base (str.lower() de Python
+            # no coincide con LOWER() de MySQL/SQLite en todos los caracteres)
+            filtros['categoria__nombre__lower__in'] = [Lower(Value(nombre)) for nombre in nombres]
+        return filtros
+
+    def _leer_orden(self):
+        orden = self._lista('ordering')
+        if not orden:
+            return None
+        invalidos = [campo for campo in orden if campo.lstrip('-') not in ORDENES_PRODUCTO]
+        if invalidos:
+            self.errores['ordering'] = [
+                'Campos no permitidos: %s. Opciones: %s' % (
+                    ', '.join(invalidos), ', '.join(ORDENES_PRODUCTO)
+                )
+            ]
+            return None
+        # id desempata para que el orden sea estable entre páginas y requests
+        return orden + ['id']
+
+    def _leer_campos(self):
+        campos = self._lista('fields')
+        if not campos:
+            return None
+        invalidos = [campo for campo in campos if campo not in CAMPOS_PRODUCTO]
+        if invalidos:
+            self.errores['fields'] = [
+                'Campos no permitidos: %s. Opciones: %s' % (
+                    ', '.join(invalidos), ', '.join(CAMPOS_PRODUCTO)
+                )
+            ]
+            return None
+        return tuple(dict.fromkeys(campos))
+
+    def _valor(self, param):
+        valor = self.params.get(param, '').strip()
+        return valor or None
+
+    def _lista(self, param):
+        valor = self._valor(param)
+        if valor is None:
+            return []
+        return [item.strip() for item in valor.split(',') if item.strip()]
@@ -0,0 +1,238 @@
+import codecs
+import csv
+import json
+import logging
+from itertools import islice
+from math import ceil
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+
+from .models import Categoria, Producto
+from .serializers import ProductoCreateSerializer
+from .signals import catalogo_modificado
+
+logger = logging.getLogger('api')
+
+FORMATOS = ('json', 'csv', 'ndjson')
+
+# Límites de /api/productos/bulk/: con ellos las consultas por request tienen
+# un techo fijo (CONSULTAS_MAXIMAS, el query_budget de la vista). Archivos más
+# grandes van por manage.py import_menu, que no tiene límite.
+MAX_FILAS = 5000
+CHUNK_MIN = 100
+CHUNK_MAX = 1000
+# Filas por INSERT que bulk_create hace como mínimo: SQLite admite 999
+# parámetros y Producto tiene 8 columnas (124 filas); MySQL, más
+FILAS_POR_INSERT = 100
+# BEGIN (o SAVEPOINT) del atomic() externo y, por lote, SAVEPOINT,
+# categorías, UPDATE de agotados y RELEASE, más los INSERT
+LOTES_MAXIMOS = ceil(MAX_FILAS / CHUNK_MIN)
+CONSULTAS_MAXIMAS = 2 + 4 * LOTES_MAXIMOS + LOTES_MAXIMOS + ceil(MAX_FILAS / FILAS_POR_INSERT)
+
+
+class FormatoInvalido(ValueError):
+    pass
+
+
+class DemasiadasFilas(FormatoInvalido):
+    pass
+
+
+def buscar_categorias(nombres):
+    """
+    {nombre pedido: Categoria} con una consulta, comparando como
+    categoria_nombre_lower_unico (Categoria.objects.por_nombres).
+
+    LOWER() de SQLite sólo pasa a minúsculas ASCII: 'ÑOQUIS' y 'ñoquis'
+    pueden ser dos categorías. Si más de una coincide con un nombre se usa
+    la que se llama exactamente así; si ninguna, el nombre queda sin
+    categoría antes que elegir una al azar.
+    """
+    encontradas = list(Categoria.objects.por_nombres(nombres)) if nombres else []
+    categorias = {}
+    for nombre in nombres:
+        candidatas = [c for c in encontradas if c.nombre.lower() == nombre.lower()]
+        exactas = [c for c in candidatas if c.nombre == nombre]
+        if exactas:
+            categorias[nombre] = exactas[0]
+        elif len(candidatas) == 1:
+            categorias[nombre] = candidatas[0]
+    return categorias
+
+
+def detectar_formato(nombre):
+    """Formato a partir de un Content-Type o de la extensión de un archivo"""
+    nombre = (nombre or '').lower()
+    if 'csv' in nombre:
+        return 'csv'
+    if 'ndjson' in nombre or 'jsonl' in nombre:
+        return 'ndjson'
+    return 'json'
+
+
+def decodificar(lineas):
+    """
+    Líneas en bytes → texto UTF-8. Descarta el BOM que agregan Excel y el
+    Bloc de notas al principio del archivo (si no, el nombre de la primera
+    columna del CSV arranca con U+FEFF); bytes que no son UTF-8 son FormatoInvalido.
+    """
+    decodificador = codecs.getincrementaldecoder('utf-8-sig')()
+    for numero, linea in enumerate(lineas, start=1):
+        try:
+            texto = decodificador.decode(linea)
+        except UnicodeDecodeError:
+            raise FormatoInvalido('El archivo no está en UTF-8 (línea %d)' % numero)
+        yield texto
+    try:
+        resto = decodificador.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise FormatoInvalido('El archivo no está en UTF-8 (termina a mitad de un carácter)')
+    if resto:
+        yield resto
+
+
+def leer_filas(lineas, formato):
+    """
+    Convierte un iterable de líneas de texto en filas (dicts).
+
+    CSV y NDJSON se procesan línea por línea; un array JSON se lee completo.
+    """
+    if formato == 'csv':
+        yield from csv.DictReader(lineas)
+    elif formato == 'ndjson':
+        for numero, linea in enumerate(lineas, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except ValueError:
+                raise FormatoInvalido('JSON inválido en la línea %d' % numero)
+    elif formato == 'json':
+        try:
+            filas = json.loads(''.join(lineas))
+        except ValueError:
+            raise FormatoInvalido('JSON inválido')
+        if not isinstance(filas, list):
+            raise FormatoInvalido('Se esperaba un array de productos')
+        yield from filas
+    else:
+        raise FormatoInvalido('Formato no soportado: %s' % formato)
+
+
+class ImportadorProductos:
+    """
+    Alta/actualización masiva de productos.
+
+    Las filas se validan con ProductoCreateSerializer por lotes de
+    chunk_size; las categorías de cada lote se buscan con una consulta
+    (Categoria.objects.por_nombres) y el lote se escribe con un
+    bulk_create(update_conflicts=True) sobre la clave (categoria, nombre).
+    Una fila inválida se informa sin frenar al resto.
+
+    El archivo manda sobre el stock. Un producto importado con stock 0 queda
+    agotado, igual que al reservar (stock.descontar); reponer stock no
+    vuelve a poner a la venta uno que se dio de baja: eso lo decide el admin.
+    """
+
+    def __init__(self, chunk_size=500, max_filas=None):
+        self.chunk_size = chunk_size
+        self.max_filas = max_filas
+        self.procesados = 0
+        self.importados = 0
+        self.errores = []
+
+    def importar(self, filas):
+        filas = enumerate(filas, start=1)
+
+        with transaction.atomic():
+            while True:
+                lote = list(islice(filas, self.chunk_size))
+                if not lote:
+                    break
+                if self.max_filas is not None and self.procesados + len(lote) > self.max_filas:
+                    # Dentro del atomic(): no queda escrito ningún lote
+                    raise DemasiadasFilas('Se aceptan hasta %d filas por request' % self.max_filas)
+                productos = self._validar(lote)
+                self._guardar(productos)
+
+        if self.importados:
+            catalogo_modificado.send(sender=Producto)
+        logger.info(
+            "Importación de productos: %d procesados, %d importados, %d errores",
+            self.procesados, self.importados, len(self.errores),
+        )
+        return self.resultado()
+
+    def resultado(self):
+        return {
+            'procesados': self.procesados,
+            'importados': self.importados,
+            'errores': self.errores,
+        }
+
+    def _validar(self, lote):
+        validas = []
+        for numero, fila in lote:
+            self.procesados += 1
+            if not isinstance(fila, dict):
+                self.errores.append({'fila': numero, 'errores': 'Se esperaba un objeto'})
+                continue
+
+            serializer = ProductoCreateSerializer(data=fila)
+            if not serializer.is_valid():
+                self.errores.append({'fila': numero, 'errores': serializer.errors})
+                continue
+            validas.append((numero, serializer.validated_data))
+
+        categorias = buscar_categorias({datos['nombre_categoria'] for _, datos in validas})
+        # Si un producto aparece dos veces en el lote gana la última fila
+        productos = {}
+        for numero, datos in validas:
+            categoria = categorias.get(datos['nombre_categoria'])
+            if categoria is None:
+                self.errores.append({
+                    'fila': numero,
+                    'errores': {'nombre_categoria': ['Categoría no encontrada']},
+                })
+                continue
+
+            producto = Producto(
+                nombre=datos['nombre_producto'],
+                categoria=categoria,
+                precio=datos['precio'],
+                stock=datos.get('stock', 0),
+            )
+            # Sólo para las filas nuevas: en las existentes no está en update_fields
+            producto.disponible = producto.stock > 0
+            productos[(categoria.pk, producto.nombre)] = (numero, producto)
+        return list(productos.values())
+
+    def _guardar(self, productos):
+        if not productos:
+            return
+        opciones = {
+            'update_conflicts': True,
+            'update_fields': ['precio', 'stock', 'updated_at'],
+        }
+        # MySQL resuelve el conflicto con cualquier índice único y no acepta unique_fields
+        if connection.features.supports_update_conflicts_with_target:
+            opciones['unique_fields'] = ['categoria', 'nombre']
+
+        agotados = Q()
+        for _, producto in productos:
+            if producto.stock == 0:
+                agotados |= Q(categoria=producto.categoria, nombre=producto.nombre)
+
+        try:
+            with transaction.atomic():
+                Producto.objects.bulk_create([p for _, p in productos], **opciones)
+                if agotados:
+                    Producto.objects.filter(agotados, disponible=True).update(disponible=False)
+        except DatabaseError as e:
+            logger.error("Error al importar lote de productos: %s", e)
+            for numero, _ in productos:
+                self.errores.append({'fila': numero, 'errores': str(e)})
+            return
+        self.importados += len(productos)
@@ -0,0 +1,511 @@
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from urllib.parse import quote
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+USUARIO = ('benchmark', 'benchmark-clave')
+
+ESCENARIOS = {
+    'productos_list': 'GET /api/productos/ (catálogo completo)',
+    'productos_pagina': 'GET /api/productos/?page_size=50',
+    'productos_por_categoria': 'GET /api/productos/<categoria>/',
+    'categorias_list': 'GET /api/categorias/',
+    'categoria_detalle': 'GET /api/categorias/<id>/',
+    'producto_alta': 'POST /api/productos/ (JWT)',
+    'token': 'POST /api/token/',
+}
+
+# Consultas por request según la cabecera Server-Timing de MetricasMiddleware
+CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+def armar_request(escenario, azar, categorias, token, numero):
+    """(método, ruta, cuerpo, cabeceras) del request `numero` de un escenario"""
+    id_categoria, nombre_categoria = azar.choice(categorias)
+    if escenario == 'productos_list':
+        return 'GET', '/api/productos/', None, {}
+    if escenario == 'productos_pagina':
+        return 'GET', '/api/productos/?page_size=50', None, {}
+    if escenario == 'productos_por_categoria':
+        return 'GET', '/api/productos/%s/' % quote(nombre_categoria), None, {}
+    if escenario == 'categorias_list':
+        return 'GET', '/api/categorias/', None, {}
+    if escenario == 'categoria_detalle':
+        return 'GET', '/api/categorias/%d/' % id_categoria, None, {}
+    if escenario == 'producto_alta':
+        return 'POST', '/api/productos/', {
+            'nombre_producto': 'Alta %d-%d' % (os.getpid(), numero),
+            'nombre_categoria': nombre_categoria,
+            'precio': '%d.50' % azar.randint(100, 5000),
+            'stock': azar.randint(0, 100),
+        }, {'Authorization': 'Bearer %s' % token}
+    if escenario == 'token':
+        return 'POST', '/api/token/', {'username': USUARIO[0], 'password': USUARIO[1]}, {}
+    raise CommandError('Escenario desconocido: %s' % escenario)
+
+
+def resumir(muestras, errores, duracion):
+    """Percentiles, throughput y promedios de [(segundos, consultas, bytes)]"""
+    tiempos = sorted(segundos for segundos, _, _ in muestras)
+    consultas = [c for _, c, _ in muestras if c is not None]
+
+    def percentil(q):
+        return round(tiempos[min(len(tiempos) - 1, int(len(tiempos) * q))] * 1000, 3)
+
+    return {
+        'requests': len(tiempos),
+        'errores': errores,
+        'rps': round(len(tiempos) / duracion, 2) if duracion else None,
+        'media_ms': round(statistics.fmean(tiempos) * 1000, 3),
+        'p50_ms': percentil(0.50),
+        'p95_ms': percentil(0.95),
+        'p99_ms': percentil(0.99),
+        'consultas': round(statistics.fmean(consultas), 2) if consultas else None,
+        'bytes': round(statistics.fmean(b for _, _, b in muestras)),
+    }
+
+
+def consultas_de(server_timing):
+    encontrado = CONSULTAS.search(server_timing or '')
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def rss_pico_kb(pid):
+    """Pico de memoria residente (VmHWM) de un proceso y sus hijos, en KB (Linux)"""
+    pico = None
+    pendientes = [pid]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with open('/proc/%d/status' % actual) as estado:
+                for linea in estado:
+                    if linea.startswith('VmHWM:'):
+                        pico = max(pico or 0, int(linea.split()[1]))
+            with open('/proc/%d/task/%d/children' % (actual, actual)) as hijos:
+                pendientes.extend(int(hijo) for hijo in hijos.read().split())
+        except OSError:
+            continue
+    return pico
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark reproducible de la API sobre un catálogo sintético en '
+        'SQLite: throughput, p50/p95/p99, consultas por request y pico de '
+        'RSS por escenario, con el test client o con gunicorn. Guarda el '
+        'resultado en JSON y lo compara con una línea base'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=1000)
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--escenarios', default=','.join(ESCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help='Requests medidos por escenario')
+        parser.add_argument('--calentamiento', type=int, default=10, help='Requests previos sin medir')
+        parser.add_argument('--modo', choices=('cliente', 'gunicorn'), default='cliente')
+        parser.add_argument(
+            '--servidor', choices=('wsgi', 'asgi', 'ambos'), default='wsgi',
+            help='ambos: corre WSGI y ASGI con la misma carga y compara req/s y p99',
+        )
+        parser.add_argument('--workers', type=int, default=3, help='Workers de gunicorn')
+        parser.add_argument('--concurrencia', type=int, default=4, help='Clientes en paralelo (gunicorn)')
+        parser.add_argument('--sin-cache', action='store_true', help='CATALOGO_CACHE_BACKEND=off')
+        parser.add_argument(
+            '--directorio', default=os.path.join(tempfile.gettempdir(), 'comida_al_paso_benchmark'),
+            help='Dónde se guardan los catálogos generados para reutilizarlos',
+        )
+        parser.add_argument('--regenerar', action='store_true')
+        parser.add_argument('--salida', help='Archivo JSON para el resultado')
+        parser.add_argument('--comparar', help='Resultado JSON de referencia (línea base)')
+        parser.add_argument(
+            '--resultado', help='Comparar este resultado JSON en lugar de correr el benchmark'
+        )
+        parser.add_argument(
+            '--tolerancia', type=float, default=0.15,
+            help='Empeoramiento relativo de p95, throughput o RSS que cuenta como regresión',
+        )
+        # Uso interno: generación del catálogo y corrida con el test client
+        parser.add_argument('--generar', action='store_true', help='(interno)')
+        parser.add_argument('--worker', action='store_true', help='(interno)')
+
+    def handle(self, *args, **options):
+        if options['generar']:
+            return self._generar(options)
+        if options['worker']:
+            self.stdout.write(json.dumps(self._correr_cliente(options)))
+            return
+
+        if options['servidor'] == 'ambos':
+            return self._comparar_servidores(options)
+
+        if options['resultado']:
+            with open(options['resultado']) as archivo:
+                resultado = json.load(archivo)
+        else:
+            resultado = self._correr(options)
+            self._reportar(resultado)
+            if options['salida']:
+                with open(options['salida'], 'w') as archivo:
+                    json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+                self.stdout.write('Resultado guardado en %s' % options['salida'])
+
+        if options['comparar']:
+            with open(options['comparar']) as archivo:
+                base = json.load(archivo)
+            regresiones = self._comparar(resultado, base, options['tolerancia'])
+            if regresiones:
+                for regresion in regresiones:
+                    self.stdout.write(self.style.ERROR('✗ %s' % regresion))
+                raise CommandError('%d regresiones contra %s' % (len(regresiones), options['comparar']))
+            self.stdout.write(self.style.SUCCESS('✓ Sin regresiones contra %s' % options['comparar']))
+
+    # Preparación
+
+    def _entorno(self, archivo, options):
+        entorno = {
+            **os.environ,
+            'DB_ENGINE': 'django.db.backends.sqlite3',
+            'SQLITE_NAME': archivo,
+            'DB_REPLICAS': '',
+            'THROTTLE_ACTIVO': 'False',
+            'SOBRECARGA': 'False',
+            'MENU_SNAPSHOT': 'False',
+            'METRICAS_LOG': 'False',
+            'LOG_CONSOLA': 'False',
+            # Varios procesos en el mismo logs/django.log: ninguno rota
+            'LOG_ROTACION': 'externa',
+            'LOG_NIVEL_API': 'WARNING',
+            'PYTHONWARNINGS': 'ignore',
+            'SERVER_MODE': options['servidor'],
+        }
+        if options['sin_cache']:
+            entorno['CATALOGO_CACHE_BACKEND'] = 'off'
+        return entorno
+
+    def _manage(self):
+        return [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+
+    def _catalogo(self, options):
+        """Archivo SQLite con el catálogo sintético (se genera una vez por tamaño y semilla)"""
+        os.makedirs(options['directorio'], exist_ok=True)
+        archivo = os.path.join(options['directorio'], 'catalogo_%d_%d_%d.sqlite3' % (
+            options['productos'], options['categorias'], options['semilla']
+        ))
+        if options['regenerar'] or not os.path.exists(archivo):
+            temporal = archivo + '.generando'
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            self.stdout.write('Generando catálogo de %d productos en %d categorías...' % (
+                options['productos'], options['categorias']
+            ))
+            entorno = self._entorno(temporal, options)
+            subprocess.run(self._manage() + ['migrate', '-v', '0'], env=entorno, check=True)
+            subprocess.run(self._manage() + [
+                'benchmark', '--generar', '--productos', str(options['productos']),
+                '--categorias', str(options['categorias']), '--semilla', str(options['semilla']),
+            ], env=entorno, check=True)
+            # Una sola copia en modo rollback journal, sin -wal pendiente
+            conexion = sqlite3.connect(temporal)
+            conexion.execute('PRAGMA journal_mode = DELETE')
+            conexion.close()
+            os.replace(temporal, archivo)
+        return archivo
+
+    def _generar(self, options):
+        from django.contrib.auth.models import User
+        from django.db import transaction
+
+        from api.models import Categoria, Producto
+
+        azar = random.Random(options['semilla'])
+        with transaction.atomic():
+            categorias = Categoria.objects.bulk_create([
+                Categoria(nombre='Categoría %d' % i, descripcion='Categoría sintética %d' % i)
+                for i in range(options['categorias'])
+            ])
+            lote = []
+            for i in range(options['productos']):
+                lote.append(Producto(
+                    nombre='Producto %d' % i,
+                    descripcion='Producto sintético %d' % i,
+                    precio=Decimal(azar.randint(100, 500000)) / 100,
+                    stock=azar.randint(0, 200),
+                    disponible=azar.random() < 0.9,
+                    categoria=categorias[azar.randrange(len(categorias))],
+                ))
+                if len(lote) == 5000:
+                    Producto.objects.bulk_create(lote)
+                    lote = []
+            Producto.objects.bulk_create(lote)
+            User.objects.create_user(USUARIO[0], password=USUARIO[1])
+
+    # Corridas
+
+    def _correr(self, options):
+        escenarios = options['escenarios'].split(',')
+        for escenario in escenarios:
+            if escenario not in ESCENARIOS:
+                raise CommandError('Escenario desconocido: %s (hay %s)' % (escenario, ', '.join(ESCENARIOS)))
+
+        catalogo = self._catalogo(options)
+        with tempfile.TemporaryDirectory() as directorio:
+            # Cada corrida arranca del mismo catálogo: las altas no se acumulan
+            copia = os.path.join(directorio, 'benchmark.sqlite3')
+            shutil.copyfile(catalogo, copia)
+            entorno = self._entorno(copia, options)
+            if options['modo'] == 'gunicorn':
+                medido = self._correr_gunicorn(entorno, escenarios, options)
+            else:
+                comando = self._manage() + ['benchmark', '--worker'] + [
+                    '--%s=%s' % (opcion, options[opcion])
+                    for opcion in ('productos', 'categorias', 'semilla', 'escenarios', 'requests', 'calentamiento')
+                ]
+                salida = subprocess.run(comando, env=entorno, stdout=subprocess.PIPE, check=True)
+                medido = json.loads(salida.stdout.decode().strip().splitlines()[-1])
+
+        return {
+            'meta': {
+                'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': self._commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'plataforma': platform.platform(),
+                'cpus': os.cpu_count(),
+                **{clave: options[clave] for clave in (
+                    'productos', 'categorias', 'semilla', 'modo', 'servidor', 'requests',
+                    'calentamiento', 'sin_cache',
+                )},
+                **({'workers': options['workers'], 'concurrencia': options['concurrencia']}
+                   if options['modo'] == 'gunicorn' else {}),
+            },
+            **medido,
+        }
+
+    def _categorias(self):
+        from api.models import Categoria
+        return list(Categoria.objects.order_by('id').values_list('id', 'nombre'))
+
+    def _correr_cliente(self, options):
+        """Corre en el proceso worker, con SQLITE_NAME apuntando a la copia del catálogo"""
+        from django.test import Client
+
+        azar = random.Random(options['semilla'])
+        categorias = self._categorias()
+        cliente = Client()
+        token = cliente.post(
+            '/api/token/', {'username': USUARIO[0], 'password': USUARIO[1]}, content_type='application/json'
+        ).json()['access']
+
+        resultados = {}
+        for escenario in options['escenarios'].split(','):
+            muestras = []
+            errores = 0
+            inicio_escenario = None
+            for numero in range(options['calentamiento'] + options['requests']):
+                if numero == options['calentamiento']:
+                    inicio_escenario = time.perf_counter()
+                metodo, ruta, cuerpo, cabeceras = armar_request(escenario, azar, categorias, token, numero)
+                inicio = time.perf_counter()
+                respuesta = cliente.generic(
+                    metodo, ruta, json.dumps(cuerpo) if cuerpo else '',
+                    content_type='application/json', headers=cabeceras,
+                )
+                duracion = time.perf_counter() - inicio
+                if numero < options['calentamiento']:
+                    continue
+                if respuesta.status_code >= 400:
+                    errores += 1
+                muestras.append((duracion, consultas_de(respuesta.get('Server-Timing')), len(respuesta.content)))
+            resultados[escenario] = resumir(muestras, errores, time.perf_counter() - inicio_escenario)
+
+        return {
+            'escenarios': resultados,
+            'rss_pico_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    def _correr_gunicorn(self, entorno, escenarios, options):
+        with socket.socket() as libre:
+            libre.bind(('127.0.0.1', 0))
+            puerto = libre.getsockname()[1]
+
+        aplicacion = 'comida_al_paso.%s:application' % options['servidor']
+        comando = [
+            sys.executable, '-m', 'gunicorn', aplicacion, '--bind', '127.0.0.1:%d' % puerto,
+            '--workers', str(options['workers']), '--log-level', 'warning',
+        ]
+        if options['servidor'] == 'asgi':
+            comando += ['--worker-class', 'uvicorn_worker.UvicornWorker']
+        servidor = subprocess.Popen(comando, env=entorno, cwd=settings.BASE_DIR)
+        try:
+            self._esperar(puerto, servidor)
+            conexion = sqlite3.connect(entorno['SQLITE_NAME'])
+            categorias = conexion.execute('SELECT id, nombre FROM api_categoria ORDER BY id').fetchall()
+            conexion.close()
+            _, contenido, _ = self._http(puerto, *armar_request('token', random.Random(), categorias, None, 0))
+            token = json.loads(contenido)['access']
+
+            resultados = {}
+            for escenario in escenarios:
+                resultados[escenario] = self._carga_http(puerto, escenario, categorias, token, options)
+            return {'escenarios': resultados, 'rss_pico_kb': rss_pico_kb(servidor.pid)}
+        finally:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+
+    def _esperar(self, puerto, servidor, limite=30):
+        fin = time.monotonic() + limite
+        while time.monotonic() < fin:
+            if servidor.poll() is not None:
+                raise CommandError('gunicorn terminó al arrancar (código %d)' % servidor.returncode)
+            try:
+                if self._http(puerto, 'GET', '/healthz', None, {})[0] == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('gunicorn no respondió /healthz en %ds' % limite)
+
+    def _http(self, puerto, metodo, ruta, cuerpo, cabeceras):
+        conexion = http.client.HTTPConnection('127.0.0.1', puerto, timeout=120)
+        try:
+            conexion.request(
+                metodo, ruta, body=json.dumps(cuerpo) if cuerpo else None,
+                headers={'Content-Type': 'application/json', **cabeceras},
+            )
+            respuesta = conexion.getresponse()
+            return respuesta.status, respuesta.read(), respuesta.getheader('Server-Timing')
+        finally:
+            conexion.close()
+
+    def _carga_http(self, puerto, escenario, categorias, token, options):
+        """`concurrencia` clientes en paralelo hasta completar los requests del escenario"""
+        total = options['calentamiento'] + options['requests']
+        siguiente = iter(range(total))
+        lock = threading.Lock()
+        muestras = []
+        errores = [0]
+        inicio_medicion = [None]
+
+        def cliente(indice):
+            azar = random.Random(options['semilla'] * 1000 + indice)
+            while True:
+                with lock:
+                    numero = next(siguiente, None)
+                    if numero == options['calentamiento']:
+                        inicio_medicion[0] = time.perf_counter()
+                if numero is None:
+                    return
+                request = armar_request(escenario, azar, categorias, token, numero)
+                inicio = time.perf_counter()
+                estado, contenido, server_timing = self._http(puerto, *request)
+                duracion = time.perf_counter() - inicio
+                if numero < options['calentamiento']:
+                    continue
+                with lock:
+                    if estado >= 400:
+                        errores[0] += 1
+                    muestras.append((duracion, consultas_de(server_timing), len(contenido)))
+
+        hilos = [threading.Thread(target=cliente, args=(i,)) for i in range(options['concurrencia'])]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return resumir(muestras, errores[0], time.perf_counter() - (inicio_medicion[0] or time.perf_counter()))
+
+    # Reporte y comparación
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+            ).stdout.decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def _reportar(self, resultado):
+        meta = resultado['meta']
+        self.stdout.write('%d productos, %d categorías, modo %s (%s)' % (
+            meta['productos'], meta['categorias'], meta['modo'], meta['servidor']
+        ))
+        for escenario, datos in resultado['escenarios'].items():
+            self.stdout.write(
+                f'{escenario:>24}: {datos["rps"]:9.1f} req/s  p50 {datos["p50_ms"]:8.2f}  '
+                f'p95 {datos["p95_ms"]:8.2f}  p99 {datos["p99_ms"]:8.2f} ms  '
+                f'consultas {datos["consultas"]}  {datos["bytes"]} bytes'
+                + (f'  errores {datos["errores"]}' if datos['errores'] else '')
+            )
+        self.stdout.write('Pico de RSS: %s KB' % resultado['rss_pico_kb'])
+
+    def _comparar_servidores(self, options):
+        if options['comparar'] or options['resultado']:
+            raise CommandError('--servidor ambos no se compara con una línea base')
+        resultados = {}
+        for servidor in ('wsgi', 'asgi'):
+            resultados[servidor] = self._correr({**options, 'servidor': servidor})
+            self._reportar(resultados[servidor])
+
+        self.stdout.write('ASGI contra WSGI:')
+        for escenario, wsgi in resultados['wsgi']['escenarios'].items():
+            asgi = resultados['asgi']['escenarios'][escenario]
+            self.stdout.write(
+                f'{escenario:>24}: {wsgi["rps"]:9.1f} -> {asgi["rps"]:9.1f} req/s '
+                f'({asgi["rps"] / wsgi["rps"]:5.2f}x)  '
+                f'p99 {wsgi["p99_ms"]:8.2f} -> {asgi["p99_ms"]:8.2f} ms'
+            )
+        if options['salida']:
+            with open(options['salida'], 'w') as archivo:
+                json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write('Resultado guardado en %s' % options['salida'])
+
+    def _comparar(self, actual, base, tolerancia):
+        """Lista de regresiones de `actual` respecto de `base`"""
+        for clave in ('productos', 'categorias', 'modo', 'servidor', 'sin_cache'):
+            if actual['meta'].get(clave) != base['meta'].get(clave):
+                self.stdout.write(self.style.WARNING(
+                    'La línea base usa otro %s (%s, ahora %s): la comparación no es directa' % (
+                        clave, base['meta'].get(clave), actual['meta'].get(clave)
+                    )
+                ))
+
+        regresiones = []
+        for escenario, datos in actual['escenarios'].items():
+            previo = base['escenarios'].get(escenario)
+            if previo is None:
+                continue
+            if datos['p95_ms'] > previo['p95_ms'] * (1 + tolerancia):
+                regresiones.append('%s: p95 %.2f -> %.2f ms' % (escenario, previo['p95_ms'], datos['p95_ms']))
+            if previo['rps'] and datos['rps'] < previo['rps'] * (1 - tolerancia):
+                regresiones.append('%s: %.1f -> %.1f req/s' % (escenario, previo['rps'], datos['rps']))
+            # Las consultas por request no dependen de la máquina: cualquier aumento cuenta
+            if (datos['consultas'] or 0) > (previo['consultas'] or 0):
+                regresiones.append('%s: %s -> %s consultas por request' % (
+                    escenario, previo['consultas'], datos['consultas']
+                ))
+            if datos['errores'] > previo['errores']:
+                regresiones.append('%s: %d -> %d errores' % (escenario, previo['errores'], datos['errores']))
+
+        if actual.get('rss_pico_kb') and base.get('rss_pico_kb'):
+            if actual['rss_pico_kb'] > base['rss_pico_kb'] * (1 + tolerancia):
+                regresiones.append('pico de RSS %d -> %d KB' % (base['rss_pico_kb'], actual['rss_pico_kb']))
+        return regresiones
@@ -0,0 +1,46 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from api.importacion import (
+    FORMATOS, FormatoInvalido, ImportadorProductos, decodificar, detectar_formato, leer_filas,
+)
+
+
+class Command(BaseCommand):
+    help = 'Importa productos desde un archivo JSON, CSV o NDJSON (alta o actualización)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo, o "-" para leer de stdin')
+        parser.add_argument('--formato', choices=FORMATOS, help='Por defecto se deduce de la extensión')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Filas por lote de escritura')
+
+    def handle(self, *args, **options):
+        archivo = options['archivo']
+        formato = options['formato'] or detectar_formato(archivo)
+
+        try:
+            if archivo == '-':
+                resultado = self._importar(sys.stdin.buffer, formato, options['chunk_size'])
+            else:
+                with open(archivo, 'rb') as f:
+                    resultado = self._importar(f, formato, options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f'No se pudo leer {archivo}: {e}')
+        except FormatoInvalido as e:
+            raise CommandError(str(e))
+
+        for error in resultado['errores']:
+            detalle = json.dumps(error['errores'], ensure_ascii=False)
+            self.stdout.write(self.style.WARNING(f"  Fila {error['fila']}: {detalle}"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ {resultado['importados']} productos importados "
+                f"de {resultado['procesados']} filas ({len(resultado['errores'])} con errores)"
+            )
+        )
+
+    def _importar(self, lineas, formato, chunk_size):
+        importador = ImportadorProductos(chunk_size=max(chunk_size, 1))
+        return importador.importar(leer_filas(decodificar(lineas), formato))
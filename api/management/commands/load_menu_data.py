@@ -1,105 +1,250 @@
-from django.core.management.base import BaseCommand
-from api.models import Categoria, Producto
+import hashlib
+import json
+import os
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from api.models import CargaMenu, Categoria, Producto
+from api.signals import catalogo_modificado
+
+CATEGORIAS = [
+    ("Hamburguesas", "Hamburguesas clásicas y gourmet"),
+    ("Pizzas", "Pizzas artesanales con ingredientes frescos"),
+    ("Empanadas", "Empanadas caseras rellenas"),
+    ("Parrilla", "Carnes a la parrilla y choripán"),
+    ("Pastas", "Pastas frescas y salsas caseras"),
+    ("Ensaladas", "Ensaladas frescas y saludables"),
+    ("Bebidas", "Bebidas frías y calientes"),
+    ("Postres", "Postres caseros y helados"),
+]
+
+PRODUCTOS = [
+    # Hamburguesas
+    ("Hamburguesa Clásica", "Hamburguesas", 2500, 20),
+    ("Hamburguesa Completa", "Hamburguesas", 3200, 15),
+    ("Hamburguesa BBQ", "Hamburguesas", 3500, 12),
+
+    # Pizzas
+    ("Pizza Margherita", "Pizzas", 3200, 8),
+    ("Pizza Napolitana", "Pizzas", 3800, 6),
+    ("Pizza Fugazzeta", "Pizzas", 4200, 5),
+
+    # Empanadas
+    ("Empanadas de Carne", "Empanadas", 180, 50),
+    ("Empanadas de Pollo", "Empanadas", 180, 40),
+    ("Empanadas de Jamón y Queso", "Empanadas", 180, 30),
+    ("Empanadas de Humita", "Empanadas", 200, 25),
+
+    # Parrilla
+    ("Choripán", "Parrilla", 1200, 25),
+    ("Bife de Chorizo", "Parrilla", 4500, 8),
+    ("Costillas BBQ", "Parrilla", 3800, 10),
+
+    # Pastas
+    ("Lomito Completo", "Pastas", 3500, 12),
+    ("Ñoquis con Salsa", "Pastas", 2800, 15),
+    ("Ravioles de Ricota", "Pastas", 3200, 10),
+
+    # Ensaladas
+    ("Ensalada César", "Ensaladas", 1800, 18),
+    ("Ensalada Mixta", "Ensaladas", 1500, 20),
+
+    # Bebidas
+    ("Coca Cola 500ml", "Bebidas", 300, 60),
+    ("Agua Mineral 500ml", "Bebidas", 200, 80),
+    ("Cerveza Quilmes", "Bebidas", 400, 45),
+    ("Jugo Natural", "Bebidas", 350, 30),
+
+    # Postres
+    ("Flan Casero", "Postres", 800, 15),
+    ("Helado 1/4kg", "Postres", 1200, 20),
+    ("Tiramisu", "Postres", 950, 12),
+]
+
+# Los maneja la operación (ventas, importaciones, el admin): el menú sólo
+# los pone al crear el producto, recargarlo nunca repone stock ni cambia precios
+CAMPOS_OPERATIVOS = ('precio', 'stock', 'disponible')
+
+
+def menu_integrado():
+    categorias = {nombre: {'descripcion': descripcion} for nombre, descripcion in CATEGORIAS}
+    productos = {
+        (categoria, nombre): {'precio': Decimal(precio), 'stock': stock}
+        for nombre, categoria, precio, stock in PRODUCTOS
+    }
+    return categorias, productos
+
+
+def leer_fixture(archivo):
+    """Lee un fixture de Django (api.categoria / api.producto) y lo indexa por nombre"""
+    try:
+        with open(archivo, encoding='utf-8') as f:
+            objetos = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CommandError(f'No se pudo leer {archivo}: {e}')
+
+    nombres_por_pk = {}
+    categorias = {}
+    for obj in objetos:
+        if obj.get('model') == 'api.categoria':
+            campos = obj['fields']
+            nombres_por_pk[obj.get('pk')] = campos['nombre']
+            categorias[campos['nombre']] = {'descripcion': campos.get('descripcion')}
+
+    productos = {}
+    for obj in objetos:
+        if obj.get('model') == 'api.producto':
+            campos = dict(obj['fields'])
+            try:
+                categoria = nombres_por_pk[campos.pop('categoria')]
+            except KeyError:
+                raise CommandError(f"Producto sin categoría válida en el fixture: {campos.get('nombre')}")
+            nombre = campos.pop('nombre')
+            campos.pop('created_at', None)
+            campos.pop('updated_at', None)
+            if 'precio' in campos:
+                campos['precio'] = Decimal(campos['precio'])
+            productos[(categoria, nombre)] = campos
+    return categorias, productos
+
+
+def calcular_hash(categorias, productos):
+    contenido = json.dumps(
+        {
+            'categorias': categorias,
+            'productos': sorted([list(clave), campos] for clave, campos in productos.items()),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
 
 
 class Command(BaseCommand):
-    help = 'Carga los datos iniciales del menú del restaurante'
+    help = (
+        'Carga el menú del restaurante sin borrar los datos existentes: crea lo '
+        'que falta y actualiza descripciones, nunca stock, precio ni disponibilidad'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archivo',
+            help='Fixture JSON con el menú (por ejemplo fixtures/initial_data.json)',
+        )
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Aplicar el menú aunque no haya cambiado desde la última carga',
+        )
 
     def handle(self, *args, **options):
+        archivo = options['archivo']
+        if archivo:
+            categorias, productos = leer_fixture(archivo)
+            # El mismo archivo con otra ruta (relativa, ./) es la misma carga
+            origen = os.path.abspath(archivo)
+        else:
+            categorias, productos = menu_integrado()
+            origen = 'integrado'
+
+        hash_menu = calcular_hash(categorias, productos)
+        if not options['forzar'] and CargaMenu.objects.filter(origen=origen, hash=hash_menu).exists():
+            self.stdout.write('Menú sin cambios desde la última carga, no se escribe nada')
+            return
+
         self.stdout.write('Cargando datos del menú...')
-        
-        # Limpiar datos existentes
-        Producto.objects.all().delete()
-        Categoria.objects.all().delete()
-        self.stdout.write(self.style.WARNING('Datos anteriores eliminados'))
-        
-        # Crear categorías
-        categorias_data = [
-            ("Hamburguesas", "Hamburguesas clásicas y gourmet"),
-            ("Pizzas", "Pizzas artesanales con ingredientes frescos"),
-            ("Empanadas", "Empanadas caseras rellenas"),
-            ("Parrilla", "Carnes a la parrilla y choripán"),
-            ("Pastas", "Pastas frescas y salsas caseras"),
-            ("Ensaladas", "Ensaladas frescas y saludables"),
-            ("Bebidas", "Bebidas frías y calientes"),
-            ("Postres", "Postres caseros y helados"),
-        ]
-        
-        categorias = {}
-        for nombre, descripcion in categorias_data:
-            categoria, created = Categoria.objects.get_or_create(
-                nombre=nombre,
-                defaults={'descripcion': descripcion}
-            )
-            categorias[nombre] = categoria
-            if created:
-                self.stdout.write(f'  ✓ Categoría creada: {nombre}')
-        
-        # Crear productos
-        productos_data = [
-            # Hamburguesas
-            ("Hamburguesa Clásica", "Hamburguesas", 2500, 20),
-            ("Hamburguesa Completa", "Hamburguesas", 3200, 15),
-            ("Hamburguesa BBQ", "Hamburguesas", 3500, 12),
-            
-            # Pizzas
-            ("Pizza Margherita", "Pizzas", 3200, 8),
-            ("Pizza Napolitana", "Pizzas", 3800, 6),
-            ("Pizza Fugazzeta", "Pizzas", 4200, 5),
-            
-            # Empanadas
-            ("Empanadas de Carne", "Empanadas", 180, 50),
-            ("Empanadas de Pollo", "Empanadas", 180, 40),
-            ("Empanadas de Jamón y Queso", "Empanadas", 180, 30),
-            ("Empanadas de Humita", "Empanadas", 200, 25),
-            
-            # Parrilla
-            ("Choripán", "Parrilla", 1200, 25),
-            ("Bife de Chorizo", "Parrilla", 4500, 8),
-            ("Costillas BBQ", "Parrilla", 3800, 10),
-            
-            # Pastas
-            ("Lomito Completo", "Pastas", 3500, 12),
-            ("Ñoquis con Salsa", "Pastas", 2800, 15),
-            ("Ravioles de Ricota", "Pastas", 3200, 10),
-            
-            # Ensaladas
-            ("Ensalada César", "Ensaladas", 1800, 18),
-            ("Ensalada Mixta", "Ensaladas", 1500, 20),
-            
-            # Bebidas
-            ("Coca Cola 500ml", "Bebidas", 300, 60),
-            ("Agua Mineral 500ml", "Bebidas", 200, 80),
-            ("Cerveza Quilmes", "Bebidas", 400, 45),
-            ("Jugo Natural", "Bebidas", 350, 30),
-            
-            # Postres
-            ("Flan Casero", "Postres", 800, 15),
-            ("Helado 1/4kg", "Postres", 1200, 20),
-            ("Tiramisu", "Postres", 950, 12),
-        ]
-        
-        productos_creados = 0
-        for nombre, categoria_nombre, precio, stock in productos_data:
-            producto, created = Producto.objects.get_or_create(
-                nombre=nombre,
-                categoria=categorias[categoria_nombre],
-                defaults={
-                    'precio': precio,
-                    'stock': stock
-                }
-            )
-            if created:
-                productos_creados += 1
-        
+        with transaction.atomic():
+            categorias_creadas, categorias_actualizadas, ids = self.aplicar_categorias(categorias)
+            productos_creados, productos_actualizados = self.aplicar_productos(productos, ids)
+            CargaMenu.objects.update_or_create(origen=origen, defaults={'hash': hash_menu})
+
+        # bulk_create/bulk_update no disparan post_save
+        if categorias_creadas or categorias_actualizadas:
+            catalogo_modificado.send(sender=Categoria)
+        if productos_creados or productos_actualizados:
+            catalogo_modificado.send(sender=Producto)
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n✓ Menú cargado exitosamente!'
             )
         )
         self.stdout.write(
-            f'  {len(categorias)} categorías'
+            f'  {categorias_creadas} categorías nuevas, {categorias_actualizadas} actualizadas'
         )
         self.stdout.write(
-            f'  {productos_creados} productos nuevos'
+            f'  {productos_creados} productos nuevos, {productos_actualizados} actualizados'
         )
+
+    def aplicar_categorias(self, categorias):
+        """
+        Inserta y actualiza categorías; devuelve los ids por nombre del menú.
+        'Pizzas' en el menú es la 'pizzas' que ya esté en la base (por_nombre,
+        como categoria_nombre_lower_unico)
+        """
+        # Una sola lectura: se comparan en minúsculas, como las encontró la base
+        por_minusculas = {c.nombre.lower(): c for c in Categoria.objects.por_nombres(categorias)}
+        existentes = {
+            nombre: por_minusculas[nombre.lower()]
+            for nombre in categorias if nombre.lower() in por_minusculas
+        }
+        ahora = timezone.now()
+        nuevas, modificadas = [], []
+
+        for nombre, campos in categorias.items():
+            categoria = existentes.get(nombre)
+            if categoria is None:
+                nuevas.append(Categoria(nombre=nombre, **campos))
+            elif _aplicar_cambios(categoria, campos):
+                categoria.updated_at = ahora
+                modificadas.append(categoria)
+
+        Categoria.objects.bulk_create(nuevas)
+        Categoria.objects.bulk_update(modificadas, ['descripcion', 'updated_at'])
+
+        ids = {nombre: c.pk for nombre, c in existentes.items()}
+        if any(c.pk is None for c in nuevas):
+            # MySQL no devuelve los ids de bulk_create
+            nombres = [c.nombre for c in nuevas]
+            ids.update(Categoria.objects.filter(nombre__in=nombres).values_list('nombre', 'pk'))
+        else:
+            ids.update((c.nombre, c.pk) for c in nuevas)
+        return len(nuevas), len(modificadas), ids
+
+    def aplicar_productos(self, productos, ids_categorias):
+        existentes = {(p.categoria_id, p.nombre): p for p in Producto.objects.all()}
+        ahora = timezone.now()
+        nuevos, modificados = [], []
+        campos_modificables = set()
+
+        for (categoria, nombre), campos in productos.items():
+            categoria_id = ids_categorias.get(categoria)
+            if categoria_id is None:
+                raise CommandError(f'Categoría inexistente para {nombre}: {categoria}')
+
+            producto = existentes.get((categoria_id, nombre))
+            if producto is None:
+                nuevos.append(Producto(nombre=nombre, categoria_id=categoria_id, **campos))
+                continue
+            campos = {campo: valor for campo, valor in campos.items() if campo not in CAMPOS_OPERATIVOS}
+            campos_modificables.update(campos)
+            if _aplicar_cambios(producto, campos):
+                producto.updated_at = ahora
+                modificados.append(producto)
+
+        Producto.objects.bulk_create(nuevos)
+        if modificados:
+            Producto.objects.bulk_update(modificados, sorted(campos_modificables) + ['updated_at'])
+        return len(nuevos), len(modificados)
+
+
+def _aplicar_cambios(instancia, campos):
+    """Asigna los campos que difieren y devuelve si hubo cambios"""
+    cambios = False
+    for campo, valor in campos.items():
+        if getattr(instancia, campo) != valor:
+            setattr(instancia, campo, valor)
+            cambios = True
+    return cambios
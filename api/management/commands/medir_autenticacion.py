@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.autenticacion import CachedJWTAuthentication, StatelessReadJWTAuthentication, usuarios
+from api.query_budget import contar_consultas
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de autenticar un request con JWT: sin cache, con cache y sin estado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--usuario', help='username a usar (por defecto el primero)')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        usuarios_db = User.objects.order_by('pk')
+        if options['usuario']:
+            usuarios_db = usuarios_db.filter(username=options['usuario'])
+        usuario = usuarios_db.first()
+        if usuario is None:
+            self.stderr.write('No hay usuarios: crear uno con createsuperuser')
+            return
+
+        cabecera = 'Bearer %s' % AccessToken.for_user(usuario)
+        factory = RequestFactory()
+        usuarios.limpiar()
+
+        for nombre, clase, metodo in (
+            ('JWTAuthentication', JWTAuthentication, 'get'),
+            ('CachedJWTAuthentication', CachedJWTAuthentication, 'post'),
+            ('StatelessReadJWTAuthentication (GET)', StatelessReadJWTAuthentication, 'get'),
+        ):
+            request = Request(getattr(factory, metodo)('/api/productos/', HTTP_AUTHORIZATION=cabecera))
+            with contar_consultas() as contador:
+                inicio = time.perf_counter()
+                for _ in range(options['requests']):
+                    clase().authenticate(request)
+                duracion = time.perf_counter() - inicio
+            self.stdout.write(
+                f'{nombre:>38}: {duracion / options["requests"] * 1e6:7.1f} µs/request, '
+                f'{contador.total / options["requests"]:.3f} consultas/request'
+            )
@@ -0,0 +1,88 @@
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.busqueda import IndiceProductos
+
+PLATOS = (
+    'Milanesa', 'Pizza', 'Empanada', 'Hamburguesa', 'Lomito', 'Ravioles', 'Ñoquis',
+    'Ensalada', 'Tarta', 'Sándwich', 'Tortilla', 'Choripán', 'Sorrentinos', 'Tallarines',
+)
+VARIANTES = (
+    'napolitana', 'completa', 'de carne', 'de pollo', 'de jamón y queso', 'caprese',
+    'vegana', 'especial', 'casera', 'grande', 'a caballo', 'fugazzeta', 'de verdura',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el índice de búsqueda en memoria (api/busqueda.py) sobre un '
+        'catálogo sintético: tiempo de construcción y mediana y p99 por '
+        'consulta (exacta, por prefijo, con error de tipeo y de varios '
+        'términos). Falla si la mediana supera --objetivo-ms'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100000)
+        parser.add_argument('--categorias', type=int, default=50)
+        parser.add_argument('--consultas', type=int, default=2000)
+        parser.add_argument('--objetivo-ms', type=float, default=1.0)
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        azar = random.Random(options['semilla'])
+        # Vocabulario propio de las descripciones, como en un menú real
+        palabras = [
+            ''.join(azar.choices(string.ascii_lowercase, k=azar.randint(4, 9))) for _ in range(3000)
+        ]
+        categorias = {i: 'Categoría %s' % azar.choice(palabras) for i in range(options['categorias'])}
+        filas = [
+            (
+                pk,
+                '%s %s %s' % (azar.choice(PLATOS), azar.choice(VARIANTES), azar.choice(palabras)),
+                ' '.join(azar.choices(palabras, k=8)),
+                azar.randrange(options['categorias']),
+            )
+            for pk in range(1, options['productos'] + 1)
+        ]
+
+        indice = IndiceProductos()
+        inicio = time.perf_counter()
+        indice.cargar(categorias, filas)
+        construccion = time.perf_counter() - inicio
+
+        tipos = {
+            'exacta': lambda: azar.choice(PLATOS),
+            'prefijo': lambda: azar.choice(PLATOS)[:4],
+            'tipeo': lambda: self._con_error(azar, azar.choice(PLATOS).lower()),
+            'varios términos': lambda: '%s %s' % (azar.choice(PLATOS), azar.choice(VARIANTES)[:5]),
+            'descripción': lambda: azar.choice(palabras),
+        }
+        self.stdout.write('%d productos, índice construido en %.0f ms' % (len(indice), construccion * 1000))
+        medianas = []
+        for nombre, generar in tipos.items():
+            consultas = [generar() for _ in range(options['consultas'])]
+            tiempos = []
+            for consulta in consultas:
+                inicio = time.perf_counter()
+                indice.buscar(consulta)
+                tiempos.append(time.perf_counter() - inicio)
+            tiempos.sort()
+            mediana = tiempos[len(tiempos) // 2]
+            medianas.append(mediana)
+            self.stdout.write('  %-16s mediana %6.3f ms   p99 %6.3f ms' % (
+                nombre, mediana * 1000, tiempos[int(len(tiempos) * 0.99)] * 1000,
+            ))
+
+        peor = max(medianas) * 1000
+        if peor > options['objetivo_ms']:
+            raise CommandError('Mediana de %.3f ms, por encima del objetivo (%.3f ms)' % (peor, options['objetivo_ms']))
+        self.stdout.write(self.style.SUCCESS('✓ Todas las medianas por debajo de %.3f ms' % options['objetivo_ms']))
+
+    @staticmethod
+    def _con_error(azar, palabra):
+        """La palabra con dos letras vecinas intercambiadas"""
+        i = azar.randrange(len(palabra) - 1)
+        return palabra[:i] + palabra[i + 1] + palabra[i] + palabra[i + 2:]
@@ -0,0 +1,109 @@
+import gzip
+import json
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from api import compresion
+from api.renderers import CompactoRenderer, JSONRendererMedido, MessagePackRenderer, msgpack
+from api.serializers import productos_values, representar_producto
+
+
+def _decodificar_json(contenido):
+    return json.loads(contenido)
+
+
+def _decodificar_msgpack(contenido):
+    return msgpack.unpackb(contenido, raw=False)
+
+
+FORMATOS = {
+    'json': (JSONRendererMedido, _decodificar_json),
+    'compacto': (CompactoRenderer, _decodificar_json),
+    'msgpack': (MessagePackRenderer, _decodificar_msgpack),
+}
+
+DESCOMPRESORES = {
+    'identity': lambda contenido: contenido,
+    'gzip': gzip.decompress,
+    'br': lambda contenido: compresion.brotli.decompress(contenido),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara tamaño y tiempos del menú completo en JSON, el formato '
+        'compacto y MessagePack, sin comprimir, con gzip y con brotli: '
+        'codificación en el servidor y decodificación en el cliente'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument(
+            '--base', action='store_true', help='Usar el catálogo de la base en lugar de uno sintético'
+        )
+
+    def handle(self, *args, **options):
+        datos = self._menu(options)
+        formatos = [nombre for nombre in FORMATOS if nombre != 'msgpack' or msgpack is not None]
+        codificaciones = ['identity', *reversed(compresion.codificaciones())]
+        self.stdout.write('%d productos, %d repeticiones (mediana)' % (len(datos), options['repeticiones']))
+
+        referencia = None
+        for formato in formatos:
+            renderer, decodificar = FORMATOS[formato]
+            codificado, tiempo_render = self._medir(
+                lambda: renderer().render(datos), options['repeticiones']
+            )
+            for codificacion in codificaciones:
+                if codificacion == 'identity':
+                    cuerpo, tiempo_compresion = codificado, 0.0
+                else:
+                    cuerpo, tiempo_compresion = self._medir(
+                        lambda: compresion.comprimir(codificado, codificacion), options['repeticiones']
+                    )
+                descomprimir = DESCOMPRESORES[codificacion]
+                _, tiempo_decodificacion = self._medir(
+                    lambda: decodificar(descomprimir(cuerpo)), options['repeticiones']
+                )
+                if referencia is None:
+                    referencia = len(cuerpo)
+                self.stdout.write(
+                    f'{formato:>9} {codificacion:>8}: {len(cuerpo) / 1024:9.1f} KiB '
+                    f'({referencia / len(cuerpo):5.1f}x menos), '
+                    f'servidor {(tiempo_render + tiempo_compresion) * 1000:7.2f} ms, '
+                    f'cliente {tiempo_decodificacion * 1000:7.2f} ms'
+                )
+
+    def _menu(self, options):
+        """Lista de productos como la del listado (representar_producto)"""
+        if options['base']:
+            from api.models import Producto
+            return [representar_producto(fila) for fila in productos_values(Producto.objects.order_by('id'))]
+
+        azar = random.Random(42)
+        categorias = [
+            ('Categoría %d' % i, 'Descripción de la categoría %d' % i) for i in range(options['categorias'])
+        ]
+        menu = []
+        for i in range(options['productos']):
+            nombre, descripcion = azar.choice(categorias)
+            menu.append(representar_producto((
+                'Producto %d' % i, nombre, Decimal(azar.randint(100, 500000)) / 100,
+                azar.randint(0, 200), descripcion,
+            )))
+        return menu
+
+    def _medir(self, funcion, repeticiones):
+        """(resultado, mediana de segundos por llamada)"""
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        tiempos.sort()
+        return resultado, tiempos[len(tiempos) // 2]
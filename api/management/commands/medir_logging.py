@@ -0,0 +1,73 @@
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.registro import FormatoJSON, iniciar_cola
+
+
+class SalidaLenta:
+    """Stream que tarda `demora` segundos por escritura (stdout de un contenedor saturado)"""
+
+    def __init__(self, demora):
+        self.demora = demora
+        self.destino = open(os.devnull, 'w')
+
+    def write(self, texto):
+        if self.demora:
+            time.sleep(self.demora)
+        return self.destino.write(texto)
+
+    def flush(self):
+        self.destino.flush()
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia que agrega el logging a cada request: StreamHandler '
+        'sincrónico contra el pipeline con cola de api.registro'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument(
+            '--lineas', type=int, default=2, help='Registros por request (vista + métricas)'
+        )
+        parser.add_argument(
+            '--demoras-ms', default='0,1', help='Demoras por escritura de la salida, separadas por coma'
+        )
+
+    def handle(self, *args, **options):
+        for demora_ms in (float(d) for d in options['demoras_ms'].split(',')):
+            demora = demora_ms / 1000
+            for nombre in ('sincrónico', 'cola'):
+                destino = logging.StreamHandler(SalidaLenta(demora))
+                destino.setFormatter(FormatoJSON())
+                manejador = iniciar_cola([destino]) if nombre == 'cola' else destino
+
+                tiempos = self._medir(manejador, options['requests'], options['lineas'])
+                if nombre == 'cola':
+                    manejador.listener.stop()
+
+                tiempos.sort()
+                self.stdout.write(
+                    f'salida {demora_ms:g} ms/escritura, {nombre:>10}: '
+                    f'media {sum(tiempos) / len(tiempos) * 1e6:8.1f} µs/request, '
+                    f'p99 {tiempos[int(len(tiempos) * 0.99)] * 1e6:8.1f} µs'
+                    + (f', descartados {manejador.descartados}' if nombre == 'cola' else '')
+                )
+
+    def _medir(self, manejador, requests, lineas):
+        logger = logging.Logger('medir_logging')
+        logger.addHandler(manejador)
+        tiempos = []
+        for numero in range(requests):
+            inicio = time.perf_counter()
+            for _ in range(lineas):
+                logger.info(
+                    'GET /api/productos/ %d %.2fms', 200, 1.5,
+                    extra={'vista': 'productos_list', 'request': numero},
+                )
+            tiempos.append(time.perf_counter() - inicio)
+        return tiempos
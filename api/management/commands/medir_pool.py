@@ -0,0 +1,141 @@
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Modo -> variables de entorno del worker
+MODOS = {
+    'sin_persistencia': {'DB_POOL': 'False', 'CONN_MAX_AGE': '0'},
+    'persistente': {'DB_POOL': 'False', 'CONN_MAX_AGE': '60'},
+    'pool': {'DB_POOL': 'True', 'CONN_MAX_AGE': '0'},
+}
+
+
+class ProxyConLatencia:
+    """
+    Proxy TCP que reenvía a la base agregando `latencia` segundos en cada
+    sentido por cada paquete: simula la distancia entre el worker y el
+    servidor MySQL (Railway). Cuenta las conexiones aceptadas.
+    """
+
+    def __init__(self, destino, latencia):
+        self.destino = destino
+        self.latencia = latencia
+        self.conexiones = 0
+        self._servidor = socket.create_server(('127.0.0.1', 0))
+        self.puerto = self._servidor.getsockname()[1]
+
+    def iniciar(self):
+        threading.Thread(target=self._aceptar, daemon=True).start()
+
+    def _aceptar(self):
+        while True:
+            cliente, _ = self._servidor.accept()
+            self.conexiones += 1
+            servidor = socket.create_connection(self.destino)
+            for origen, destino in ((cliente, servidor), (servidor, cliente)):
+                threading.Thread(target=self._copiar, args=(origen, destino), daemon=True).start()
+
+    def _copiar(self, origen, destino):
+        try:
+            while True:
+                datos = origen.recv(65536)
+                if not datos:
+                    break
+                time.sleep(self.latencia)
+                destino.sendall(datos)
+        except OSError:
+            pass
+        finally:
+            for extremo in (origen, destino):
+                try:
+                    extremo.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide cuánto ahorra por request reutilizar conexiones MySQL: '
+        'sin persistencia, CONN_MAX_AGE y pool (comida_al_paso.db.mysql), a '
+        'través de un proxy que agrega latencia de red. Usa la base MySQL de '
+        'las variables MYSQL* (DB_ENGINE=mysql)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument(
+            '--latencia-ms', type=float, default=5, help='Demora agregada en cada sentido por paquete'
+        )
+        parser.add_argument('--modos', default=','.join(MODOS))
+        parser.add_argument('--ruta', default='/api/test/')
+        # Uso interno: cada modo corre en un proceso con --worker
+        parser.add_argument('--worker', action='store_true', help='(interno)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self._worker(options)
+
+        if 'mysql' not in settings.DATABASES['default']['ENGINE']:
+            raise CommandError('medir_pool necesita DB_ENGINE=mysql y las variables MYSQL*')
+
+        base = settings.DATABASES['default']
+        proxy = ProxyConLatencia(
+            (base['HOST'] or 'localhost', int(base['PORT'] or 3306)), options['latencia_ms'] / 1000
+        )
+        proxy.iniciar()
+
+        for modo in options['modos'].split(','):
+            entorno = {
+                **os.environ,
+                **MODOS[modo],
+                'MYSQLHOST': '127.0.0.1',
+                'MYSQLPORT': str(proxy.puerto),
+                'CATALOGO_CACHE_BACKEND': 'off',
+                'METRICAS_LOG': 'False',
+                'LOG_CONSOLA': 'False',
+                'PYTHONWARNINGS': 'ignore',
+            }
+            antes = proxy.conexiones
+            salida = subprocess.run(
+                [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'medir_pool', '--worker',
+                 '--requests', str(options['requests']), '--ruta', options['ruta']],
+                env=entorno, stdout=subprocess.PIPE, check=True,
+            )
+            resultado = json.loads(salida.stdout.decode().strip().splitlines()[-1])
+            tiempos = sorted(resultado['tiempos'])
+            self.stdout.write(
+                f'{modo:>16}: media {statistics.fmean(tiempos) * 1000:7.2f} ms/request, '
+                f'p99 {tiempos[int(len(tiempos) * 0.99)] * 1000:7.2f} ms, '
+                f'{proxy.conexiones - antes} conexiones TCP abiertas'
+                + (f', pool {resultado["pool"]}' if resultado['pool'] else '')
+            )
+
+    def _worker(self, options):
+        from django.test import Client
+        from django.test.utils import override_settings
+
+        from comida_al_paso.db import pool
+
+        cliente = Client(raise_request_exception=True)
+        tiempos = []
+        with override_settings(THROTTLE={**settings.THROTTLE, 'TASAS': {}}):
+            # El primer request (versión del servidor, features) no se cuenta
+            cliente.get(options['ruta'])
+            for _ in range(options['requests']):
+                inicio = time.perf_counter()
+                respuesta = cliente.get(options['ruta'])
+                tiempos.append(time.perf_counter() - inicio)
+                if respuesta.status_code != 200:
+                    raise CommandError('%s devolvió %d' % (options['ruta'], respuesta.status_code))
+        self.stdout.write(json.dumps({
+            'tiempos': tiempos,
+            'pool': pool.estadisticas().get('default'),
+        }))
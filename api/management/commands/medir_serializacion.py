@@ -0,0 +1,92 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Categoria, Producto
+from api.renderers import JSONRendererMedido
+from api.serializers import ProductoSerializer, productos_values, representar_productos
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el listado de productos con ProductoSerializer(many=True) '
+        'contra el camino de lectura con values_list() (productos_values y '
+        'representar_productos): tiempo de serializar y renderizar, y que '
+        'los bytes sean idénticos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=5000)
+        parser.add_argument('--categorias', type=int, default=20)
+        parser.add_argument('--repeticiones', type=int, default=5)
+        parser.add_argument(
+            '--base', action='store_true',
+            help='Usar el catálogo de la base (incluye las consultas) en lugar de uno sintético',
+        )
+
+    def handle(self, *args, **options):
+        if options['base']:
+            drf, rapido = self._de_la_base()
+        else:
+            drf, rapido = self._sinteticas(options)
+
+        render = JSONRendererMedido().render
+        contenido_drf, tiempo_drf = self._medir(lambda: render(drf()), options['repeticiones'])
+        contenido_rapido, tiempo_rapido = self._medir(lambda: render(rapido()), options['repeticiones'])
+        if contenido_drf != contenido_rapido:
+            raise CommandError('El camino rápido no da los mismos bytes que ProductoSerializer')
+
+        self.stdout.write('%d productos, %d repeticiones (mediana)' % (len(rapido()), options['repeticiones']))
+        self.stdout.write(f'  ProductoSerializer: {tiempo_drf * 1000:8.2f} ms')
+        self.stdout.write(f'       values_list(): {tiempo_rapido * 1000:8.2f} ms')
+        self.stdout.write(self.style.SUCCESS(
+            '✓ %d bytes idénticos, %.1fx más rápido' % (len(contenido_rapido), tiempo_drf / tiempo_rapido)
+        ))
+
+    def _de_la_base(self):
+        """Los dos caminos sobre el catálogo de la base, consultas incluidas"""
+        productos = Producto.objects.order_by('id')
+
+        def drf():
+            return ProductoSerializer(productos.select_related('categoria'), many=True).data
+
+        def rapido():
+            return representar_productos(productos_values(productos))
+        return drf, rapido
+
+    def _sinteticas(self, options):
+        """
+        Instancias sin guardar (para DRF) y las mismas filas que devolvería
+        productos_values(): se mide sólo la serialización
+        """
+        azar = random.Random(42)
+        categorias = [
+            Categoria(nombre='Categoría %d' % i, descripcion=None if i % 5 == 0 else 'Descripción %d' % i)
+            for i in range(options['categorias'])
+        ]
+        instancias, filas = [], []
+        for i in range(options['productos']):
+            categoria = azar.choice(categorias)
+            precio = Decimal(azar.randint(100, 500000)) / 100
+            stock = azar.randint(0, 200)
+            instancias.append(Producto(nombre='Producto %d' % i, categoria=categoria, precio=precio, stock=stock))
+            filas.append(('Producto %d' % i, categoria.nombre, precio, stock, categoria.descripcion))
+
+        def drf():
+            return ProductoSerializer(instancias, many=True).data
+
+        def rapido():
+            return representar_productos(filas)
+        return drf, rapido
+
+    def _medir(self, funcion, repeticiones):
+        """(resultado, mediana de segundos por llamada)"""
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        tiempos.sort()
+        return resultado, tiempos[len(tiempos) // 2]
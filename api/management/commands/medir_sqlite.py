@@ -0,0 +1,144 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+PERFILES = ('basico', 'produccion')
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de concurrencia sobre SQLite: varios procesos leen '
+        '/api/productos/ y /api/categorias/ y escriben categorías a la vez. '
+        'Compara el backend de Django (basico) con comida_al_paso.db.sqlite3 '
+        '(produccion): requests por segundo, errores 5xx y "database is locked"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=3, help='Como los workers de gunicorn')
+        parser.add_argument('--segundos', type=float, default=10)
+        parser.add_argument(
+            '--escrituras', type=float, default=0.2, help='Proporción de requests que escriben'
+        )
+        parser.add_argument('--productos', type=int, default=500)
+        parser.add_argument('--perfiles', default=','.join(PERFILES))
+        parser.add_argument(
+            '--sin-atomic', action='store_true',
+            help='No envolver cada request en una transacción (ATOMIC_REQUESTS). Con '
+                 'ATOMIC_REQUESTS un PATCH lee y después escribe en la misma transacción: '
+                 'es el caso que falla con BEGIN diferido',
+        )
+        # Uso interno: cada proceso del benchmark se lanza con --worker
+        parser.add_argument('--worker', action='store_true', help='(interno)')
+        parser.add_argument('--semilla', type=int, default=0, help='(interno)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self._worker(options)
+
+        for perfil in options['perfiles'].split(','):
+            with tempfile.TemporaryDirectory() as directorio:
+                entorno = {
+                    **os.environ,
+                    'SQLITE_PERFIL': perfil,
+                    'SQLITE_NAME': os.path.join(directorio, 'bench.sqlite3'),
+                    'DB_ENGINE': 'django.db.backends.sqlite3',
+                    # Todas las lecturas van a la base
+                    'CATALOGO_CACHE_BACKEND': 'off',
+                    'MENU_SNAPSHOT': 'False',
+                    'METRICAS_LOG': 'False',
+                    'LOG_CONSOLA': 'False',
+                    # Varios procesos en el mismo logs/django.log: ninguno rota
+                    'LOG_ROTACION': 'externa',
+                    'LOG_NIVEL_API': 'WARNING',
+                    'PYTHONWARNINGS': 'ignore',
+                }
+                self._preparar(entorno, options['productos'])
+                resultados = self._correr(entorno, options)
+                self._reportar(perfil, resultados, options['segundos'])
+
+    def _manage(self):
+        return [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+
+    def _preparar(self, entorno, productos):
+        subprocess.run(self._manage() + ['migrate', '-v', '0'], env=entorno, check=True)
+        script = (
+            'import django; django.setup()\n'
+            'from api.models import Categoria, Producto\n'
+            'cats = [Categoria.objects.create(nombre="Bench %d" % i) for i in range(10)]\n'
+            'Producto.objects.bulk_create([Producto(nombre="Producto %d" % i, precio=100 + i, '
+            'stock=50, categoria=cats[i % 10]) for i in range({})])\n'.format(productos)
+        )
+        subprocess.run(
+            [sys.executable, '-c', script], env={**entorno, 'DJANGO_SETTINGS_MODULE': 'comida_al_paso.settings'},
+            cwd=settings.BASE_DIR, check=True,
+        )
+
+    def _correr(self, entorno, options):
+        comando = self._manage() + [
+            'medir_sqlite', '--worker', '--segundos', str(options['segundos']),
+            '--escrituras', str(options['escrituras']),
+        ] + (['--sin-atomic'] if options['sin_atomic'] else [])
+        procesos = [
+            subprocess.Popen(comando + ['--semilla', str(i)], env=entorno, stdout=subprocess.PIPE)
+            for i in range(options['procesos'])
+        ]
+        return [json.loads(proceso.communicate()[0].decode().strip().splitlines()[-1]) for proceso in procesos]
+
+    def _reportar(self, perfil, resultados, segundos):
+        total = {clave: sum(r[clave] for r in resultados) for clave in resultados[0] if clave != 'latencias'}
+        latencias = sorted(l for r in resultados for l in r['latencias'])
+        p99 = latencias[int(len(latencias) * 0.99)] * 1000 if latencias else 0
+        self.stdout.write(
+            f'{perfil:>10}: {total["requests"] / segundos:7.1f} req/s '
+            f'({total["lecturas"]} lecturas, {total["escrituras"]} escrituras), '
+            f'p99 {p99:7.1f} ms, 5xx {total["errores"]}, locked {total["locked"]}'
+        )
+
+    def _worker(self, options):
+        from django.db import connections
+        from django.test import Client
+        from django.test.utils import override_settings
+
+        connections['default'].settings_dict['ATOMIC_REQUESTS'] = not options['sin_atomic']
+        azar = random.Random(options['semilla'])
+        cliente = Client(raise_request_exception=False)
+        conteo = {'requests': 0, 'lecturas': 0, 'escrituras': 0, 'errores': 0, 'locked': 0}
+        latencias = []
+        numero = 0
+
+        # Sin throttling: se mide la base, no el límite por IP
+        with override_settings(THROTTLE={**settings.THROTTLE, 'TASAS': {}}):
+            fin = time.monotonic() + options['segundos']
+            while time.monotonic() < fin:
+                inicio = time.perf_counter()
+                if azar.random() < options['escrituras']:
+                    numero += 1
+                    if numero % 2:
+                        respuesta = cliente.post('/api/categorias/', {
+                            'nombre': 'Bench %d-%d' % (options['semilla'], numero),
+                        }, content_type='application/json')
+                    else:
+                        respuesta = cliente.patch('/api/categorias/%d/' % azar.randint(1, 10), {
+                            'descripcion': 'Actualizada %d' % numero,
+                        }, content_type='application/json')
+                    conteo['escrituras'] += 1
+                else:
+                    ruta = '/api/productos/' if azar.random() < 0.7 else '/api/categorias/'
+                    respuesta = cliente.get(ruta)
+                    conteo['lecturas'] += 1
+                latencias.append(time.perf_counter() - inicio)
+                conteo['requests'] += 1
+                if respuesta.status_code >= 500:
+                    conteo['errores'] += 1
+                    if b'locked' in respuesta.content or 'locked' in str(getattr(respuesta, 'exc_info', '')):
+                        conteo['locked'] += 1
+
+        connections.close_all()
+        self.stdout.write(json.dumps({**conteo, 'latencias': latencias}))
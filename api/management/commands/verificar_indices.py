@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from api.models import Categoria, Producto
+
+
+def consultas():
+    """Consultas calientes del catálogo y el índice que debería usar cada una"""
+    return [
+        (
+            'Categoría por nombre (sin distinguir mayúsculas)',
+            Categoria.objects.por_nombre('pizzas'),
+            'categoria_nombre_lower_unico',
+        ),
+        (
+            'Productos por categoría',
+            Producto.objects.de_categoria('pizzas').select_related('categoria'),
+            'categoria_nombre_lower_unico',
+        ),
+        (
+            'Productos disponibles de una categoría',
+            Producto.objects.filter(categoria_id=1, disponible=True),
+            'producto_cat_disp_idx',
+        ),
+        (
+            'Página de productos por cursor (created_at, id)',
+            Producto.objects.filter(
+                Q(created_at__gt=timezone.now()) | Q(created_at=timezone.now(), id__gt=1)
+            ).order_by('created_at', 'id')[:11],
+            'producto_created_id_idx',
+        ),
+        (
+            'Productos por rango de precio ordenados por precio',
+            Producto.objects.filter(precio__gte=100, precio__lte=200).order_by('precio', 'id'),
+            'producto_precio_id_idx',
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Verifica con EXPLAIN que las consultas del catálogo usan sus índices'
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'mysql'):
+            raise CommandError(f'Motor no soportado: {connection.vendor}')
+
+        fallas = []
+        for descripcion, queryset, indice in consultas():
+            plan = queryset.explain()
+            if indice in plan:
+                self.stdout.write(self.style.SUCCESS(f'✓ {descripcion}: usa {indice}'))
+            else:
+                fallas.append(descripcion)
+                self.stdout.write(self.style.ERROR(f'✗ {descripcion}: no usa {indice}'))
+            if options['verbosity'] > 1:
+                self.stdout.write(plan)
+
+        if fallas:
+            raise CommandError(f'{len(fallas)} consultas no usan el índice esperado')
@@ -0,0 +1,233 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+CATEGORIA = 'Verificación pedidos'
+USUARIO = ('verificar_pedidos', 'verificar-pedidos-clave')
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea pedidos en paralelo desde varios procesos contra los mismos '
+        'productos (POST /api/pedidos/) y verifica que el stock nunca quede '
+        'negativo, que lo descontado coincida con los items creados y que '
+        'reintentar una referencia no descuente dos veces. Usa una base '
+        'SQLite temporal, o la configurada con --base-actual (p. ej. MySQL)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--procesos', type=int, default=4)
+        parser.add_argument('--pedidos', type=int, default=100, help='Pedidos por proceso')
+        parser.add_argument('--productos', type=int, default=10)
+        parser.add_argument(
+            '--stock', type=int, default=50, help='Stock inicial de cada producto (poco, para que se agote)'
+        )
+        parser.add_argument('--items', type=int, default=4, help='Máximo de items por pedido')
+        parser.add_argument(
+            '--base-actual', action='store_true',
+            help='Usar la base configurada (crea y borra su propia categoría y usuario)',
+        )
+        # Uso interno: cada etapa corre en un proceso con la base elegida
+        parser.add_argument('--preparar', action='store_true', help='(interno)')
+        parser.add_argument('--worker', type=int, help='(interno)')
+        parser.add_argument('--revisar', type=int, help='(interno)')
+
+    def handle(self, *args, **options):
+        if options['preparar']:
+            return self._preparar(options)
+        if options['worker'] is not None:
+            return self._worker(options)
+        if options['revisar'] is not None:
+            return self._revisar(options)
+
+        if options['base_actual']:
+            return self._verificar(dict(os.environ), options)
+        with tempfile.TemporaryDirectory() as directorio:
+            entorno = {
+                **os.environ,
+                'DB_ENGINE': 'django.db.backends.sqlite3',
+                'SQLITE_NAME': os.path.join(directorio, 'pedidos.sqlite3'),
+                'DB_REPLICAS': '',
+            }
+            subprocess.run(self._manage() + ['migrate', '-v', '0'], env=self._silencioso(entorno), check=True)
+            self._verificar(entorno, options)
+
+    def _manage(self):
+        return [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+
+    def _silencioso(self, entorno):
+        return {
+            **entorno,
+            'THROTTLE_ACTIVO': 'False',
+            'SOBRECARGA': 'False',
+            'CATALOGO_CACHE_BACKEND': 'off',
+            'METRICAS_LOG': 'False',
+            'LOG_CONSOLA': 'False',
+            # Varios procesos en el mismo logs/django.log: ninguno rota
+            'LOG_ROTACION': 'externa',
+            'LOG_NIVEL_API': 'ERROR',
+            'PYTHONWARNINGS': 'ignore',
+        }
+
+    def _argumentos(self, options):
+        return [
+            '--pedidos', str(options['pedidos']), '--productos', str(options['productos']),
+            '--stock', str(options['stock']), '--items', str(options['items']),
+        ]
+
+    def _verificar(self, entorno, options):
+        entorno = self._silencioso(entorno)
+        subprocess.run(
+            self._manage() + ['verificar_pedidos', '--preparar'] + self._argumentos(options),
+            env=entorno, check=True,
+        )
+
+        inicio = time.perf_counter()
+        procesos = [
+            subprocess.Popen(
+                self._manage() + ['verificar_pedidos', '--worker', str(indice)] + self._argumentos(options),
+                env=entorno, stdout=subprocess.PIPE,
+            )
+            for indice in range(options['procesos'])
+        ]
+        resultados = []
+        for proceso in procesos:
+            salida, _ = proceso.communicate()
+            if proceso.returncode:
+                raise CommandError('Un proceso de pedidos terminó con error')
+            resultados.append(json.loads(salida.decode().strip().splitlines()[-1]))
+        duracion = time.perf_counter() - inicio
+
+        totales = {clave: sum(r[clave] for r in resultados) for clave in resultados[0]}
+        self.stdout.write(
+            '%d procesos: %d pedidos creados, %d rechazados por stock, %d reintentos, '
+            '%d errores en %.2fs (%.0f pedidos/s)' % (
+                options['procesos'], totales['creados'], totales['rechazados'], totales['reintentos'],
+                totales['errores'], duracion,
+                (totales['creados'] + totales['rechazados']) / duracion,
+            )
+        )
+        revision = subprocess.run(
+            self._manage() + ['verificar_pedidos', '--revisar', str(totales['creados'])] + self._argumentos(options),
+            env=entorno,
+        )
+        if totales['errores'] or totales['reintentos_distintos'] or revision.returncode:
+            raise CommandError('Los pedidos concurrentes no se comportan como se espera')
+
+    # Etapas (cada una en su proceso)
+
+    def _preparar(self, options):
+        from django.contrib.auth.models import User
+        from django.db import transaction
+
+        from api.models import Categoria, Pedido, Producto
+
+        with transaction.atomic():
+            Pedido.objects.filter(usuario__username=USUARIO[0]).delete()
+            Categoria.objects.filter(nombre=CATEGORIA).delete()
+            User.objects.filter(username=USUARIO[0]).delete()
+            categoria = Categoria.objects.create(nombre=CATEGORIA)
+            Producto.objects.bulk_create([
+                Producto(
+                    nombre='Producto %d' % i, categoria=categoria,
+                    precio=Decimal(100 + i * 25) / 100, stock=options['stock'],
+                )
+                for i in range(options['productos'])
+            ])
+            User.objects.create_user(USUARIO[0], password=USUARIO[1])
+
+    def _worker(self, options):
+        from django.contrib.auth.models import User
+        from django.test import Client
+
+        from api.models import Producto
+
+        azar = random.Random(options['worker'])
+        ids = list(Producto.objects.filter(categoria__nombre=CATEGORIA).values_list('pk', flat=True))
+        cliente = Client()
+        cliente.force_login(User.objects.get(username=USUARIO[0]))
+        resultado = {'creados': 0, 'rechazados': 0, 'reintentos': 0, 'reintentos_distintos': 0, 'errores': 0}
+
+        for numero in range(options['pedidos']):
+            cuerpo = {
+                'referencia': 'w%d-%d' % (options['worker'], numero),
+                'items': [
+                    {'producto': pk, 'cantidad': azar.randint(1, 3)}
+                    for pk in azar.sample(ids, azar.randint(1, min(options['items'], len(ids))))
+                ],
+            }
+            respuesta = cliente.post('/api/pedidos/', cuerpo, content_type='application/json')
+            if respuesta.status_code == 201:
+                resultado['creados'] += 1
+                if numero % 10 == 0:
+                    # El POS reintenta (p. ej. se cortó la red): mismo pedido, sin descontar de nuevo
+                    reintento = cliente.post('/api/pedidos/', cuerpo, content_type='application/json')
+                    resultado['reintentos'] += 1
+                    if reintento.status_code != 200 or reintento.json()['id'] != respuesta.json()['id']:
+                        resultado['reintentos_distintos'] += 1
+            elif respuesta.status_code == 409:
+                resultado['rechazados'] += 1
+            else:
+                resultado['errores'] += 1
+        self.stdout.write(json.dumps(resultado))
+
+    def _revisar(self, options):
+        from django.contrib.auth.models import User
+        from django.db.models import F, Sum
+
+        from api.models import Categoria, Pedido, PedidoItem, Producto
+
+        fallas = []
+
+        def verificar(descripcion, condicion):
+            if condicion:
+                self.stdout.write(self.style.SUCCESS(f'✓ {descripcion}'))
+            else:
+                fallas.append(descripcion)
+                self.stdout.write(self.style.ERROR(f'✗ {descripcion}'))
+
+        productos = list(
+            Producto.objects.filter(categoria__nombre=CATEGORIA).values_list('pk', 'stock', 'disponible')
+        )
+        pedidos = Pedido.objects.filter(usuario__username=USUARIO[0])
+        vendido = dict(
+            PedidoItem.objects.filter(pedido__in=pedidos).values('producto').annotate(
+                total=Sum('cantidad')
+            ).values_list('producto', 'total')
+        )
+        verificar('Ningún producto quedó con stock negativo', all(stock >= 0 for _, stock, _ in productos))
+        verificar(
+            'Lo descontado de cada producto coincide con sus items de pedido',
+            all(options['stock'] - stock == vendido.get(pk, 0) for pk, stock, _ in productos),
+        )
+        verificar(
+            'Los productos agotados quedaron no disponibles',
+            all(disponible == (stock > 0) for _, stock, disponible in productos),
+        )
+        verificar(
+            'Se crearon exactamente los pedidos confirmados (%d)' % options['revisar'],
+            pedidos.count() == options['revisar'],
+        )
+        diferencias = pedidos.annotate(
+            suma=Sum(F('items__precio_unitario') * F('items__cantidad'))
+        ).exclude(total=F('suma')).count()
+        verificar('El total de cada pedido es la suma de sus items', diferencias == 0)
+        verificar(
+            'Algún producto se agotó (hubo competencia por el stock)',
+            any(stock == 0 for _, stock, _ in productos),
+        )
+
+        # La base queda como estaba
+        pedidos.delete()
+        Categoria.objects.filter(nombre=CATEGORIA).delete()
+        User.objects.filter(username=USUARIO[0]).delete()
+        if fallas:
+            sys.exit(1)
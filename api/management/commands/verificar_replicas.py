@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def replicar(primaria, replica):
+    """Copia la primaria sobre la réplica con la API de backup de SQLite"""
+    origen = sqlite3.connect(primaria)
+    destino = sqlite3.connect(replica)
+    try:
+        origen.backup(destino)
+    finally:
+        origen.close()
+        destino.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica el ruteo a réplicas con dos archivos SQLite (primaria y '
+        'réplica): los GET leen de la réplica, las escrituras van a la '
+        'primaria y quien escribe ve su cambio enseguida, con cookie (sesión) '
+        'o sin ella (JWT)'
+    )
+
+    def add_arguments(self, parser):
+        # Uso interno: las verificaciones corren en un proceso con DB_REPLICAS
+        parser.add_argument('--worker', action='store_true', help='(interno)')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            return self._verificar()
+
+        with tempfile.TemporaryDirectory() as directorio:
+            primaria = os.path.join(directorio, 'primaria.sqlite3')
+            entorno = {
+                **os.environ,
+                'DB_ENGINE': 'django.db.backends.sqlite3',
+                'SQLITE_NAME': primaria,
+                'DB_REPLICAS': os.path.join(directorio, 'replica.sqlite3'),
+                'DB_STICKY_SEGUNDOS': '1',
+                'LOG_CONSOLA': 'False',
+                'PYTHONWARNINGS': 'ignore',
+            }
+            manage = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py')]
+            subprocess.run(manage + ['migrate', '-v', '0'], env=entorno, check=True)
+            resultado = subprocess.run(manage + ['verificar_replicas', '--worker'], env=entorno)
+        if resultado.returncode:
+            raise CommandError('El ruteo a réplicas no se comporta como se espera')
+
+    def _verificar(self):
+        from django.contrib.auth.models import User
+        from django.db import connections
+        from django.test import Client
+        from django.test.utils import override_settings
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        from api.models import Categoria
+
+        base = settings.DATABASES
+        if not settings.REPLICAS['ALIAS']:
+            raise CommandError('Falta DB_REPLICAS')
+        replica = settings.REPLICAS['ALIAS'][0]
+
+        def sincronizar():
+            connections.close_all()
+            replicar(base['default']['NAME'], base[replica]['NAME'])
+
+        Categoria.objects.create(nombre='Réplicas')
+        usuario = User.objects.create_user('replicas', password='replicas')
+        sincronizar()
+
+        autor = Client()
+        autor.force_login(usuario)
+        lector = Client()
+        # POS con JWT y sin cookie jar: descarta las cookies de cada respuesta
+        pos = Client(HTTP_AUTHORIZATION='Bearer %s' % AccessToken.for_user(usuario))
+        fallas = []
+
+        def verificar(descripcion, condicion):
+            if condicion:
+                self.stdout.write(self.style.SUCCESS(f'✓ {descripcion}'))
+            else:
+                fallas.append(descripcion)
+                self.stdout.write(self.style.ERROR(f'✗ {descripcion}'))
+
+        def nombres(cliente):
+            respuesta = cliente.get('/api/productos/')
+            pos.cookies.clear()
+            return {p['nombre'] for p in respuesta.json()}
+
+        def alta(cliente, nombre):
+            respuesta = cliente.post('/api/productos/', {
+                'nombre_producto': nombre, 'nombre_categoria': 'Réplicas', 'precio': '10.00',
+            }, content_type='application/json')
+            pos.cookies.clear()
+            return respuesta
+
+        with override_settings(THROTTLE={**settings.THROTTLE, 'TASAS': {}}):
+            verificar('El listado se lee de la réplica', 'Nuevo' not in nombres(lector))
+
+            respuesta = alta(autor, 'Nuevo')
+            verificar('El alta se escribe en la primaria', respuesta.status_code == 201)
+            verificar('La escritura deja la cookie sticky', settings.REPLICAS['COOKIE'] in respuesta.cookies)
+            verificar('Quien escribió ve su producto enseguida', 'Nuevo' in nombres(autor))
+            verificar('Los demás leen la réplica, todavía sin el producto', 'Nuevo' not in nombres(lector))
+
+            sincronizar()
+            time.sleep(settings.REPLICAS['STICKY_SEGUNDOS'] + 0.1)
+            verificar('Replicado y vencida la ventana, todos lo ven', 'Nuevo' in nombres(lector))
+            verificar('Al vencer la ventana el autor vuelve a la réplica', 'Nuevo' in nombres(autor))
+
+            respuesta = alta(pos, 'Del POS')
+            verificar('El POS con JWT escribe en la primaria', respuesta.status_code == 201)
+            verificar('El POS sin cookies ve su producto enseguida', 'Del POS' in nombres(pos))
+            verificar('Los demás todavía no lo ven', 'Del POS' not in nombres(lector))
+
+            sincronizar()
+            time.sleep(settings.REPLICAS['STICKY_SEGUNDOS'] + 0.1)
+            verificar('Al vencer la ventana el POS vuelve a la réplica', 'Del POS' in nombres(pos))
+
+        if fallas:
+            sys.exit(1)
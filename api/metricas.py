@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+# Límites (en segundos, bytes o consultas) de los buckets de cada histograma
+LIMITES_SEGUNDOS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+# nombre en Prometheus, descripción y límites de cada métrica por request
+METRICAS = {
+    'duracion': ('api_request_duration_seconds', 'Tiempo total del request', LIMITES_SEGUNDOS),
+    'db': ('api_db_duration_seconds', 'Tiempo en la base de datos por request', LIMITES_SEGUNDOS),
+    'consultas': ('api_db_queries', 'Consultas SQL por request', LIMITES_CONSULTAS),
+    'serializacion': (
+        'api_serialization_duration_seconds', 'Tiempo de render de la respuesta', LIMITES_SEGUNDOS,
+    ),
+    'bytes': ('api_response_bytes', 'Tamaño del cuerpo de la respuesta', LIMITES_BYTES),
+}
+
+CUANTILES = (0.5, 0.95, 0.99)
+
+# Estado de los pools de conexiones (comida_al_paso.db.pool), por alias
+METRICAS_POOL = {
+    'max': ('api_db_pool_max_size', 'Conexiones máximas del pool', 'gauge'),
+    'abiertas': ('api_db_pool_connections_open', 'Conexiones abiertas', 'gauge'),
+    'ociosas': ('api_db_pool_connections_idle', 'Conexiones ociosas en el pool', 'gauge'),
+    'en_uso': ('api_db_pool_connections_in_use', 'Conexiones tomadas por un request', 'gauge'),
+    'creadas': ('api_db_pool_connections_created_total', 'Conexiones abiertas contra el servidor', 'counter'),
+    'reutilizadas': ('api_db_pool_reused_total', 'Conexiones reutilizadas del pool', 'counter'),
+    'descartadas': ('api_db_pool_connections_closed_total', 'Conexiones cerradas por el pool', 'counter'),
+    'esperas': ('api_db_pool_waits_total', 'Veces que se esperó con el pool lleno', 'counter'),
+    'tiempo_espera': ('api_db_pool_wait_seconds_total', 'Tiempo esperando una conexión', 'counter'),
+    'agotado': ('api_db_pool_timeouts_total', 'Esperas que vencieron sin conexión', 'counter'),
+}
+
+
+class Histograma:
+    """Histograma de buckets fijos (acumulables al estilo Prometheus)"""
+
+    __slots__ = ('limites', 'buckets', 'total', 'suma')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.buckets = [0] * (len(limites) + 1)
+        self.total = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.buckets[bisect_left(self.limites, valor)] += 1
+        self.total += 1
+        self.suma += valor
+
+    def cuantil(self, q):
+        """Estimación por interpolación lineal dentro del bucket, como histogram_quantile()"""
+        if not self.total:
+            return None
+        objetivo = q * self.total
+        acumulado = 0
+        for i, cantidad in enumerate(self.buckets):
+            if acumulado + cantidad >= objetivo and cantidad:
+                if i == len(self.limites):
+                    return self.limites[-1]
+                inferior = self.limites[i - 1] if i else 0
+                return inferior + (self.limites[i] - inferior) * (objetivo - acumulado) / cantidad
+            acumulado += cantidad
+        return self.limites[-1]
+
+
+class Medicion:
+    """Lo que se va sumando durante un request (consultas, tiempo de DB y de render)"""
+
+    __slots__ = ('consultas', 'db', 'serializacion')
+
+    def __init__(self):
+        self.consultas = 0
+        self.db = 0.0
+        self.serializacion = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper de las conexiones
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+medicion_actual = ContextVar('medicion_actual', default=None)
+
+# Observadores de consultas del contexto actual (la Medicion del request,
+# los contadores de query_budget). Cada conexión tiene un execute_wrapper fijo
+# (ver api.signals) que los aplica: al ser una variable de contexto también
+# llegan a las consultas que las vistas async hacen con sync_to_async, en
+# otro thread y con otra conexión.
+observadores_consultas = ContextVar('observadores_consultas', default=())
+
+
+def ejecutar_observada(execute, sql, params, many, context):
+    """execute_wrapper fijo de cada conexión: pasa la consulta por los observadores del contexto"""
+    for observador in reversed(observadores_consultas.get()):
+        execute = partial(observador, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def observar_consultas(observador):
+    """Dentro del bloque cada consulta pasa por `observador` (con la firma de un execute_wrapper)"""
+    token = observadores_consultas.set(observadores_consultas.get() + (observador,))
+    try:
+        yield observador
+    finally:
+        observadores_consultas.reset(token)
+
+
+class Registro:
+    """
+    Histogramas por vista de este proceso.
+
+    Cada worker de gunicorn tiene su propio registro; /api/metrics/ muestra
+    el del worker que atiende el scrape. Por eso cada serie lleva la
+    etiqueta worker (pid): los contadores de un worker sólo crecen, y el
+    total sale de sumar por worker en Prometheus (sum without (worker)).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+
+    def observar(self, vista, valores):
+        with self._lock:
+            for metrica, valor in valores.items():
+                if valor is None:
+                    continue
+                histograma = self._histogramas.get((metrica, vista))
+                if histograma is None:
+                    histograma = self._histogramas[(metrica, vista)] = Histograma(METRICAS[metrica][2])
+                histograma.observar(valor)
+
+    def limpiar(self):
+        with self._lock:
+            self._histogramas.clear()
+
+    def resumen(self):
+        """{vista: {metrica: {'p50':.., 'p95':.., 'p99':.., 'total':..}}}"""
+        with self._lock:
+            resultado = {}
+            for (metrica, vista), histograma in self._histogramas.items():
+                datos = {'p%d' % (q * 100): histograma.cuantil(q) for q in CUANTILES}
+                datos['total'] = histograma.total
+                resultado.setdefault(vista, {})[metrica] = datos
+            return resultado
+
+    def prometheus(self):
+        """Exportación en el formato de texto de Prometheus (0.0.4)"""
+        lineas = []
+        with self._lock:
+            for metrica, (nombre, ayuda, limites) in METRICAS.items():
+                series = sorted(
+                    (vista, h) for (m, vista), h in self._histogramas.items() if m == metrica
+                )
+                lineas.append('# HELP %s %s' % (nombre, ayuda))
+                lineas.append('# TYPE %s histogram' % nombre)
+                for vista, histograma in series:
+                    etiqueta = 'vista="%s",%s' % (_escapar(vista), etiqueta_worker())
+                    acumulado = 0
+                    for limite, cantidad in zip(limites + (float('inf'),), histograma.buckets):
+                        acumulado += cantidad
+                        lineas.append('%s_bucket{%s,le="%s"} %d' % (
+                            nombre, etiqueta, _numero(limite), acumulado
+                        ))
+                    lineas.append('%s_sum{%s} %s' % (nombre, etiqueta, _numero(histograma.suma)))
+                    lineas.append('%s_count{%s} %d' % (nombre, etiqueta, histograma.total))
+
+                lineas.append('# HELP %s_quantile %s (estimado del histograma)' % (nombre, ayuda))
+                lineas.append('# TYPE %s_quantile gauge' % nombre)
+                for vista, histograma in series:
+                    for q in CUANTILES:
+                        lineas.append('%s_quantile{vista="%s",%s,quantile="%s"} %s' % (
+                            nombre, _escapar(vista), etiqueta_worker(), q, _numero(histograma.cuantil(q))
+                        ))
+        return '\n'.join(lineas) + '\n'
+
+
+def prometheus_pools(pools):
+    """Exportación de {alias: estadísticas} de los pools de conexiones"""
+    if not pools:
+        return ''
+    lineas = []
+    for clave, (nombre, ayuda, tipo) in METRICAS_POOL.items():
+        lineas.append('# HELP %s %s' % (nombre, ayuda))
+        lineas.append('# TYPE %s %s' % (nombre, tipo))
+        for alias, datos in sorted(pools.items()):
+            lineas.append('%s{alias="%s",%s} %s' % (
+                nombre, _escapar(alias), etiqueta_worker(), _numero(datos[clave])
+            ))
+    return '\n'.join(lineas) + '\n'
+
+
+def etiqueta_worker():
+    """Etiqueta del proceso que exporta (el pid cambia después del fork de gunicorn)"""
+    return 'worker="%d"' % os.getpid()
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _numero(valor):
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+registro = Registro()
@@ -0,0 +1,563 @@
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.common import CommonMiddleware
+from django.middleware.security import SecurityMiddleware
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import Throttled
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from comida_al_paso.db import router
+from . import compresion, throttling
+from .autenticacion import aid_usuario, id_usuario
+from .metricas import Medicion, medicion_actual, observar_consultas, registro
+
+logger = logging.getLogger('api.metricas')
+logger_sobrecarga = logging.getLogger('api')
+
+
+def _config():
+    return getattr(settings, 'METRICAS', {})
+
+
+class MiddlewareDual:
+    """
+    Base de los middlewares de la API: corren sync con WSGI y async con
+    ASGI. Si uno solo de la cadena fuera sync, Django correría con ASGI
+    cada request en un thread (sync_to_async) y las vistas async no
+    servirían de nada. Las subclases definen procesar (sync) y acall (async).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.acall(request)
+        return self.procesar(request)
+
+    def procesar(self, request):
+        raise NotImplementedError
+
+    async def acall(self, request):
+        raise NotImplementedError
+
+
+def resolver(request):
+    """
+    ResolverMatch del request, o None si la ruta no existe. Se resuelve una
+    sola vez por request y se guarda en el request: lo usan Metricas,
+    Sobrecarga y Throttle antes de que Django lo resuelva para la vista
+    (request.resolver_match, que se prefiere cuando ya está)
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        return match
+    try:
+        return request._resolucion
+    except AttributeError:
+        pass
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        match = None
+    request._resolucion = match
+    return match
+
+
+def nombre_vista(request):
+    """
+    Nombre de la vista resuelta: función (productos_list) o clase
+    (CategoriaViewSet). Las respuestas que corta un middleware antes de la
+    vista (429 de ThrottleMiddleware, 503 de SobrecargaMiddleware) no
+    tienen resolver_match: se usa la resolución de los middlewares
+    """
+    match = resolver(request)
+    if match is None:
+        return 'sin_ruta'
+    funcion = match.func
+    clase = getattr(funcion, 'cls', None) or getattr(funcion, 'view_class', None)
+    if clase is not None:
+        return clase.__name__
+    return getattr(funcion, '__name__', match.view_name or 'desconocida')
+
+
+class MetricasMiddleware(MiddlewareDual):
+    """
+    Mide cada request: tiempo total, tiempo y cantidad de consultas SQL,
+    tiempo de render (api.renderers) y bytes de la respuesta.
+
+    Los valores se agregan en histogramas por vista (ver /api/metrics/), se
+    devuelven en la cabecera Server-Timing y se registran en el logger
+    api.metricas (una línea JSON con api.registro.FormatoJSON). Cada
+    consulta pasa por el execute_wrapper fijo de la conexión
+    (api.metricas.ejecutar_observada) y un par de llamadas a perf_counter();
+    con ASGI también se cuentan las que corren con sync_to_async. Las rutas
+    EXCLUIDAS (/healthz) no se miden.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = _config()
+        self.activo = config.get('ACTIVO', True)
+        self.server_timing = config.get('SERVER_TIMING', True)
+        self.log = config.get('LOG', True)
+        self.excluidas = frozenset(config.get('EXCLUIDAS', ()))
+
+    def procesar(self, request):
+        if not self.activo or request.path_info in self.excluidas:
+            return self.get_response(request)
+
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with observar_consultas(medicion):
+                respuesta = self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        return self._registrar(request, respuesta, medicion, time.perf_counter() - inicio)
+
+    async def acall(self, request):
+        if not self.activo or request.path_info in self.excluidas:
+            return await self.get_response(request)
+
+        medicion = Medicion()
+        token = medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            with observar_consultas(medicion):
+                respuesta = await self.get_response(request)
+        finally:
+            medicion_actual.reset(token)
+        return self._registrar(request, respuesta, medicion, time.perf_counter() - inicio)
+
+    def _registrar(self, request, respuesta, medicion, duracion):
+        vista = nombre_vista(request)
+        tamanio = None if respuesta.streaming else len(respuesta.content)
+        registro.observar(vista, {
+            'duracion': duracion,
+            'db': medicion.db,
+            'consultas': medicion.consultas,
+            'serializacion': medicion.serializacion,
+            'bytes': tamanio,
+        })
+
+        if self.server_timing:
+            respuesta['Server-Timing'] = (
+                'total;dur=%.2f, db;dur=%.2f;desc="%d consultas", ser;dur=%.2f' % (
+                    duracion * 1000, medicion.db * 1000, medicion.consultas,
+                    medicion.serializacion * 1000,
+                )
+            )
+
+        if self.log and logger.isEnabledFor(logging.INFO):
+            # Los campos van en extra: api.registro.FormatoJSON los emite como JSON
+            logger.info(
+                '%s %s %d %.2fms', request.method, request.path, respuesta.status_code,
+                duracion * 1000,
+                extra={
+                    'metodo': request.method,
+                    'ruta': request.path,
+                    'vista': vista,
+                    'estado': respuesta.status_code,
+                    'duracion_ms': round(duracion * 1000, 2),
+                    'db_ms': round(medicion.db * 1000, 2),
+                    'consultas': medicion.consultas,
+                    'serializacion_ms': round(medicion.serializacion * 1000, 2),
+                    'bytes': tamanio,
+                },
+            )
+        return respuesta
+
+
+class CompresionMiddleware(MiddlewareDual):
+    """
+    Comprime con brotli o gzip (según Accept-Encoding) las respuestas de
+    datos de la API: JSON, la representación compacta, MessagePack, NDJSON
+    y CSV (ver api/compresion.py).
+
+    Va después de MetricasMiddleware, así las métricas miden los bytes que
+    salen y el tiempo de comprimir. Las respuestas en streaming (SSE,
+    ?stream=1) no se comprimen: el cliente tiene que recibir cada evento al
+    momento. Como Django con GZipMiddleware, el ETag comprimido pasa a ser
+    débil; los 304 siguen funcionando.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = getattr(settings, 'COMPRESION', {})
+        self.activo = config.get('ACTIVO', True)
+        self.min_bytes = config.get('MIN_BYTES', 512)
+
+    def procesar(self, request):
+        return self._comprimir(request, self.get_response(request))
+
+    async def acall(self, request):
+        return self._comprimir(request, await self.get_response(request))
+
+    def _comprimir(self, request, respuesta):
+        if not self.activo or respuesta.streaming or respuesta.has_header('Content-Encoding'):
+            return respuesta
+        if not compresion.comprimible(respuesta.get('Content-Type', '')):
+            return respuesta
+
+        patch_vary_headers(respuesta, ('Accept-Encoding',))
+        if len(respuesta.content) < self.min_bytes:
+            return respuesta
+        codificacion = compresion.negociar(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if codificacion is None:
+            return respuesta
+
+        etag = respuesta.get('ETag')
+        contenido = compresion.comprimir_respuesta(respuesta.content, codificacion, etag)
+        if len(contenido) >= len(respuesta.content):
+            return respuesta
+        respuesta.content = contenido
+        respuesta['Content-Length'] = str(len(contenido))
+        respuesta['Content-Encoding'] = codificacion
+        if etag and etag.startswith('"'):
+            respuesta['ETag'] = 'W/' + etag
+        return respuesta
+
+
+def espera_en_cola(request):
+    """
+    Segundos que el request esperó antes de llegar al worker, según la
+    cabecera X-Request-Start del proxy ('t=<epoch>' en s, ms o µs).
+    """
+    valor = request.META.get('HTTP_X_REQUEST_START')
+    if not valor:
+        return None
+    try:
+        inicio = float(valor.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    if inicio > 1e14:
+        inicio /= 1e6
+    elif inicio > 1e11:
+        inicio /= 1e3
+    return max(time.time() - inicio, 0.0)
+
+
+class SobrecargaMiddleware(MiddlewareDual):
+    """
+    Descarta requests con 503 y Retry-After cuando el worker está saturado,
+    para que el menú público mantenga su latencia.
+
+    Señales: requests en curso en el proceso (con workers de threads o ASGI)
+    y espera en la cola del proxy (X-Request-Start; con workers sync es la
+    única que importa). El límite de requests en curso es adaptativo: sube
+    de a poco mientras los requests terminan dentro de OBJETIVO_MS y baja un
+    10% cuando no. Las lecturas de las rutas PRIORITARIAS sólo se descartan
+    al llegar a MAX_EN_CURSO o al doble de MAX_ESPERA_MS; las EXCLUIDAS
+    (/healthz) pasan siempre, sin contar como en curso.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = getattr(settings, 'SOBRECARGA', {})
+        self.activo = config.get('ACTIVO', False)
+        self.max_en_curso = config.get('MAX_EN_CURSO', 64)
+        self.min_en_curso = config.get('MIN_EN_CURSO', 4)
+        self.max_espera = config.get('MAX_ESPERA_MS', 500) / 1000
+        self.objetivo = config.get('OBJETIVO_MS', 250) / 1000
+        self.retry_after = config.get('RETRY_AFTER', 2)
+        self.prioritarias = frozenset(config.get('PRIORITARIAS', ()))
+        self.excluidas = frozenset(config.get('EXCLUIDAS', ()))
+        self.limite = float(self.max_en_curso)
+        self.en_curso = 0
+        self.rechazados = 0
+        self._lock = threading.Lock()
+
+    def procesar(self, request):
+        if not self.activo or request.path_info in self.excluidas:
+            return self.get_response(request)
+
+        en_curso = self._entrar()
+        try:
+            if self._descartar(request, en_curso):
+                return self._rechazo(request, en_curso)
+            inicio = time.perf_counter()
+            respuesta = self.get_response(request)
+            self._ajustar(time.perf_counter() - inicio)
+            return respuesta
+        finally:
+            self._salir()
+
+    async def acall(self, request):
+        if not self.activo or request.path_info in self.excluidas:
+            return await self.get_response(request)
+
+        en_curso = self._entrar()
+        try:
+            if self._descartar(request, en_curso):
+                return self._rechazo(request, en_curso)
+            inicio = time.perf_counter()
+            respuesta = await self.get_response(request)
+            self._ajustar(time.perf_counter() - inicio)
+            return respuesta
+        finally:
+            self._salir()
+
+    def _entrar(self):
+        with self._lock:
+            self.en_curso += 1
+            return self.en_curso
+
+    def _salir(self):
+        with self._lock:
+            self.en_curso -= 1
+
+    def _descartar(self, request, en_curso):
+        espera = espera_en_cola(request) or 0.0
+        if en_curso <= self.limite and espera <= self.max_espera:
+            return False
+        if self._es_prioritaria(request):
+            return en_curso > self.max_en_curso or espera > 2 * self.max_espera
+        return True
+
+    def _es_prioritaria(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        match = resolver(request)
+        return match is not None and match.url_name in self.prioritarias
+
+    def _ajustar(self, duracion):
+        # AIMD: +1/limite por request rápido, -10% por request lento
+        with self._lock:
+            if duracion <= self.objetivo:
+                self.limite = min(float(self.max_en_curso), self.limite + 1 / self.limite)
+            else:
+                self.limite = max(float(self.min_en_curso), self.limite * 0.9)
+
+    def _rechazo(self, request, en_curso):
+        with self._lock:
+            self.rechazados += 1
+            rechazados, limite = self.rechazados, self.limite
+        if rechazados % 100 == 1:
+            logger_sobrecarga.warning(
+                "Sobrecarga: %d requests rechazados (en curso %d, límite %.1f)",
+                rechazados, en_curso, limite,
+            )
+        respuesta = JsonResponse(
+            {'error': 'Servicio sobrecargado, reintentar más tarde'}, status=503
+        )
+        respuesta['Retry-After'] = str(self.retry_after)
+        return respuesta
+
+
+class EstaticosMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware que también corre async (WhiteNoise sólo es sync).
+
+    Sin autorefresh los archivos se buscan en el diccionario en memoria de
+    WhiteNoise; sólo servir un archivo (abrirlo, stat) va a un thread. Los
+    requests de la API pasan sin salir del event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.acall(request)
+        return super().__call__(request)
+
+    async def acall(self, request):
+        if self.autorefresh:
+            # Desarrollo (DEBUG): se busca en disco
+            archivo = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            archivo = self.files.get(request.path_info)
+        if archivo is not None:
+            return await sync_to_async(self.serve)(archivo, request)
+        return await self.get_response(request)
+
+
+class EnElLoopMixin:
+    """
+    Para middlewares de Django cuyos process_request/process_response no
+    hacen I/O (sólo leen cabeceras y cookies): con ASGI los llama en el
+    event loop. MiddlewareMixin los pasa cada uno por sync_to_async, un
+    salto a thread por método y por request. Session y Messages quedan
+    como están: pueden leer o guardar la sesión en la base, y CSRF también
+    (CSRF_USE_SESSIONS), además de ser el que decide qué se rechaza.
+
+    Sólo se usan con SERVER_MODE=asgi (settings.EN_EL_LOOP); con WSGI no
+    cambian nada y van los de Django.
+    """
+
+    async def __acall__(self, request):
+        respuesta = None
+        if hasattr(self, 'process_request'):
+            respuesta = self.process_request(request)
+        respuesta = respuesta or await self.get_response(request)
+        if hasattr(self, 'process_response'):
+            respuesta = self.process_response(request, respuesta)
+        return respuesta
+
+
+class SeguridadMiddleware(EnElLoopMixin, SecurityMiddleware):
+    pass
+
+
+class ComunMiddleware(EnElLoopMixin, CommonMiddleware):
+    pass
+
+
+class AutenticacionMiddleware(EnElLoopMixin, AuthenticationMiddleware):
+    """request.user es lazy: la consulta del usuario no ocurre acá"""
+
+
+class XFrameMiddleware(EnElLoopMixin, XFrameOptionsMiddleware):
+    pass
+
+
+class ThrottleMiddleware(MiddlewareDual):
+    """
+    Aplica los token buckets de api.throttling antes de llegar a la vista.
+
+    Los throttles de DRF corren dentro de la vista: no los alcanzan las
+    respuestas de cache_catalogo (HIT) ni los 304 de condicional, ni las
+    vistas async de api/views_async.py. Este middleware consume del mismo
+    bucket (misma regla e identificador) para todas las rutas de PREFIJOS y
+    marca el request para que los throttles de DRF no lo cuenten de nuevo.
+    Va después de SessionMiddleware para identificar a los usuarios con sesión.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.prefijos = tuple(getattr(settings, 'THROTTLE', {}).get('PREFIJOS', ('/api/',)))
+
+    def procesar(self, request):
+        if not request.path_info.startswith(self.prefijos):
+            return self.get_response(request)
+        respuesta = self._limitar(request, throttling.identificar(request, id_usuario(request)))
+        if respuesta is not None:
+            return respuesta
+        return self.get_response(request)
+
+    async def acall(self, request):
+        if not request.path_info.startswith(self.prefijos):
+            return await self.get_response(request)
+        respuesta = self._limitar(request, throttling.identificar(request, await aid_usuario(request)))
+        if respuesta is not None:
+            return respuesta
+        return await self.get_response(request)
+
+    def _limitar(self, request, cliente):
+        match = resolver(request)
+        url_name = match.url_name if match is not None else None
+        scope, ident = cliente
+        regla, tasa = throttling.buscar_tasa(request.method, url_name, scope)
+        request.throttle_revisado = True
+        if tasa is None:
+            return None
+        permitido, espera = throttling.consumir(regla, tasa, ident)
+        if permitido:
+            return None
+        # Mismo cuerpo y Retry-After que el 429 de DRF
+        error = Throttled(espera)
+        respuesta = JsonResponse({'detail': error.detail}, status=error.status_code)
+        respuesta['Retry-After'] = '%d' % error.wait
+        return respuesta
+
+
+class ReplicasMiddleware(MiddlewareDual):
+    """
+    Decide de dónde lee cada request cuando hay réplicas (DB_REPLICAS).
+
+    GET/HEAD/OPTIONS leen de una réplica; los requests que escriben, de la
+    primaria. Después de una escritura exitosa el cliente lee de la
+    primaria por STICKY_SEGUNDOS: quien crea un producto lo ve en el
+    listado aunque la réplica todavía no lo tenga. La ventana tiene que
+    cubrir el retraso de la replicación.
+
+    La ventana se guarda por usuario (id del JWT o de la sesión) en
+    CACHES[CACHE_ALIAS], así vale para los clientes sin cookies (POS,
+    kioscos con JWT) y para el frontend en otro dominio; con varios workers
+    ese cache tiene que ser compartido (system check api.E002). La cookie queda
+    para los clientes anónimos que la devuelven. Va después de
+    SessionMiddleware.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        config = getattr(settings, 'REPLICAS', {})
+        self.activo = bool(config.get('ALIAS'))
+        self.ventana = router.ventana()
+        self.cookie = config.get('COOKIE', 'db_primaria')
+        self.cache = caches[config.get('CACHE_ALIAS', 'default')]
+
+    def procesar(self, request):
+        if not self.activo:
+            return self.get_response(request)
+
+        lectura = request.method in ('GET', 'HEAD', 'OPTIONS')
+        usuario = id_usuario(request)
+        token = router.lecturas_en_replica.set(lectura and not self._reciente(request, usuario))
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            router.lecturas_en_replica.reset(token)
+
+        if not lectura and respuesta.status_code < 400:
+            self._marcar(request, respuesta, usuario)
+        return respuesta
+
+    async def acall(self, request):
+        if not self.activo:
+            return await self.get_response(request)
+
+        lectura = request.method in ('GET', 'HEAD', 'OPTIONS')
+        usuario = await aid_usuario(request)
+        # La variable de contexto llega a la vista y a sus sync_to_async
+        token = router.lecturas_en_replica.set(lectura and not self._reciente(request, usuario))
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            router.lecturas_en_replica.reset(token)
+
+        if not lectura and respuesta.status_code < 400:
+            self._marcar(request, respuesta, usuario)
+        return respuesta
+
+    def _clave(self, usuario):
+        return 'replicas:primaria:%s' % usuario
+
+    def _marcar(self, request, respuesta, usuario):
+        vence = time.time() + self.ventana
+        if usuario is not None:
+            self.cache.set(self._clave(usuario), vence, self.ventana)
+        respuesta.set_cookie(
+            self.cookie, '%d' % vence, max_age=self.ventana,
+            httponly=True, samesite='Lax', secure=request.is_secure(),
+        )
+
+    def _reciente(self, request, usuario):
+        """Si el usuario (o, sin usuario, el cliente de la cookie) escribió dentro de la ventana"""
+        if usuario is not None and (self.cache.get(self._clave(usuario)) or 0) > time.time():
+            return True
+        try:
+            return float(request.COOKIES.get(self.cookie, 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+CAMPOS = ('descripcion', 'precio', 'stock', 'disponible')
+
+
+def quitar_duplicados(apps, schema_editor):
+    """
+    Deja un solo producto por (categoria, nombre) para que el índice único se
+    pueda crear: se conserva la fila más vieja (id más bajo, el que ya conocen
+    los clientes) con los datos de la última modificada, y se borran las demás.
+    Todavía no hay pedidos que apunten a productos en este punto.
+    """
+    Producto = apps.get_model('api', 'Producto')
+    productos = Producto.objects.using(schema_editor.connection.alias)
+    repetidos = (
+        productos.order_by().values('categoria', 'nombre')
+        .annotate(filas=Count('id')).filter(filas__gt=1)
+    )
+    for clave in repetidos:
+        filas = list(productos.filter(categoria=clave['categoria'], nombre=clave['nombre']).order_by('id'))
+        conservada, ultima = filas[0], max(filas, key=lambda p: (p.updated_at, p.id))
+        for campo in CAMPOS:
+            setattr(conservada, campo, getattr(ultima, campo))
+        conservada.save(update_fields=CAMPOS)
+        productos.filter(pk__in=[p.pk for p in filas[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='producto',
+            constraint=models.UniqueConstraint(fields=('categoria', 'nombre'), name='producto_unico_por_categoria'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_producto_unico_por_categoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaMenu',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(max_length=255, unique=True)),
+                ('hash', models.CharField(max_length=64)),
+                ('aplicado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
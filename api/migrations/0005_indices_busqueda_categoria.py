@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:41
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Lower
+import django.db.models.functions.text
+
+CAMPOS_PRODUCTO = ('descripcion', 'precio', 'stock', 'disponible')
+
+
+def unir_categorias_repetidas(apps, schema_editor):
+    """
+    Deja una sola categoría por LOWER(nombre) para que el índice único se pueda
+    crear: se conserva la más vieja (id más bajo) y sus productos pasan a
+    ella. Si los dos tienen un producto con el mismo nombre queda uno solo,
+    como en 0003. Todavía no hay pedidos que apunten a productos.
+    """
+    Categoria = apps.get_model('api', 'Categoria')
+    Producto = apps.get_model('api', 'Producto')
+    alias = schema_editor.connection.alias
+    categorias = Categoria.objects.using(alias).annotate(clave=Lower('nombre'))
+    productos = Producto.objects.using(alias)
+    repetidas = categorias.order_by().values('clave').annotate(filas=Count('id')).filter(filas__gt=1)
+    for grupo in repetidas:
+        filas = list(categorias.filter(clave=grupo['clave']).order_by('id'))
+        conservada, sobrantes = filas[0], filas[1:]
+        if not conservada.descripcion:
+            # La descripción de una de las que se borran, si la conservada no tiene
+            conservada.descripcion = next((c.descripcion for c in sobrantes if c.descripcion), None)
+            conservada.save(update_fields=['descripcion'])
+        for categoria in sobrantes:
+            for producto in productos.filter(categoria=categoria):
+                igual = productos.filter(categoria=conservada, nombre=producto.nombre).first()
+                if igual is None:
+                    producto.categoria = conservada
+                    producto.save(update_fields=['categoria'])
+                    continue
+                viejo, nuevo = sorted((igual, producto), key=lambda p: p.id)
+                ultimo = max((igual, producto), key=lambda p: (p.updated_at, p.id))
+                for campo in CAMPOS_PRODUCTO:
+                    setattr(viejo, campo, getattr(ultimo, campo))
+                viejo.categoria = conservada
+                nuevo.delete()
+                viejo.save(update_fields=CAMPOS_PRODUCTO + ('categoria',))
+        Categoria.objects.using(alias).filter(pk__in=[c.pk for c in sobrantes]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_cargamenu'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['categoria', 'disponible'], name='producto_cat_disp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['created_at', 'id'], name='producto_created_id_idx'),
+        ),
+        migrations.RunPython(unir_categorias_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='categoria',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('nombre'), name='categoria_nombre_lower_unico'),
+        ),
+    ]
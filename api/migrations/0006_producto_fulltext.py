@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+INDICE = 'producto_busqueda_ft'
+
+
+def crear_fulltext(apps, schema_editor):
+    # Sólo MySQL: lo usa la búsqueda con BUSQUEDA['MOTOR'] = 'fulltext'
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    Producto = apps.get_model('api', 'Producto')
+    schema_editor.execute(
+        'CREATE FULLTEXT INDEX %s ON %s (nombre, descripcion)' % (
+            schema_editor.quote_name(INDICE),
+            schema_editor.quote_name(Producto._meta.db_table),
+        )
+    )
+
+
+def borrar_fulltext(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    Producto = apps.get_model('api', 'Producto')
+    schema_editor.execute(
+        'DROP INDEX %s ON %s' % (
+            schema_editor.quote_name(INDICE),
+            schema_editor.quote_name(Producto._meta.db_table),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_indices_busqueda_categoria'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_fulltext, borrar_fulltext),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_producto_fulltext'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='producto',
+            name='categoria',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='productos', to='api.categoria'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['precio', 'id'], name='producto_precio_id_idx'),
+        ),
+    ]
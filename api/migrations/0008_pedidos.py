@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0007_indices_precio_y_categoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('referencia', models.CharField(blank=True, max_length=64, null=True)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pedidos', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PedidoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=200)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('precio_unitario', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='api.pedido')),
+                ('producto', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items_pedido', to='api.producto')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pedido',
+            constraint=models.UniqueConstraint(fields=('usuario', 'referencia'), name='pedido_referencia_unica_por_usuario'),
+        ),
+    ]
@@ -1,20 +1,121 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Lower
+
+
+class CategoriaQuerySet(models.QuerySet):
+    def por_nombre(self, nombre):
+        """Búsqueda sin distinguir mayúsculas que usa el índice sobre LOWER(nombre)"""
+        return self.filter(nombre__lower=Lower(Value(nombre)))
+
+    def por_nombres(self, nombres):
+        """por_nombre para varios nombres en una sola consulta"""
+        return self.filter(nombre__lower__in=[Lower(Value(nombre)) for nombre in nombres])
+
+
+class ProductoQuerySet(models.QuerySet):
+    def de_categoria(self, nombre):
+        return self.filter(categoria__nombre__lower=Lower(Value(nombre)))
+
 
 class Categoria(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
     descripcion = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CategoriaQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # iexact no puede usar el índice único de nombre en MySQL/Postgres;
+            # las búsquedas por categoría comparan LOWER(nombre) contra este índice.
+            # Índice sobre una expresión: en MySQL requiere 8.0.13 o posterior
+            models.UniqueConstraint(Lower('nombre'), name='categoria_nombre_lower_unico'),
+        ]
 
     def __str__(self):
         return self.nombre
 
+
+Categoria._meta.get_field('nombre').register_lookup(Lower)
+
+
 class Producto(models.Model):
     nombre = models.CharField(max_length=200)
     descripcion = models.TextField(blank=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
-    categoria = models.ForeignKey(Categoria, on_delete=models.CASCADE, related_name='productos')
+    # Sin índice propio: producto_cat_disp_idx y producto_unico_por_categoria
+    # empiezan por categoria y ya cubren las búsquedas por categoría
+    categoria = models.ForeignKey(
+        Categoria, on_delete=models.CASCADE, related_name='productos', db_index=False
+    )
     stock = models.IntegerField(default=0)
     disponible = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductoQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['categoria', 'disponible'], name='producto_cat_disp_idx'),
+            models.Index(fields=['created_at', 'id'], name='producto_created_id_idx'),
+            # Filtros precio_min/precio_max y ?ordering=precio del listado
+            models.Index(fields=['precio', 'id'], name='producto_precio_id_idx'),
+        ]
+        constraints = [
+            # Clave natural para las importaciones masivas (upsert)
+            models.UniqueConstraint(
+                fields=['categoria', 'nombre'], name='producto_unico_por_categoria'
+            ),
+        ]
 
     def __str__(self):
         return self.nombre
+
+
+class CargaMenu(models.Model):
+    """Último menú aplicado por load_menu_data, para no reescribir datos sin cambios"""
+    origen = models.CharField(max_length=255, unique=True)
+    hash = models.CharField(max_length=64)
+    aplicado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.origen
+
+
+class Pedido(models.Model):
+    """Pedido de un punto de venta; los items guardan el precio del momento"""
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='pedidos'
+    )
+    # Identificador del pedido en el POS: reintentar con la misma referencia
+    # devuelve el pedido ya creado en lugar de descontar stock dos veces
+    referencia = models.CharField(max_length=64, null=True, blank=True)
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario', 'referencia'], name='pedido_referencia_unica_por_usuario'
+            ),
+        ]
+
+    def __str__(self):
+        return f'Pedido {self.pk}'
+
+
+class PedidoItem(models.Model):
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='items')
+    # El nombre y el precio quedan en el item aunque el producto cambie o se borre
+    producto = models.ForeignKey(
+        Producto, on_delete=models.SET_NULL, null=True, related_name='items_pedido'
+    )
+    nombre = models.CharField(max_length=200)
+    cantidad = models.PositiveIntegerField()
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f'{self.cantidad} x {self.nombre}'
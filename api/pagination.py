@@ -0,0 +1,103 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por cursor sobre (created_at, id).
+
+    Cada página se obtiene con un WHERE sobre la última fila vista, sin
+    OFFSET, así que la página 1000 cuesta lo mismo que la primera.
+    Acepta querysets de modelos o de values_list() cuyas dos últimas
+    columnas sean created_at e id.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    max_page_size = 100
+    invalid_cursor_message = 'Cursor inválido'
+
+    def is_requested(self, request):
+        """La paginación es opcional para no romper a los clientes actuales"""
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        posicion = self.decode_cursor(request)
+        if posicion is not None:
+            created_at, pk = posicion
+            queryset = queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            )
+
+        # Se pide una fila de más para saber si hay página siguiente
+        resultados = list(queryset.order_by('created_at', 'id')[:self.page_size + 1])
+        self.has_next = len(resultados) > self.page_size
+        self.page = resultados[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        created_at, pk = self.get_position(self.page[-1])
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(created_at, pk)
+        )
+
+    def get_position(self, item):
+        if isinstance(item, tuple):
+            return item[-2], item[-1]
+        return item.created_at, item.pk
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def encode_cursor(self, created_at, pk):
+        valor = '%s|%d' % (created_at.isoformat(), pk)
+        return base64.urlsafe_b64encode(valor.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            valor = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii')
+            created_at, pk = valor.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,111 @@
+"""
+Alta de pedidos de los puntos de venta (POST /api/pedidos/).
+
+Un pedido se crea en una transacción con un número fijo de consultas
+sin importar cuántos items tenga:
+  1. un UPDATE condicional que valida y descuenta el stock de todos
+     (stock.descontar),
+  2. una lectura de todos los productos (id__in) para tomar nombre y precio,
+  3. el INSERT del pedido y un bulk_create de los items.
+La lectura va después del UPDATE: las filas ya quedaron bloqueadas hasta el
+commit, así que el precio de cada item es el que tenía el producto cuando
+se descontó su stock.
+
+La referencia identifica un pedido del POS: reintentarla con los mismos
+items devuelve el pedido ya creado; con otros items es un error
+(ReferenciaReutilizada), no el pedido anterior.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from .models import Pedido, PedidoItem, Producto
+from .stock import descontar, sumar_cantidades
+
+
+class ReferenciaReutilizada(Exception):
+    def __init__(self, referencia, pedido_id):
+        self.referencia = referencia
+        self.pedido_id = pedido_id
+        super().__init__(f'La referencia {referencia} ya es del pedido {pedido_id}, con otros items')
+
+
+def crear_pedido(items, usuario=None, referencia=None):
+    """
+    (pedido, items, creado) para los (producto_id, cantidad) de items.
+
+    Con una referencia ya usada por el mismo usuario devuelve ese pedido
+    con creado=False, sin tocar el stock, o lanza ReferenciaReutilizada si
+    los items no son los mismos. Lanza ProductoInexistente,
+    ProductoNoDisponible o StockInsuficiente (y no se crea nada) si algún
+    item no se puede cumplir.
+    """
+    cantidades = sumar_cantidades(items)
+    if referencia:
+        existente = _existente(usuario, referencia, cantidades)
+        if existente is not None:
+            return (*existente, False)
+
+    try:
+        with transaction.atomic():
+            descontar(cantidades)
+            productos = {
+                fila[0]: fila for fila in Producto.objects.filter(
+                    pk__in=cantidades
+                ).values_list('pk', 'nombre', 'precio')
+            }
+
+            pedido = Pedido.objects.create(
+                usuario=usuario,
+                referencia=referencia or None,
+                total=sum(
+                    (productos[pk][2] * cantidad for pk, cantidad in cantidades.items()), Decimal('0')
+                ),
+            )
+            items_pedido = PedidoItem.objects.bulk_create([
+                PedidoItem(
+                    pedido=pedido, producto_id=pk, nombre=productos[pk][1],
+                    cantidad=cantidad, precio_unitario=productos[pk][2],
+                )
+                for pk, cantidad in cantidades.items()
+            ])
+    except IntegrityError:
+        # Dos reintentos con la misma referencia a la vez: el otro ganó
+        existente = _existente(usuario, referencia, cantidades) if referencia else None
+        if existente is None:
+            raise
+        return (*existente, False)
+    return pedido, items_pedido, True
+
+
+def _existente(usuario, referencia, cantidades):
+    """
+    (pedido, items) ya creado con esa referencia, o None. ReferenciaReutilizada
+    si sus items no son las mismas cantidades de los mismos productos
+    """
+    pedido = Pedido.objects.filter(usuario=usuario, referencia=referencia).first()
+    if pedido is None:
+        return None
+    items = list(pedido.items.all())
+    if {item.producto_id: item.cantidad for item in items} != cantidades:
+        raise ReferenciaReutilizada(referencia, pedido.pk)
+    return pedido, items
+
+
+def representar_pedido(pedido, items):
+    return {
+        'id': pedido.pk,
+        'referencia': pedido.referencia,
+        'total': '{:f}'.format(pedido.total),
+        'created_at': pedido.created_at,
+        'items': [
+            {
+                'producto': item.producto_id,
+                'nombre': item.nombre,
+                'cantidad': item.cantidad,
+                'precio_unitario': '{:f}'.format(item.precio_unitario),
+                'subtotal': '{:f}'.format(item.precio_unitario * item.cantidad),
+            }
+            for item in items
+        ],
+    }
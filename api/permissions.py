@@ -1,7 +1,24 @@
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
+
 class IsAdminOrReadOnly(BasePermission):
     def has_permission(self, request, view):
         if request.method in ('GET', 'HEAD', 'OPTIONS'):
             return True
         return request.user and request.user.is_staff
+
+
+class IsStaffOrMetricsToken(BasePermission):
+    """Staff, o un scraper que manda la cabecera X-Metricas-Token configurada"""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        esperado = getattr(settings, 'METRICAS', {}).get('TOKEN')
+        recibido = request.META.get('HTTP_X_METRICAS_TOKEN')
+        if not esperado or not recibido:
+            return False
+        return hmac.compare_digest(recibido.encode('utf-8'), esperado.encode('utf-8'))
@@ -0,0 +1,94 @@
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+from .metricas import observar_consultas
+
+logger = logging.getLogger('api')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Se superó la cantidad de consultas declarada para un bloque o vista"""
+
+
+class _Contador:
+    def __init__(self):
+        self.total = 0
+        self.sql = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        self.sql.append(sql)
+        return execute(sql, params, many, context)
+
+
+def contar_consultas():
+    """Cuenta las consultas ejecutadas en todas las conexiones dentro del bloque"""
+    return observar_consultas(_Contador())
+
+
+def _debe_fallar():
+    return getattr(settings, 'QUERY_BUDGET', {}).get('RAISE', False)
+
+
+def query_budget(max_consultas):
+    """
+    Declara la cantidad máxima de consultas de una vista.
+
+    Si la vista la supera se registra un warning, o se lanza
+    QueryBudgetExceeded cuando QUERY_BUDGET['RAISE'] está activo (tests).
+    """
+    def decorator(vista):
+        if iscoroutinefunction(vista):
+            # Vistas async: también cuenta lo que corren con sync_to_async
+            @wraps(vista)
+            async def envoltura_async(*args, **kwargs):
+                with contar_consultas() as contador:
+                    respuesta = await vista(*args, **kwargs)
+                _revisar(vista, contador, max_consultas)
+                return respuesta
+            envoltura_async.query_budget = max_consultas
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            with contar_consultas() as contador:
+                respuesta = vista(*args, **kwargs)
+            _revisar(vista, contador, max_consultas)
+            return respuesta
+        envoltura.query_budget = max_consultas
+        return envoltura
+    return decorator
+
+
+def _revisar(vista, contador, max_consultas):
+    if contador.total > max_consultas:
+        mensaje = '%s ejecutó %d consultas (presupuesto: %d)' % (
+            vista.__qualname__, contador.total, max_consultas
+        )
+        if _debe_fallar():
+            raise QueryBudgetExceeded(
+                mensaje + '\n' + '\n'.join(contador.sql)
+            )
+        logger.warning(mensaje)
+
+
+@contextmanager
+def assert_max_queries(max_consultas):
+    """
+    Helper para tests: falla si el bloque ejecuta más consultas que las permitidas.
+
+        with assert_max_queries(2):
+            client.get('/api/productos/')
+    """
+    with contar_consultas() as contador:
+        yield contador
+    if contador.total > max_consultas:
+        raise QueryBudgetExceeded(
+            'Se ejecutaron %d consultas (máximo: %d)\n%s' % (
+                contador.total, max_consultas, '\n'.join(contador.sql)
+            )
+        )
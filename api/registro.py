@@ -0,0 +1,119 @@
+"""
+Logging sin bloquear el request.
+
+Los loggers escriben en un QueueHandler que sólo encola el registro; un
+QueueListener con su propio thread lo formatea y lo escribe en la consola y
+en logs/. Se configura desde settings.LOGGING con el handler 'cola' (ver
+crear_manejador_en_cola).
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+
+# Atributos estándar de LogRecord: lo demás llega por extra= y va al JSON
+_ATRIBUTOS_RECORD = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro, con los campos pasados en extra="""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_RECORD and not clave.startswith('_'):
+                datos[clave] = valor
+        if record.exc_info:
+            datos['excepcion'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            datos['excepcion'] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorEnCola(QueueHandler):
+    """
+    QueueHandler que nunca bloquea: con la cola llena descarta el registro y
+    lo cuenta en `descartados` en lugar de esperar al writer.
+    """
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+        self.listener = None
+
+    def prepare(self, record):
+        # Igual que QueueHandler.prepare pero sin formatear con el formatter
+        # del handler: sólo se resuelven msg % args (y el traceback a texto)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+def crear_manejador_en_cola(archivo=None, formato='json', consola=True, max_bytes=10485760,
+                            backups=5, rotacion='proceso', tamanio_cola=10000):
+    """
+    Factory para settings.LOGGING ('()': 'api.registro.crear_manejador_en_cola').
+
+    Arma los handlers de destino (consola y archivo), arranca el
+    QueueListener que los atiende en segundo plano y devuelve el QueueHandler.
+
+    rotacion='proceso' rota el archivo con RotatingFileHandler: sirve con un
+    solo proceso. Con varios escribiendo el mismo archivo (workers de
+    gunicorn) cada uno rotaría por su cuenta, renombrando el archivo de los
+    otros y perdiendo registros: rotacion='externa' usa WatchedFileHandler,
+    que sólo agrega líneas y reabre el archivo cuando logrotate lo mueve.
+    """
+    if rotacion not in ('proceso', 'externa'):
+        raise ValueError("rotacion debe ser 'proceso' o 'externa'")
+    formatter = FormatoJSON() if formato == 'json' else logging.Formatter(
+        '[{levelname}] {asctime} {name} - {message}', style='{'
+    )
+
+    destinos = []
+    if consola:
+        destinos.append(logging.StreamHandler(sys.stderr))
+    if archivo:
+        os.makedirs(os.path.dirname(archivo), exist_ok=True)
+        if rotacion == 'externa':
+            destinos.append(WatchedFileHandler(archivo, encoding='utf-8'))
+        else:
+            destinos.append(RotatingFileHandler(
+                archivo, maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+            ))
+    for destino in destinos:
+        destino.setFormatter(formatter)
+
+    manejador = iniciar_cola(destinos, tamanio_cola)
+    # Al salir se vacía la cola antes de terminar el proceso
+    atexit.register(manejador.listener.stop)
+    return manejador
+
+
+def iniciar_cola(destinos, tamanio_cola=10000):
+    """ManejadorEnCola con su QueueListener ya escribiendo en los destinos"""
+    manejador = ManejadorEnCola(queue.Queue(tamanio_cola))
+    manejador.listener = QueueListener(
+        manejador.queue, *destinos, respect_handler_level=True
+    )
+    manejador.listener.start()
+    return manejador
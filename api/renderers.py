@@ -0,0 +1,112 @@
+import time
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .metricas import medicion_actual
+
+try:
+    import msgpack
+except ImportError:  # Opcional: sin msgpack no se ofrece application/msgpack
+    msgpack = None
+
+# Columnas de un producto que pasan a la tabla de categorías
+COLUMNAS_CATEGORIA = ('categoria', 'descripcion')
+
+
+def compactar_filas(filas):
+    """
+    Listado en columnas: los nombres de los campos una sola vez y cada fila
+    como lista. En los productos, cada categoría (nombre y descripción) va
+    una sola vez en "categorias" y la fila lleva su índice en lugar de
+    repetir los textos.
+
+        {"categorias": [{"nombre": ..., "descripcion": ...}],
+         "columnas": ["nombre", "categoria", "precio", "stock"],
+         "filas": [["Milanesa", 0, "10.50", 3], ...]}
+    """
+    if not filas:
+        return {'columnas': [], 'filas': []}
+    claves = list(filas[0])
+    if 'categoria' not in claves:
+        return {'columnas': claves, 'filas': [list(fila.values()) for fila in filas]}
+
+    de_categoria = [clave for clave in COLUMNAS_CATEGORIA if clave in claves]
+    columnas = [clave for clave in claves if clave not in COLUMNAS_CATEGORIA or clave == 'categoria']
+    posicion = columnas.index('categoria')
+    categorias = []
+    indices = {}
+    compactas = []
+    for fila in filas:
+        clave_categoria = tuple(fila[clave] for clave in de_categoria)
+        indice = indices.get(clave_categoria)
+        if indice is None:
+            indice = indices[clave_categoria] = len(categorias)
+            categorias.append({
+                'nombre' if clave == 'categoria' else clave: valor
+                for clave, valor in zip(de_categoria, clave_categoria)
+            })
+        valores = [fila[clave] for clave in columnas]
+        valores[posicion] = indice
+        compactas.append(valores)
+    return {'categorias': categorias, 'columnas': columnas, 'filas': compactas}
+
+
+def compactar(data):
+    """Pasa a columnas los listados (también dentro de una página); lo demás queda igual"""
+    if isinstance(data, list) and all(isinstance(fila, dict) for fila in data):
+        return compactar_filas(data)
+    if isinstance(data, dict) and isinstance(data.get('results'), list):
+        return {**data, 'results': compactar(data['results'])}
+    return data
+
+
+class RendererMedido:
+    """Mixin que suma el tiempo de render a la medición del request"""
+
+    def preparar(self, data):
+        return data
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        inicio = time.perf_counter()
+        contenido = super().render(self.preparar(data), accepted_media_type, renderer_context)
+        medicion = medicion_actual.get()
+        if medicion is not None:
+            medicion.serializacion += time.perf_counter() - inicio
+        return contenido
+
+
+class JSONRendererMedido(RendererMedido, JSONRenderer):
+    """JSONRenderer que suma su tiempo de render a la medición del request"""
+
+
+class CompactoRenderer(RendererMedido, JSONRenderer):
+    """JSON con los listados en columnas y las categorías normalizadas (ver compactar_filas)"""
+    media_type = 'application/vnd.comidaalpaso.compacto+json'
+    format = 'compacto'
+
+    def preparar(self, data):
+        return compactar(data)
+
+
+class _MessagePack(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=JSONEncoder().default, use_bin_type=True)
+
+
+class MessagePackRenderer(RendererMedido, _MessagePack):
+    """MessagePack de la representación compacta (requiere el paquete msgpack)"""
+
+    def preparar(self, data):
+        return compactar(data)
+
+
+# Tipos que piden una representación compacta (las vistas async las delegan)
+TIPOS_COMPACTOS = (CompactoRenderer.media_type, MessagePackRenderer.media_type)
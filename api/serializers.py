@@ -1,11 +1,31 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from .models import Categoria, Producto
 
 
+# Rutas fijas de api/urls.py que ocupan el lugar de productos/<categoria_nombre>/:
+# una categoría con ese nombre no se podría listar
+NOMBRES_RESERVADOS = {'bulk', 'buscar', 'cambios', 'reservar'}
+
+
 class CategoriaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Categoria
         fields = ['id', 'nombre', 'descripcion']
+        # El UniqueValidator de nombre (igualdad exacta) queda cubierto por validate_nombre
+        extra_kwargs = {'nombre': {'validators': []}}
+
+    def validate_nombre(self, nombre):
+        if nombre.lower() in NOMBRES_RESERVADOS:
+            raise serializers.ValidationError('Ese nombre está reservado para una ruta de productos')
+        # categoria_nombre_lower_unico: 'minutas' choca con 'Minutas'
+        existentes = Categoria.objects.por_nombre(nombre)
+        if self.instance is not None:
+            existentes = existentes.exclude(pk=self.instance.pk)
+        if existentes.exists():
+            raise serializers.ValidationError('Ya existe una categoría con ese nombre')
+        return nombre
 
 
 class ProductoSerializer(serializers.ModelSerializer):
@@ -20,6 +40,76 @@ class ProductoSerializer(serializers.ModelSerializer):
         fields = ['nombre', 'categoria', 'precio', 'stock', 'descripcion']
 
 
+# Camino rápido de lectura: mismo resultado que ProductoSerializer(many=True).data
+# pero leyendo sólo las columnas necesarias con values_list(), sin instanciar
+# modelos ni recorrer los campos de DRF por cada fila.
+PRODUCTO_COLUMNAS = (
+    ('nombre', 'nombre'),
+    ('categoria', 'categoria__nombre'),
+    ('precio', 'precio'),
+    ('stock', 'stock'),
+    ('descripcion', 'categoria__descripcion'),
+)
+CENTAVOS = Decimal('0.01')
+
+# Campos que se pueden pedir con ?fields= (los del listado más id y disponible)
+CAMPOS_PRODUCTO = {
+    'id': 'id',
+    **dict(PRODUCTO_COLUMNAS),
+    'disponible': 'disponible',
+}
+
+
+def productos_values(queryset, *extra, campos=None):
+    """
+    values_list() con las columnas del listado de productos (y las extra al final).
+
+    Con campos sólo se leen esas columnas: sin 'categoria' ni 'descripcion'
+    no hace falta el JOIN con categorías.
+    """
+    if campos is None:
+        columnas = [columna for _, columna in PRODUCTO_COLUMNAS]
+    else:
+        columnas = [CAMPOS_PRODUCTO[campo] for campo in campos]
+    return queryset.values_list(*columnas, *extra)
+
+
+def _precio(precio):
+    # Igual que DecimalField(decimal_places=2) con COERCE_DECIMAL_TO_STRING
+    return '{:f}'.format(precio.quantize(CENTAVOS))
+
+
+def representar_producto(fila):
+    """Convierte una fila de productos_values() en el dict de ProductoSerializer"""
+    nombre, categoria, precio, stock, descripcion = fila[:5]
+    return {
+        'nombre': nombre,
+        'categoria': categoria,
+        'precio': _precio(precio),
+        'stock': stock,
+        'descripcion': descripcion,
+    }
+
+
+def representador(campos=None):
+    """Función que convierte filas de productos_values(campos=campos) en dicts"""
+    if campos is None:
+        return representar_producto
+    con_precio = 'precio' in campos
+
+    def representar(fila):
+        datos = dict(zip(campos, fila))
+        if con_precio:
+            datos['precio'] = _precio(datos['precio'])
+        return datos
+    return representar
+
+
+def representar_productos(filas, campos=None):
+    representar = representador(campos)
+    return [representar(fila) for fila in filas]
+
+
 class ProductoCreateSerializer(serializers.Serializer):
     nombre_producto = serializers.CharField(max_length=200)
     nombre_categoria = serializers.CharField(max_length=100)
@@ -33,7 +123,7 @@ class ProductoCreateSerializer(serializers.Serializer):
         stock = validated_data.get('stock', 0)
         
         try:
-            categoria = Categoria.objects.get(nombre__iexact=nombre_categoria)
+            categoria = Categoria.objects.por_nombre(nombre_categoria).get()
         except Categoria.DoesNotExist:
             raise serializers.ValidationError(
                 {'error': 'Categoría no encontrada'}
@@ -45,4 +135,21 @@ class ProductoCreateSerializer(serializers.Serializer):
             precio=precio,
             stock=stock
         )
-        return producto
\ No newline at end of file
+        return producto
+
+
+class ReservaSerializer(serializers.Serializer):
+    cantidad = serializers.IntegerField(min_value=1, default=1)
+
+
+class ReservaItemSerializer(ReservaSerializer):
+    producto = serializers.IntegerField(min_value=1)
+
+
+class ReservaLoteSerializer(serializers.Serializer):
+    items = ReservaItemSerializer(many=True, allow_empty=False)
+
+
+class PedidoSerializer(serializers.Serializer):
+    referencia = serializers.CharField(max_length=64, required=False, allow_blank=True)
+    items = ReservaItemSerializer(many=True, allow_empty=False, max_length=200)
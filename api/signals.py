@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import autenticacion, busqueda, cambios, snapshot
+from .cache import incrementar_version
+from .metricas import ejecutar_observada
+from .models import Categoria, Producto
+
+# Lo envían las escrituras masivas (bulk_create, update()) que no disparan
+# post_save/post_delete. sender es el modelo afectado; campos (opcional) son
+# las columnas modificadas, si se conocen, y modificado (opcional) el
+# updated_at que se les puso.
+catalogo_modificado = Signal()
+
+
+def _tabla(modelo):
+    return modelo._meta.model_name
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Producto)
+@receiver(catalogo_modificado)
+def invalidar_cache_catalogo(sender, **kwargs):
+    tabla = _tabla(sender)
+    transaction.on_commit(lambda: incrementar_version(tabla))
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Producto)
+@receiver(catalogo_modificado)
+def invalidar_snapshot(sender, **kwargs):
+    transaction.on_commit(snapshot.motor.invalidar)
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Producto)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Producto)
+@receiver(catalogo_modificado)
+def avisar_feed_cambios(sender, **kwargs):
+    transaction.on_commit(cambios.hub.invalidar)
+
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, created=False, **kwargs):
+    if not busqueda.motor.construido():
+        return
+    datos = (instance.pk, instance.nombre, instance.descripcion, instance.categoria_id)
+    modificado = instance.updated_at
+
+    def actualizar():
+        busqueda.motor.indice.actualizar_producto(*datos)
+        busqueda.motor.cambio_local(Producto, modificado, diferencia=1 if created else 0)
+    transaction.on_commit(actualizar)
+
+
+@receiver(post_delete, sender=Producto)
+def desindexar_producto(sender, instance, **kwargs):
+    if not busqueda.motor.construido():
+        return
+    pk = instance.pk
+
+    def quitar():
+        busqueda.motor.indice.quitar_producto(pk)
+        busqueda.motor.cambio_local(Producto, diferencia=-1)
+    transaction.on_commit(quitar)
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, created=False, **kwargs):
+    if not busqueda.motor.construido():
+        return
+    datos = (instance.pk, instance.nombre)
+    modificado = instance.updated_at
+
+    def actualizar():
+        busqueda.motor.indice.actualizar_categoria(*datos)
+        busqueda.motor.cambio_local(Categoria, modificado, diferencia=1 if created else 0)
+    transaction.on_commit(actualizar)
+
+
+@receiver(post_delete, sender=Categoria)
+def desindexar_categoria(sender, instance, **kwargs):
+    if not busqueda.motor.construido():
+        return
+    pk = instance.pk
+
+    def quitar():
+        busqueda.motor.indice.quitar_categoria(pk)
+        busqueda.motor.cambio_local(Categoria, diferencia=-1)
+    transaction.on_commit(quitar)
+
+
+@receiver(catalogo_modificado)
+def invalidar_indice_busqueda(sender, campos=None, modificado=None, **kwargs):
+    if campos is not None and not set(campos) & busqueda.CAMPOS_INDEXADOS:
+        # p. ej. reservas de stock: el índice sigue valiendo. Sin `modificado`
+        # (el updated_at escrito) el próximo chequeo no la reconoce y reconstruye
+        transaction.on_commit(lambda: busqueda.motor.cambio_local(sender, modificado))
+        return
+    # Las escrituras masivas no dicen qué filas cambiaron: se reconstruye
+    transaction.on_commit(busqueda.motor.invalidar)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidar_usuario_jwt(sender, instance, **kwargs):
+    # Contraseña, is_active o permisos pueden haber cambiado. Se borra ya y
+    # también al confirmar, por si otro request lo volvió a cachear en el medio
+    autenticacion.usuarios.invalidar(instance.pk)
+    transaction.on_commit(lambda: autenticacion.usuarios.invalidar(instance.pk))
+
+
+@receiver(connection_created)
+def observar_conexion(sender, connection, **kwargs):
+    """Agrega a cada conexión el execute_wrapper de api.metricas (métricas y query_budget)"""
+    # Al principio: los execute_wrapper() temporales se sacan con pop()
+    if ejecutar_observada not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, ejecutar_observada)
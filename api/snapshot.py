@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from types import MappingProxyType
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .conditional import AGREGADOS_PRODUCTOS, estado_productos
+from .models import Categoria, Producto
+from .serializers import productos_values, representar_producto
+
+logger = logging.getLogger('api')
+
+# estado_productos de una categoría que no existe
+ESTADO_VACIO = MappingProxyType({
+    **dict.fromkeys(AGREGADOS_PRODUCTOS), 'total_categorias': 0, 'total_productos': 0,
+})
+
+
+class CategoriaRecord:
+    __slots__ = ('id', 'nombre', 'descripcion')
+
+    def __init__(self, id, nombre, descripcion):
+        self.id = id
+        self.nombre = nombre
+        self.descripcion = descripcion
+
+
+class ProductoRecord:
+    __slots__ = ('id', 'nombre', 'categoria_id', 'precio', 'stock', 'disponible')
+
+    def __init__(self, id, nombre, categoria_id, precio, stock, disponible):
+        self.id = id
+        self.nombre = nombre
+        self.categoria_id = categoria_id
+        self.precio = precio
+        self.stock = stock
+        self.disponible = disponible
+
+
+class MenuSnapshot:
+    """
+    Foto inmutable del menú completo con el JSON de cada listado ya codificado.
+
+    Los listados se generan con el mismo camino rápido y JSONRenderer que
+    las vistas, así que los bytes son idénticos a los de las vistas sin snapshot.
+    `estado` es el de estado_productos con el que se construyó; el de cada
+    categoría se consulta antes que los datos, así que lo servido nunca es
+    más viejo que el estado que lo identifica.
+    """
+    __slots__ = (
+        'estado', 'categorias', 'productos', 'categorias_por_nombre',
+        'json_productos', '_json_por_categoria', '_estado_por_categoria',
+    )
+
+    def __init__(self, estado):
+        renderer = JSONRenderer()
+        estado_por_categoria = {
+            fila.pop('id'): fila
+            for fila in Categoria.objects.values('id').annotate(**AGREGADOS_PRODUCTOS)
+        }
+        categorias = {
+            c.id: CategoriaRecord(c.id, c.nombre, c.descripcion)
+            for c in Categoria.objects.order_by('id')
+        }
+        productos = {}
+        datos_por_categoria = {categoria_id: [] for categoria_id in categorias}
+        datos = []
+        filas = productos_values(
+            Producto.objects.order_by('id'), 'id', 'categoria_id', 'disponible'
+        )
+        for fila in filas:
+            nombre, _, precio, stock, _, pk, categoria_id, disponible = fila
+            productos[pk] = ProductoRecord(
+                pk, nombre, categoria_id, precio, stock, disponible
+            )
+            datos_fila = representar_producto(fila)
+            datos.append(datos_fila)
+            datos_por_categoria[categoria_id].append(datos_fila)
+
+        self.estado = estado
+        self.categorias = MappingProxyType(categorias)
+        self.productos = MappingProxyType(productos)
+        self.categorias_por_nombre = MappingProxyType({
+            c.nombre.lower(): c for c in categorias.values()
+        })
+        self.json_productos = renderer.render(datos)
+        self._json_por_categoria = MappingProxyType({
+            categoria_id: renderer.render(filas)
+            for categoria_id, filas in datos_por_categoria.items()
+        })
+        self._estado_por_categoria = MappingProxyType(estado_por_categoria)
+
+    def json_categoria(self, nombre):
+        """JSON de los productos de una categoría, o None si no existe"""
+        categoria = self.categorias_por_nombre.get(nombre.lower())
+        if categoria is None:
+            return None
+        return self._json_por_categoria[categoria.id]
+
+    def estado_categoria(self, nombre):
+        """estado_productos de la categoría cuando se construyó el snapshot"""
+        categoria = self.categorias_por_nombre.get(nombre.lower())
+        if categoria is None:
+            return ESTADO_VACIO
+        return self._estado_por_categoria.get(categoria.id, ESTADO_VACIO)
+
+
+class MotorSnapshot:
+    """
+    Mantiene un MenuSnapshot por proceso (worker de gunicorn).
+
+    Cada `intervalo` segundos se compara la cantidad y la última modificación
+    de productos y categorías (una consulta agregada); si cambiaron se
+    construye un snapshot nuevo y se reemplaza la referencia de una vez.
+    Las escrituras del propio proceso fuerzan el chequeo vía signals, y las
+    vistas con ETag piden el snapshot del estado que ya consultaron.
+    """
+
+    def __init__(self, intervalo=1.0):
+        self.intervalo = intervalo
+        self._snapshot = None
+        self._proximo_chequeo = 0.0
+        self._lock = threading.Lock()
+
+    def vigente(self):
+        """El snapshot si todavía no toca chequear la base, o None (sin I/O, para las vistas async)"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() < self._proximo_chequeo:
+            return snapshot
+        return None
+
+    def obtener(self, estado=None):
+        """
+        El snapshot vigente. Con `estado` (el de estado_productos que ya se
+        consultó para el ETag) es uno construido con ese estado: si el
+        vigente es de otro se reconstruye ya, sin esperar al próximo chequeo
+        """
+        if estado is None:
+            snapshot = self.vigente()
+            if snapshot is not None:
+                return snapshot
+            estado = estado_productos(None)
+        snapshot = self._snapshot
+
+        if snapshot is None or snapshot.estado != estado:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.estado != estado:
+                    inicio = time.perf_counter()
+                    snapshot = MenuSnapshot(estado)
+                    self._snapshot = snapshot
+                    logger.info(
+                        "Snapshot del menú reconstruido: %d productos en %.1f ms",
+                        len(snapshot.productos), (time.perf_counter() - inicio) * 1000,
+                    )
+        self._proximo_chequeo = time.monotonic() + self.intervalo
+        return snapshot
+
+    def invalidar(self):
+        self._proximo_chequeo = 0.0
+
+
+def _config():
+    return getattr(settings, 'MENU_SNAPSHOT', {})
+
+
+motor = MotorSnapshot(intervalo=_config().get('INTERVALO', 1.0))
+
+
+def activo():
+    return _config().get('ACTIVO', False)
+
+
+def listado_categoria(nombre, estado):
+    """
+    JSON de los productos de la categoría si el snapshot tiene para ella el
+    mismo `estado` que se usó para el ETag (estado_productos de la
+    categoría); si no, se chequea la base y se reconstruye una vez. None si
+    sigue sin coincidir (p. ej. un nombre que LOWER() de la base no compara
+    igual que Python): responde la base
+    """
+    snapshot = motor.obtener()
+    if snapshot.estado_categoria(nombre) != estado:
+        snapshot = motor.obtener(estado_productos(None))
+        if snapshot.estado_categoria(nombre) != estado:
+            return None
+    return _contenido_categoria(snapshot, nombre)
+
+
+def _contenido_categoria(snapshot, nombre):
+    contenido = snapshot.json_categoria(nombre)
+    if contenido is None:
+        logger.warning("No se encontraron productos para la categoría: %s", nombre)
+        contenido = b'[]'
+    return contenido
+
+
+async def aobtener(estado):
+    """motor.obtener(estado) para las vistas async: sólo va a un thread si el vigente es de otro estado"""
+    snapshot = motor.vigente()
+    if snapshot is None or snapshot.estado != estado:
+        snapshot = await sync_to_async(motor.obtener)(estado)
+    return snapshot
+
+
+async def alistado_categoria(nombre, estado):
+    """listado_categoria para las vistas async"""
+    snapshot = motor.vigente()
+    if snapshot is not None and snapshot.estado_categoria(nombre) == estado:
+        return _contenido_categoria(snapshot, nombre)
+    return await sync_to_async(listado_categoria)(nombre, estado)
+
+
+def puede_responder(request):
+    """El snapshot sólo sirve el listado completo en JSON, sin paginación ni filtros"""
+    return (
+        activo()
+        and request.method == 'GET'
+        and not request.query_params
+        and getattr(request.accepted_renderer, 'format', None) == 'json'
+    )
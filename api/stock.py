@@ -0,0 +1,122 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .models import Producto
+from .signals import catalogo_modificado
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, producto_id, cantidad, disponible=None):
+        self.producto_id = producto_id
+        self.cantidad = cantidad
+        self.disponible = disponible
+        super().__init__(f'Stock insuficiente para el producto {producto_id}')
+
+
+class ProductoNoDisponible(Exception):
+    """disponible=False: dado de baja o agotado (descontar lo apaga al llegar a cero)"""
+
+    def __init__(self, producto_id):
+        self.producto_id = producto_id
+        super().__init__(f'Producto no disponible: {producto_id}')
+
+
+class ProductoInexistente(Exception):
+    def __init__(self, producto_id):
+        self.producto_id = producto_id
+        super().__init__(f'Producto inexistente: {producto_id}')
+
+
+def descontar(cantidades):
+    """
+    Descuenta {producto_id: cantidad} en un solo UPDATE condicional: cada
+    fila sólo se actualiza si está disponible y tiene stock suficiente
+    (WHERE stock >= cantidad), sin lectura previa. Dos cajas vendiendo la
+    última unidad a la vez no pueden sobrevender.
+
+    Tiene que correr dentro de una transacción: si alguna fila no se pudo
+    descontar se lanza ProductoInexistente, ProductoNoDisponible o
+    StockInsuficiente y el rollback deshace las demás.
+    """
+    ahora = timezone.now()
+    condicion = Q()
+    for producto_id, cantidad in cantidades.items():
+        condicion |= Q(pk=producto_id, stock__gte=cantidad)
+    actualizadas = Producto.objects.filter(condicion, disponible=True).update(
+        # disponible va primero: MySQL evalúa el SET de izquierda a derecha
+        disponible=Case(
+            *[When(pk=producto_id, stock=cantidad, then=Value(False))
+              for producto_id, cantidad in cantidades.items()],
+            default=F('disponible'),
+        ),
+        stock=F('stock') - Case(
+            *[When(pk=producto_id, then=Value(cantidad))
+              for producto_id, cantidad in cantidades.items()],
+            output_field=IntegerField(),
+        ),
+        updated_at=ahora,
+    )
+    if actualizadas != len(cantidades):
+        raise _rechazo(cantidades, ahora)
+    catalogo_modificado.send(sender=Producto, campos=('stock', 'disponible'), modificado=ahora)
+
+
+def _rechazo(cantidades, ahora):
+    """
+    El error del primer producto (por id) que no se pudo descontar. Las
+    filas que sí se descontaron llevan updated_at=ahora: en esta misma
+    transacción no las puede haber tocado nadie más.
+    """
+    filas = {
+        fila[0]: fila[1:]
+        for fila in Producto.objects.filter(
+            pk__in=cantidades
+        ).values_list('pk', 'stock', 'disponible', 'updated_at')
+    }
+    for producto_id in sorted(cantidades):
+        if producto_id not in filas:
+            return ProductoInexistente(producto_id)
+        stock, disponible, modificado = filas[producto_id]
+        if modificado != ahora:
+            return rechazo(producto_id, cantidades[producto_id], stock, disponible)
+    producto_id = min(cantidades)
+    return rechazo(producto_id, cantidades[producto_id], *filas[producto_id][:2])
+
+
+def rechazo(producto_id, cantidad, stock, disponible):
+    """ProductoNoDisponible si está dado de baja o agotado; si no, StockInsuficiente"""
+    if not disponible:
+        return ProductoNoDisponible(producto_id)
+    return StockInsuficiente(producto_id, cantidad, disponible=stock)
+
+
+def sumar_cantidades(items):
+    """{producto_id: cantidad total} de un iterable de (producto_id, cantidad)"""
+    cantidades = Counter()
+    for producto_id, cantidad in items:
+        cantidades[producto_id] += cantidad
+    return cantidades
+
+
+def reservar_lote(items):
+    """
+    Reserva varias cantidades a la vez: o se descuentan todas o ninguna.
+
+    items es un iterable de (producto_id, cantidad). Devuelve el stock que
+    dejó esta reserva: se lee antes del commit, mientras el UPDATE todavía
+    bloquea las filas y ninguna otra reserva puede descontar en el medio.
+    """
+    cantidades = sumar_cantidades(items)
+    with transaction.atomic():
+        descontar(cantidades)
+        return dict(
+            Producto.objects.filter(pk__in=cantidades).values_list('pk', 'stock')
+        )
+
+
+def reservar(producto_id, cantidad):
+    """Reserva una cantidad de un producto y devuelve el stock restante"""
+    return reservar_lote([(producto_id, cantidad)])[producto_id]
@@ -0,0 +1,19 @@
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def ndjson_response(filas):
+    """
+    Respuesta NDJSON (un objeto JSON por línea) a partir de un iterable de
+    dicts. Con un queryset.iterator() detrás, la exportación del catálogo
+    completo usa memoria acotada.
+    """
+    def lineas():
+        for datos in filas:
+            yield json.dumps(
+                datos, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')
+            ) + '\n'
+
+    return StreamingHttpResponse(lineas(), content_type='application/x-ndjson')
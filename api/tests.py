@@ -0,0 +1,1831 @@
+import atexit
+import gzip
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from io import StringIO
+from logging.handlers import RotatingFileHandler, WatchedFileHandler
+from unittest import mock, skipUnless
+from decimal import Decimal
+
+import brotli
+import msgpack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, QueryDict
+from django.middleware.csrf import CsrfViewMiddleware, get_token
+from django.test import (
+    AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.views import View
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from comida_al_paso.db import router
+from comida_al_paso.db.pool import Pool, PoolAgotado, get_pool
+from comida_al_paso.db.router import ReplicaRouter
+from comida_al_paso.db.sqlite3.base import DatabaseWrapper as SQLiteWrapper
+
+from . import (
+    autenticacion, busqueda, cache, cambios, checks, compresion, importacion, middleware, pedidos, registro, snapshot, throttling,
+    urls, views, views_async,
+)
+from .admin import PedidoItemInline
+from .autenticacion import CacheUsuarios, CachedJWTAuthentication
+from .filtros import FiltroProductos
+from .management.commands import load_menu_data, verificar_indices
+from .metricas import METRICAS_POOL, Registro, prometheus_pools, registro as registro_metricas
+from .middleware import (
+    CompresionMiddleware, MetricasMiddleware, ReplicasMiddleware, SobrecargaMiddleware,
+    ThrottleMiddleware,
+)
+from .models import Categoria, Pedido, PedidoItem, Producto
+from .query_budget import QueryBudgetExceeded, assert_max_queries
+from .renderers import CompactoRenderer, JSONRendererMedido, compactar
+from .serializers import NOMBRES_RESERVADOS, CategoriaSerializer, ProductoSerializer, productos_values, representar_productos
+from .stock import ProductoNoDisponible, StockInsuficiente, reservar, reservar_lote
+
+
+def _sin_throttle():
+    return override_settings(THROTTLE={**settings.THROTTLE, 'TASAS': {}})
+
+
+class CatalogoTestCase(TestCase):
+    """Catálogo chico y cache del catálogo vacía en cada prueba"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Minutas', descripcion='Al plato')
+        cls.productos = [
+            Producto.objects.create(
+                nombre='Milanesa %d' % i, categoria=cls.categoria,
+                precio=Decimal('10.50'), stock=10,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        backend = cache.get_backend()
+        if backend is not None:
+            backend.clear()
+
+
+@override_settings(THROTTLE={**settings.THROTTLE, 'BACKEND': 'local', 'TASAS': {'anon': '3/min'}})
+class ThrottleTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        throttling._store = throttling.BucketsLocales()
+
+    def tearDown(self):
+        throttling._store = None
+
+    def test_hits_de_cache_consumen_del_bucket(self):
+        estados = []
+        for _ in range(4):
+            respuesta = self.client.get('/api/productos/')
+            estados.append((respuesta.status_code, respuesta.get('X-Cache')))
+        self.assertEqual(estados[:3], [(200, 'MISS'), (200, 'HIT'), (200, 'HIT')])
+        self.assertEqual(estados[3][0], 429)
+
+    def test_429_con_retry_after(self):
+        for _ in range(3):
+            self.client.get('/api/categorias/')
+        respuesta = self.client.get('/api/categorias/')
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertGreater(int(respuesta['Retry-After']), 0)
+        self.assertIn('detail', respuesta.json())
+
+    def test_304_consumen_del_bucket(self):
+        etag = self.client.get('/api/productos/')['ETag']
+        estados = [self.client.get('/api/productos/', HTTP_IF_NONE_MATCH=etag).status_code for _ in range(3)]
+        self.assertEqual(estados, [304, 304, 429])
+
+    async def test_vistas_async_limitadas(self):
+        cliente = AsyncClient()
+        estados = [(await cliente.get('/api/productos/cambios/')).status_code for _ in range(4)]
+        self.assertEqual(estados, [200, 200, 200, 429])
+
+    def test_otras_rutas_sin_limite(self):
+        estados = {self.client.get('/healthz').status_code for _ in range(5)}
+        self.assertEqual(estados, {200})
+
+    def test_429_se_mide_con_su_vista(self):
+        registro_metricas.limpiar()
+        self.addCleanup(registro_metricas.limpiar)
+        estados = [self.client.get('/api/categorias/').status_code for _ in range(4)]
+        self.client.get('/api/no-existe/')
+        self.assertEqual(estados[3], 429)
+        resumen = registro_metricas.resumen()
+        self.assertEqual(resumen['CategoriaViewSet']['duracion']['total'], 4)
+        self.assertEqual(resumen['sin_ruta']['duracion']['total'], 1)
+
+    @override_settings(SOBRECARGA={**settings.SOBRECARGA, 'ACTIVO': True})
+    def test_la_ruta_se_resuelve_una_vez(self):
+        sobrecarga = SobrecargaMiddleware(ThrottleMiddleware(lambda request: HttpResponse()))
+        # Por encima del límite adaptativo: sólo pasan las rutas prioritarias
+        sobrecarga.limite = 0.5
+        cadena = MetricasMiddleware(sobrecarga)
+        with mock.patch('api.middleware.resolve', wraps=middleware.resolve) as resolve:
+            estados = [cadena(RequestFactory().get('/api/productos/')).status_code for _ in range(4)]
+        self.assertEqual(estados, [200, 200, 200, 429])
+        self.assertEqual(resolve.call_count, 4)
+
+    def _con_x_forwarded_for(self, ultima=''):
+        return [
+            self.client.get('/api/categorias/', HTTP_X_FORWARDED_FOR='192.0.2.%d%s' % (i, ultima)).status_code
+            for i in range(4)
+        ]
+
+    def test_x_forwarded_for_no_cambia_de_bucket(self):
+        # Sin proxy (el valor de desarrollo) cuenta REMOTE_ADDR
+        self.assertEqual(self._con_x_forwarded_for(), [200, 200, 200, 429])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_detras_de_un_proxy_cuenta_la_ip_que_agrego(self):
+        self.assertEqual(self._con_x_forwarded_for(', 10.0.0.1'), [200, 200, 200, 429])
+
+
+class PrometheusTests(SimpleTestCase):
+    """Cada worker exporta su registro: las series llevan su pid para no mezclarse entre scrapes"""
+
+    def test_etiqueta_worker(self):
+        registro_local = Registro()
+        registro_local.observar('productos_list', {'duracion': 0.002, 'bytes': None})
+        texto = registro_local.prometheus()
+        worker = 'worker="%d"' % os.getpid()
+        self.assertIn('api_request_duration_seconds_count{vista="productos_list",%s} 1\n' % worker, texto)
+        self.assertIn('api_request_duration_seconds_quantile{vista="productos_list",%s,quantile="0.5"}' % worker, texto)
+        pools = prometheus_pools({'default': dict.fromkeys(METRICAS_POOL, 0)})
+        self.assertIn('api_db_pool_max_size{alias="default",%s} 0\n' % worker, pools)
+
+
+class HealthzTests(SimpleTestCase):
+    """/healthz no se descarta por sobrecarga ni aparece en las métricas"""
+
+    @override_settings(SOBRECARGA={**settings.SOBRECARGA, 'ACTIVO': True})
+    def test_sin_descarte_por_sobrecarga(self):
+        sobrecarga = SobrecargaMiddleware(lambda request: HttpResponse())
+        sobrecarga.en_curso = settings.SOBRECARGA['MAX_EN_CURSO'] * 2
+        fabrica = RequestFactory()
+        self.assertEqual(sobrecarga(fabrica.get('/api/productos/')).status_code, 503)
+        self.assertEqual(sobrecarga(fabrica.get('/healthz')).status_code, 200)
+        self.assertEqual(sobrecarga.en_curso, settings.SOBRECARGA['MAX_EN_CURSO'] * 2)
+
+    def test_sin_metricas(self):
+        registro_metricas.limpiar()
+        respuesta = self.client.get('/healthz')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(respuesta.has_header('Server-Timing'))
+        self.assertEqual(registro_metricas.resumen(), {})
+
+
+@_sin_throttle()
+class CacheCatalogoTests(CatalogoTestCase):
+    """Cada escritura del catálogo cambia la versión y la clave de la cache"""
+
+    def _listado(self):
+        respuesta = self.client.get('/api/productos/')
+        return respuesta['X-Cache'], {p['nombre']: p['stock'] for p in respuesta.json()}
+
+    def _despues_de(self, escritura):
+        self._listado()
+        self.assertEqual(self._listado()[0], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            escritura()
+        estado, productos = self._listado()
+        self.assertEqual(estado, 'MISS')
+        return productos
+
+    def test_alta(self):
+        productos = self._despues_de(lambda: Producto.objects.create(
+            nombre='Napolitana', categoria=self.categoria, precio=Decimal('12.00'), stock=3,
+        ))
+        self.assertIn('Napolitana', productos)
+
+    def test_modificacion(self):
+        def renombrar():
+            self.productos[0].nombre = 'Milanesa completa'
+            self.productos[0].save()
+        self.assertIn('Milanesa completa', self._despues_de(renombrar))
+
+    def test_baja(self):
+        productos = self._despues_de(self.productos[0].delete)
+        self.assertNotIn('Milanesa 0', productos)
+
+    def test_reserva(self):
+        productos = self._despues_de(lambda: reservar(self.productos[1].pk, 4))
+        self.assertEqual(productos['Milanesa 1'], 6)
+
+    def test_categoria_invalida_los_listados(self):
+        def renombrar():
+            self.categoria.nombre = 'Platos'
+            self.categoria.save()
+        self._despues_de(renombrar)
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_desaloja_la_menos_usada(self):
+        lru = cache.LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        self.assertEqual(len(lru), 2)
+
+    def test_vence_por_timeout(self):
+        lru = cache.LRUCache(timeout=10)
+        with mock.patch('api.cache.time.monotonic', return_value=100.0):
+            lru.set('a', 1)
+        with mock.patch('api.cache.time.monotonic', return_value=109.0):
+            self.assertEqual(lru.get('a'), 1)
+        with mock.patch('api.cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 0)
+
+
+class CacheCompartidoCheckTests(SimpleTestCase):
+    """Con varios workers las versiones del catálogo tienen que estar en un cache compartido"""
+
+    CATALOGO = {**settings.CATALOGO_CACHE, 'BACKEND': 'lru'}
+    REDIS = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379',
+    }}
+
+    def _errores(self):
+        return [error.id for error in checks.revisar_cache_catalogo(None)]
+
+    @override_settings(WORKERS=3, CATALOGO_CACHE=CATALOGO)
+    def test_varios_workers_con_cache_local_es_error(self):
+        self.assertEqual(self._errores(), ['api.E001'])
+
+    @override_settings(WORKERS=3, CATALOGO_CACHE=CATALOGO, CACHES=REDIS)
+    def test_varios_workers_con_cache_compartido(self):
+        self.assertEqual(self._errores(), [])
+
+    @override_settings(WORKERS=3, CATALOGO_CACHE={**CATALOGO, 'BACKEND': 'off'})
+    def test_cache_apagada(self):
+        self.assertEqual(self._errores(), [])
+
+    @override_settings(WORKERS=1, CATALOGO_CACHE=CATALOGO)
+    def test_un_worker(self):
+        self.assertEqual(self._errores(), [])
+
+
+class ConexionFalsa:
+    def __init__(self):
+        self.cerrada = False
+
+    def close(self):
+        self.cerrada = True
+
+
+class PoolTests(SimpleTestCase):
+    """Pool de conexiones de comida_al_paso.db.pool (el backend MySQL lo usa en connect/close)"""
+
+    def _pool(self, **opciones):
+        return Pool(**{'max_size': 2, 'timeout': 0.05, **opciones})
+
+    def test_devuelta_se_reutiliza(self):
+        pool = self._pool()
+        conexion, nueva = pool.obtener(ConexionFalsa)
+        self.assertTrue(nueva)
+        pool.devolver(conexion)
+        self.assertEqual(pool.obtener(ConexionFalsa), (conexion, False))
+        estadisticas = pool.estadisticas()
+        self.assertEqual((estadisticas['creadas'], estadisticas['reutilizadas']), (1, 1))
+        self.assertEqual((estadisticas['abiertas'], estadisticas['en_uso'], estadisticas['ociosas']), (1, 1, 0))
+
+    def test_reutiliza_la_ultima_devuelta(self):
+        pool = self._pool()
+        primera, segunda = pool.obtener(ConexionFalsa)[0], pool.obtener(ConexionFalsa)[0]
+        pool.devolver(primera)
+        pool.devolver(segunda)
+        self.assertIs(pool.obtener(ConexionFalsa)[0], segunda)
+
+    def test_descartada_se_cierra(self):
+        pool = self._pool()
+        conexion = pool.obtener(ConexionFalsa)[0]
+        pool.devolver(conexion, descartar=True)
+        self.assertTrue(conexion.cerrada)
+        self.assertIsNot(pool.obtener(ConexionFalsa)[0], conexion)
+        self.assertEqual(pool.estadisticas()['descartadas'], 1)
+
+    def test_lleno_espera_y_se_agota(self):
+        pool = self._pool()
+        # Las dos quedan en uso (el pool las lleva por id: hay que mantenerlas vivas)
+        en_uso = [pool.obtener(ConexionFalsa)[0] for _ in range(2)]
+        with self.assertRaises(PoolAgotado):
+            pool.obtener(ConexionFalsa)
+        self.assertFalse(any(conexion.cerrada for conexion in en_uso))
+        estadisticas = pool.estadisticas()
+        self.assertEqual((estadisticas['esperas'], estadisticas['agotado'], estadisticas['abiertas']), (1, 1, 2))
+
+    def test_lleno_recibe_la_que_se_devuelve(self):
+        pool = self._pool(max_size=1, timeout=5)
+        conexion = pool.obtener(ConexionFalsa)[0]
+        threading.Timer(0.05, pool.devolver, (conexion,)).start()
+        self.assertEqual(pool.obtener(ConexionFalsa), (conexion, False))
+        self.assertEqual(pool.estadisticas()['esperas'], 1)
+
+    def test_falla_al_conectar_libera_el_lugar(self):
+        pool = self._pool(max_size=1)
+
+        def conectar():
+            raise OSError('sin servidor')
+
+        with self.assertRaises(OSError):
+            pool.obtener(conectar)
+        self.assertTrue(pool.obtener(ConexionFalsa)[1])
+
+    def test_ociosa_vencida_se_cierra(self):
+        pool = self._pool(max_idle=10)
+        with mock.patch('comida_al_paso.db.pool.time.monotonic', return_value=100.0):
+            conexion = pool.obtener(ConexionFalsa)[0]
+            pool.devolver(conexion)
+        with mock.patch('comida_al_paso.db.pool.time.monotonic', return_value=111.0):
+            otra, nueva = pool.obtener(ConexionFalsa)
+        self.assertTrue(conexion.cerrada)
+        self.assertTrue(nueva)
+
+    def test_ociosa_se_verifica_antes_de_reutilizarla(self):
+        pool = self._pool(verificar=lambda conexion: False, check_after=5)
+        with mock.patch('comida_al_paso.db.pool.time.monotonic', return_value=100.0):
+            conexion = pool.obtener(ConexionFalsa)[0]
+            pool.devolver(conexion)
+            # Recién devuelta no se verifica
+            self.assertIs(pool.obtener(ConexionFalsa)[0], conexion)
+            pool.devolver(conexion)
+        with mock.patch('comida_al_paso.db.pool.time.monotonic', return_value=106.0):
+            self.assertIsNot(pool.obtener(ConexionFalsa)[0], conexion)
+        self.assertTrue(conexion.cerrada)
+
+    def test_conexion_de_otro_pool_no_entra(self):
+        pool = self._pool()
+        ajena = ConexionFalsa()
+        pool.devolver(ajena)
+        self.assertTrue(ajena.cerrada)
+        self.assertEqual(pool.estadisticas()['ociosas'], 0)
+
+    def test_un_pool_por_proceso(self):
+        pool = get_pool('pruebas')
+        self.assertIs(get_pool('pruebas'), pool)
+        with mock.patch('comida_al_paso.db.pool.os.getpid', return_value=-1):
+            self.assertIsNot(get_pool('pruebas'), pool)
+
+
+REPLICAS = {**settings.REPLICAS, 'ALIAS': ('replica_1',), 'STICKY_SEGUNDOS': 10}
+CACHE_LOCAL = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pruebas-replicas',
+}}
+
+
+@override_settings(REPLICAS=REPLICAS, CACHES=CACHE_LOCAL)
+class ReplicasTests(SimpleTestCase):
+    """Router de réplicas y ventana sticky de ReplicasMiddleware (SimpleTestCase: fuera de atomic())"""
+
+    def setUp(self):
+        self.fabrica = RequestFactory()
+        self.origenes = []
+        self.middleware = ReplicasMiddleware(self._vista)
+        self.addCleanup(caches['default'].clear)
+
+    def _vista(self, request):
+        self.origenes.append(router.origen_lecturas())
+        return HttpResponse(status=400 if request.path == '/invalido/' else 200)
+
+    def _request(self, metodo, usuario=None, cookies=None, ruta='/'):
+        request = getattr(self.fabrica, metodo)(ruta)
+        request._id_usuario = usuario
+        request.COOKIES.update(cookies or {})
+        return self.middleware(request)
+
+    def test_router(self):
+        enrutador = ReplicaRouter()
+        self.assertEqual(enrutador.db_for_read(Producto), 'default')
+        token = router.lecturas_en_replica.set(True)
+        self.addCleanup(router.lecturas_en_replica.reset, token)
+        self.assertEqual(enrutador.db_for_read(Producto), 'replica_1')
+        self.assertEqual(enrutador.db_for_read(User), 'default')
+        self.assertEqual(enrutador.db_for_read(Categoria, instance=Producto(categoria_id=1)), 'replica_1')
+        guardado = Producto()
+        guardado._state.db = 'default'
+        self.assertEqual(enrutador.db_for_read(Categoria, instance=guardado), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(enrutador.db_for_read(Producto), 'default')
+        self.assertEqual(enrutador.db_for_write(Producto), 'default')
+        self.assertIs(enrutador.allow_migrate('replica_1', 'api'), False)
+        self.assertIsNone(enrutador.allow_migrate('default', 'api'))
+
+    def test_quien_escribe_lee_de_la_primaria(self):
+        self._request('get', usuario='7')
+        self._request('post', usuario='7')
+        # Sin la cookie (POS con JWT) y desde otro worker: la ventana está en el cache
+        self._request('get', usuario='7')
+        self._request('get', usuario='8')
+        self._request('post', usuario='8', ruta='/invalido/')
+        self._request('get', usuario='8')
+        self.assertEqual(self.origenes, ['replica', 'primaria', 'primaria', 'replica', 'primaria', 'replica'])
+
+    def test_anonimo_con_cookie(self):
+        respuesta = self._request('post')
+        cookie = respuesta.cookies[REPLICAS['COOKIE']]
+        self.assertEqual(cookie['max-age'], 10)
+        self._request('get', cookies={REPLICAS['COOKIE']: cookie.value})
+        self._request('get')
+        with mock.patch('api.middleware.time.time', return_value=time.time() + 11):
+            self._request('get', cookies={REPLICAS['COOKIE']: cookie.value})
+        self._request('get', cookies={REPLICAS['COOKIE']: 'x'})
+        self.assertEqual(self.origenes, ['primaria', 'primaria', 'replica', 'replica', 'replica'])
+
+    def test_la_ventana_vence(self):
+        self._request('post', usuario='7')
+        with mock.patch('api.middleware.time.time', return_value=time.time() + 11):
+            self._request('get', usuario='7')
+        self.assertEqual(self.origenes, ['primaria', 'replica'])
+
+    async def test_async(self):
+        async def vista(request):
+            return self._vista(request)
+
+        middleware = ReplicasMiddleware(vista)
+        for metodo in ('get', 'post', 'get'):
+            request = getattr(AsyncRequestFactory(), metodo)('/')
+            request._id_usuario = '7'
+            await middleware(request)
+        self.assertEqual(self.origenes, ['replica', 'primaria', 'primaria'])
+
+    @override_settings(WORKERS=3)
+    def test_varios_workers_piden_cache_compartido(self):
+        self.assertEqual([error.id for error in checks.revisar_cache_replicas(None)], ['api.E002'])
+        with override_settings(CACHES=CacheCompartidoCheckTests.REDIS):
+            self.assertEqual(checks.revisar_cache_replicas(None), [])
+        with override_settings(REPLICAS={**REPLICAS, 'ALIAS': ()}):
+            self.assertEqual(checks.revisar_cache_replicas(None), [])
+
+
+@_sin_throttle()
+class BusquedaTests(CatalogoTestCase):
+    """El índice sólo se salta la reconstrucción si el cambio lo explican las escrituras propias"""
+
+    def setUp(self):
+        super().setUp()
+        parche = mock.patch.object(busqueda, 'motor', busqueda.MotorBusqueda(intervalo=0))
+        self.motor = parche.start()
+        self.addCleanup(parche.stop)
+        self.indice = self.motor.obtener()
+
+    def _nombres(self, consulta):
+        return set(Producto.objects.filter(pk__in=busqueda.buscar(consulta)).values_list('nombre', flat=True))
+
+    def test_reserva_local_no_reconstruye(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar(self.productos[0].pk, 2)
+        self.assertIs(self.motor.obtener(), self.indice)
+
+    def test_alta_local_no_reconstruye(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Ravioles', categoria=self.categoria, precio=Decimal('9.00'))
+        self.assertIs(self.motor.obtener(), self.indice)
+        self.assertEqual(self._nombres('ravioles'), {'Ravioles'})
+
+    def test_renombre_ajeno_despues_de_una_reserva_local(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reservar(self.productos[0].pk, 2)
+        # Como otro worker: sin signals en este proceso
+        Producto.objects.filter(pk=self.productos[1].pk).update(nombre='Ravioles', updated_at=timezone.now())
+        self.assertEqual(self._nombres('ravioles'), {'Ravioles'})
+        self.assertIsNot(self.motor.indice, self.indice)
+
+    def test_baja_ajena_compensada_por_un_alta_local(self):
+        Producto.objects.filter(pk=self.productos[2].pk)._raw_delete('default')
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre='Ravioles', categoria=self.categoria, precio=Decimal('9.00'))
+        self.assertEqual(set(busqueda.buscar('milanesa')), {self.productos[0].pk, self.productos[1].pk})
+
+    def test_reserva_sin_fecha_reconstruye_si_cambia_el_estado(self):
+        Producto.objects.filter(pk=self.productos[0].pk).update(stock=1, updated_at=timezone.now())
+        self.motor.cambio_local(Producto)
+        self.motor.obtener()
+        self.assertIsNot(self.motor.indice, self.indice)
+
+
+@_sin_throttle()
+@override_settings(MENU_SNAPSHOT={'ACTIVO': True, 'INTERVALO': 60.0})
+class SnapshotTests(CatalogoTestCase):
+    """El cuerpo que sale del snapshot es siempre del estado con el que se calculó el ETag"""
+
+    def setUp(self):
+        super().setUp()
+        # Intervalo largo: sin el chequeo contra el estado del ETag se serviría el snapshot viejo
+        parche = mock.patch.object(snapshot, 'motor', snapshot.MotorSnapshot(intervalo=60.0))
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def _renombrar_en_otro_worker(self):
+        # Sin signals (no invalida el snapshot de este proceso) y sin la cache del catálogo
+        Producto.objects.filter(pk=self.productos[0].pk).update(nombre='Napolitana', updated_at=timezone.now())
+        cache.get_backend().clear()
+
+    def _nombres(self, respuesta):
+        return {p['nombre'] for p in respuesta.json()}
+
+    def test_listado(self):
+        primera = self.client.get('/api/productos/')
+        self._renombrar_en_otro_worker()
+        segunda = self.client.get('/api/productos/')
+        self.assertNotEqual(primera['ETag'], segunda['ETag'])
+        self.assertIn('Napolitana', self._nombres(segunda))
+        self.assertEqual(self.client.get('/api/productos/', HTTP_IF_NONE_MATCH=segunda['ETag']).status_code, 304)
+
+    def test_categoria(self):
+        primera = self.client.get('/api/productos/minutas/')
+        self._renombrar_en_otro_worker()
+        segunda = self.client.get('/api/productos/minutas/')
+        self.assertNotEqual(primera['ETag'], segunda['ETag'])
+        self.assertIn('Napolitana', self._nombres(segunda))
+
+    def test_categoria_inexistente(self):
+        self.client.get('/api/productos/')
+        respuesta = self.client.get('/api/productos/Postres/')
+        self.assertEqual(respuesta.json(), [])
+
+    def test_mismos_bytes_que_sin_snapshot(self):
+        con_snapshot = self.client.get('/api/productos/Minutas/').content
+        cache.get_backend().clear()
+        with override_settings(MENU_SNAPSHOT={'ACTIVO': False}):
+            self.assertEqual(self.client.get('/api/productos/Minutas/').content, con_snapshot)
+
+    async def test_vistas_async(self):
+        fabrica = AsyncRequestFactory()
+        await views_async.productos_list(fabrica.get('/api/productos/'))
+        await sync_to_async(self._renombrar_en_otro_worker)()
+        for ruta, args in (('/api/productos/', ()), ('/api/productos/Minutas/', ('Minutas',))):
+            vista = views_async.productos_por_categoria if args else views_async.productos_list
+            with self.subTest(ruta=ruta):
+                respuesta = await vista(fabrica.get(ruta), *args)
+                self.assertIn(b'Napolitana', respuesta.content)
+
+
+@_sin_throttle()
+class CondicionalTests(CatalogoTestCase):
+    def test_categoria_con_pk_invalido_es_404(self):
+        self.assertEqual(self.client.get('/api/categorias/abc/').status_code, 404)
+
+    def test_categoria_sin_cambios_es_304(self):
+        ruta = '/api/categorias/%d/' % self.categoria.pk
+        etag = self.client.get(ruta)['ETag']
+        self.assertEqual(self.client.get(ruta, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@_sin_throttle()
+class FiltrosTests(CatalogoTestCase):
+    def test_filtros_numericos_invalidos_son_400(self):
+        for consulta in (
+            'precio_min=NaN', 'precio_max=Infinity', 'precio_min=-Infinity', 'precio_max=sNaN',
+            'precio_min=abc', 'stock_gt=1.5', 'stock_gt=99999999999999999999',
+            'stock_gt=-99999999999999999999',
+        ):
+            with self.subTest(consulta=consulta):
+                respuesta = self.client.get('/api/productos/?' + consulta)
+                self.assertEqual(respuesta.status_code, 400)
+
+    def test_filtros_en_el_limite(self):
+        self.assertEqual(self.client.get('/api/productos/?stock_gt=2147483647').json(), [])
+        self.assertEqual(len(self.client.get('/api/productos/?precio_min=1E%2B9999').json()), 0)
+        self.assertEqual(len(self.client.get('/api/productos/?stock_gt=-2147483648').json()), 3)
+
+    def test_categoria_in_compara_como_por_nombre(self):
+        # LOWER() de SQLite sólo pasa a minúsculas ASCII: 'ÑOQUIS' → 'Ñoquis'
+        categoria = Categoria.objects.create(nombre='Ñoquis')
+        Producto.objects.create(nombre='Con tuco', categoria=categoria, precio=Decimal('8.00'), stock=5)
+        for nombre in ('ÑOQUIS', 'ñoquis'):
+            with self.subTest(nombre=nombre):
+                por_nombre = list(Categoria.objects.por_nombre(nombre))
+                respuesta = self.client.get('/api/productos/', {'categoria__in': nombre + ',minutas'})
+                self.assertEqual(
+                    {p['categoria'] for p in respuesta.json()},
+                    {'Minutas'} | {c.nombre for c in por_nombre},
+                )
+
+    def test_usan_los_indices(self):
+        consultas = verificar_indices.consultas() + [(
+            'categoria__in',
+            FiltroProductos(QueryDict('categoria__in=Minutas,pizzas')).filtrar(Producto.objects.all()),
+            'categoria_nombre_lower_unico',
+        )]
+        for descripcion, queryset, indice in consultas:
+            with self.subTest(descripcion):
+                self.assertIn(indice, queryset.explain())
+
+
+@_sin_throttle()
+class PaginacionTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        # Altas en el mismo instante (importación masiva): sólo el id desempata
+        for i in range(3, 7):
+            Producto.objects.create(nombre='Milanesa %d' % i, categoria=self.categoria, precio=Decimal('10.50'), stock=10)
+        Producto.objects.update(created_at=timezone.now())
+
+    def _recorrer(self, url):
+        nombres, paginas = [], 0
+        while url:
+            respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            datos = respuesta.json()
+            nombres += [p['nombre'] for p in datos['results']]
+            url, paginas = datos['next'], paginas + 1
+        return nombres, paginas
+
+    def test_recorre_todo_con_empates_en_created_at(self):
+        nombres, paginas = self._recorrer('/api/productos/?page_size=2')
+        self.assertEqual(nombres, list(Producto.objects.order_by('id').values_list('nombre', flat=True)))
+        self.assertEqual(paginas, 4)
+
+    def test_alta_durante_el_recorrido(self):
+        primera = self.client.get('/api/productos/?page_size=4').json()
+        Producto.objects.create(nombre='Milanesa nueva', categoria=self.categoria, precio=Decimal('1'), stock=1)
+        nombres, _ = self._recorrer(primera['next'])
+        self.assertEqual(len(set([p['nombre'] for p in primera['results']] + nombres)), 8)
+
+    def test_cursor_invalido_es_404(self):
+        self.assertEqual(self.client.get('/api/productos/?cursor=no-es-un-cursor').status_code, 404)
+
+    def test_cursor_con_ordering_es_400(self):
+        respuesta = self.client.get('/api/productos/?page_size=2&ordering=precio')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('ordering', respuesta.json())
+
+    def test_streaming_ndjson(self):
+        respuesta = self.client.get('/api/productos/?stream=1&precio_min=10')
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(linea)['nombre'] for linea in lineas], [
+            'Milanesa %d' % i for i in range(7)
+        ])
+
+    def test_streaming_de_una_categoria_vacia(self):
+        Categoria.objects.create(nombre='Postres')
+        respuesta = self.client.get('/api/productos/Postres/?stream=1')
+        self.assertEqual(b''.join(respuesta.streaming_content), b'')
+
+
+@_sin_throttle()
+class CategoriasTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('encargado'))
+
+    def test_escribir_requiere_usuario(self):
+        self.client.logout()
+        ruta = '/api/categorias/%d/' % self.categoria.pk
+        self.assertEqual(self.client.get(ruta).status_code, 200)
+        for respuesta in (
+            self.client.post('/api/categorias/', {'nombre': 'Bebidas'}, content_type='application/json'),
+            self.client.patch(ruta, {'nombre': 'Platos'}, content_type='application/json'),
+            self.client.delete(ruta),
+        ):
+            self.assertEqual(respuesta.status_code, 401)
+        self.assertEqual(list(Categoria.objects.values_list('nombre', flat=True)), ['Minutas'])
+
+    def test_paginas_en_orden_de_id(self):
+        for nombre in ('Postres', 'Bebidas', 'Entradas'):
+            Categoria.objects.create(nombre=nombre)
+        respuesta = self.client.get('/api/categorias/')
+        self.assertEqual(
+            [c['id'] for c in respuesta.json()['results']],
+            list(Categoria.objects.order_by('id').values_list('id', flat=True)),
+        )
+
+    def test_alta_repetida_sin_distinguir_mayusculas(self):
+        respuesta = self.client.post('/api/categorias/', {'nombre': 'minutas'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json(), {'nombre': ['Ya existe una categoría con ese nombre']})
+        self.assertEqual(Categoria.objects.count(), 1)
+
+    def test_nombres_de_rutas_de_productos_reservados(self):
+        for nombre in ('buscar', 'Cambios'):
+            respuesta = self.client.post('/api/categorias/', {'nombre': nombre}, content_type='application/json')
+            self.assertEqual(respuesta.status_code, 400)
+        # Si se agrega una ruta fija bajo productos/, su nombre tiene que estar reservado
+        fijas = {
+            str(ruta.pattern).split('/')[1] for ruta in urls.urlpatterns
+            if str(ruta.pattern).startswith('productos/') and str(ruta.pattern).count('/') == 2
+        }
+        self.assertEqual(fijas - {'<str:categoria_nombre>', ''}, NOMBRES_RESERVADOS)
+
+    def test_renombrar_a_una_existente(self):
+        bebidas = Categoria.objects.create(nombre='Bebidas')
+        ruta = '/api/categorias/%d/' % bebidas.pk
+        respuesta = self.client.patch(ruta, {'nombre': 'MINUTAS'}, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+        respuesta = self.client.patch(ruta, {'nombre': 'BEBIDAS'}, content_type='application/json')
+        self.assertEqual(respuesta.json()['nombre'], 'BEBIDAS')
+
+
+@_sin_throttle()
+class ReservasTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('caja'))
+        self.producto = self.productos[0]
+
+    def _post(self, ruta, datos):
+        return self.client.post(ruta, datos, content_type='application/json')
+
+    def test_no_disponible_no_es_falta_de_stock(self):
+        Producto.objects.filter(pk=self.producto.pk).update(disponible=False)
+        item = {'producto': self.producto.pk, 'cantidad': 1}
+        for ruta, datos in (
+            ('/api/productos/%d/reservar/' % self.producto.pk, {'cantidad': 1}),
+            ('/api/productos/reservar/', {'items': [item]}),
+            ('/api/pedidos/', {'items': [item]}),
+        ):
+            with self.subTest(ruta=ruta):
+                respuesta = self._post(ruta, datos)
+                self.assertEqual(respuesta.status_code, 409)
+                self.assertEqual(
+                    respuesta.json(), {'error': 'Producto no disponible', 'producto': self.producto.pk}
+                )
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).stock, 10)
+
+    def test_stock_insuficiente(self):
+        respuesta = self._post('/api/productos/%d/reservar/' % self.producto.pk, {'cantidad': 11})
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json(), {
+            'error': 'Stock insuficiente', 'producto': self.producto.pk, 'solicitado': 11, 'stock': 10,
+        })
+
+    def test_stock_devuelto_se_lee_antes_del_commit(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(reservar(self.producto.pk, 3), 7)
+        sql = [consulta['sql'] for consulta in consultas]
+        self.assertTrue(sql[-1].startswith('RELEASE SAVEPOINT'), sql)
+        self.assertTrue(sql[-2].startswith('SELECT'), sql)
+
+    def test_agotado_queda_no_disponible(self):
+        ruta = '/api/productos/%d/reservar/' % self.producto.pk
+        self.assertEqual(self._post(ruta, {'cantidad': 10}).status_code, 200)
+        respuesta = self._post(ruta, {'cantidad': 1})
+        self.assertEqual(respuesta.json()['error'], 'Producto no disponible')
+
+
+@_sin_throttle()
+class PedidosTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = User.objects.create_user('caja')
+        self.client.force_login(self.usuario)
+        self.producto = self.productos[0]
+
+    def _pedido(self, cantidad, referencia='A-1'):
+        return self.client.post('/api/pedidos/', {
+            'referencia': referencia, 'items': [{'producto': self.producto.pk, 'cantidad': cantidad}],
+        }, content_type='application/json')
+
+    def _stock(self):
+        return Producto.objects.get(pk=self.producto.pk).stock
+
+    def test_reintento_devuelve_el_mismo_pedido(self):
+        creado = self._pedido(2)
+        reintento = self._pedido(2)
+        self.assertEqual((creado.status_code, reintento.status_code), (201, 200))
+        self.assertEqual(creado.json()['id'], reintento.json()['id'])
+        self.assertEqual(self._stock(), 8)
+
+    def test_referencia_con_otros_items_es_422(self):
+        pedido = self._pedido(2).json()['id']
+        respuesta = self._pedido(3)
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(respuesta.json()['pedido'], pedido)
+        self.assertEqual(self._stock(), 8)
+
+    def test_carrera_con_otros_items_es_422(self):
+        # El reintento no ve el pedido, el INSERT choca con la referencia y
+        # recién ahí lo encuentra (IntegrityError en crear_pedido)
+        self._pedido(2)
+        existente = pedidos._existente
+        llamadas = []
+
+        def sin_verlo_la_primera_vez(*args):
+            llamadas.append(args)
+            return None if len(llamadas) == 1 else existente(*args)
+
+        with mock.patch.object(pedidos, '_existente', sin_verlo_la_primera_vez):
+            respuesta = self._pedido(3)
+        self.assertEqual((respuesta.status_code, len(llamadas)), (422, 2))
+        self.assertEqual(self._stock(), 8)
+
+    def test_precio_cambiado_antes_del_descuento(self):
+        # Otra transacción cambia el precio justo antes del UPDATE: el pedido
+        # lleva el precio que tenía la fila al descontar el stock
+        descontar = pedidos.descontar
+
+        def con_precio_nuevo(cantidades):
+            Producto.objects.filter(pk=self.producto.pk).update(precio=Decimal('12.00'))
+            descontar(cantidades)
+
+        with mock.patch.object(pedidos, 'descontar', con_precio_nuevo):
+            respuesta = self._pedido(2)
+        self.assertEqual(respuesta.status_code, 201)
+        pedido = Pedido.objects.get(pk=respuesta.json()['id'])
+        self.assertEqual(pedido.total, Decimal('24.00'))
+        self.assertEqual(pedido.items.get().precio_unitario, Decimal('12.00'))
+
+    def test_items_de_solo_lectura_en_el_admin(self):
+        inline = PedidoItemInline(Pedido, admin.site)
+        pedido = Pedido.objects.get(pk=self._pedido(2).json()['id'])
+        request = RequestFactory().get('/admin/')
+        request.user = User.objects.create_superuser('admin')
+        self.assertFalse(inline.has_add_permission(request, pedido))
+        self.assertFalse(inline.has_delete_permission(request, pedido))
+
+
+@_sin_throttle()
+class ImportacionTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_user('encargado'))
+
+    def _bulk(self, cuerpo, content_type):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/productos/bulk/', cuerpo, content_type=content_type)
+
+    def test_csv_con_bom(self):
+        cuerpo = '\ufeffnombre_producto,nombre_categoria,precio,stock\nMilanesa 0,minutas,12.00,4\nSuprema,Minutas,9.00,7\n'
+        respuesta = self._bulk(cuerpo.encode('utf-8'), 'text/csv')
+        self.assertEqual(respuesta.json(), {'procesados': 2, 'importados': 2, 'errores': []})
+        self.assertEqual(Producto.objects.get(nombre='Suprema').stock, 7)
+
+    def test_ndjson_que_no_es_utf8(self):
+        cuerpo = '{"nombre_producto": "Ñoquis", "nombre_categoria": "Minutas", "precio": "8.00"}\n'.encode('latin-1')
+        respuesta = self._bulk(cuerpo, 'application/x-ndjson')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json(), {'error': 'El archivo no está en UTF-8 (línea 1)'})
+        self.assertFalse(Producto.objects.filter(nombre='Ñoquis').exists())
+
+    def test_stock_cero_agota_y_reponer_no_reactiva(self):
+        agotado, dado_de_baja, repuesto = self.productos
+        Producto.objects.filter(pk=dado_de_baja.pk).update(disponible=False)
+        Producto.objects.filter(pk=repuesto.pk).update(stock=0)
+        respuesta = self._bulk([
+            {'nombre_producto': p.nombre, 'nombre_categoria': 'Minutas', 'precio': '11.00', 'stock': stock}
+            for p, stock in ((agotado, 0), (dado_de_baja, 8), (repuesto, 5))
+        ] + [{'nombre_producto': 'Sin stock', 'nombre_categoria': 'Minutas', 'precio': '1.00', 'stock': 0}],
+            'application/json')
+        self.assertEqual(respuesta.json()['importados'], 4)
+        self.assertEqual(
+            list(Producto.objects.filter(categoria=self.categoria).order_by('pk')
+                 .values_list('precio', 'stock', 'disponible')),
+            [(Decimal('11.00'), 0, False), (Decimal('11.00'), 8, False), (Decimal('11.00'), 5, True),
+             (Decimal('1.00'), 0, False)],
+        )
+
+    @skipUnless(connection.vendor == 'sqlite', 'LOWER() de SQLite')
+    def test_categorias_que_solo_difieren_en_no_ascii(self):
+        # LOWER() de SQLite deja 'Ñ' como está: el índice único las acepta a las dos
+        mayusculas = Categoria.objects.create(nombre='ÑOQUIS')
+        minusculas = Categoria.objects.create(nombre='ñoquis')
+        respuesta = self._bulk([
+            {'nombre_producto': 'Ñoquis de papa', 'nombre_categoria': nombre, 'precio': '5.00'}
+            for nombre in ('ÑOQUIS', 'ñoquis')
+        ], 'application/json')
+        self.assertEqual(respuesta.json()['importados'], 2)
+        self.assertEqual(
+            set(Producto.objects.filter(nombre='Ñoquis de papa').values_list('categoria', flat=True)),
+            {mayusculas.pk, minusculas.pk},
+        )
+
+    @override_settings(QUERY_BUDGET={'RAISE': True})
+    def test_chunk_size_chico_no_pasa_el_presupuesto(self):
+        filas = [
+            {'nombre_producto': 'Producto %d' % i, 'nombre_categoria': 'Minutas', 'precio': '1.00', 'stock': i % 2}
+            for i in range(250)
+        ]
+        with self.captureOnCommitCallbacks(execute=True), assert_max_queries(importacion.CONSULTAS_MAXIMAS) as contador:
+            respuesta = self.client.post('/api/productos/bulk/?chunk_size=1', filas, content_type='application/json')
+        self.assertEqual(respuesta.json()['importados'], 250)
+        # Tres lotes de CHUNK_MIN, no 250 de a uno
+        self.assertEqual(sum(sql.startswith('SAVEPOINT') for sql in contador.sql), 4)
+
+    @mock.patch.object(importacion, 'MAX_FILAS', 3)
+    def test_mas_filas_que_el_limite_es_413_sin_escribir(self):
+        filas = [
+            {'nombre_producto': 'Producto %d' % i, 'nombre_categoria': 'Minutas', 'precio': '1.00'}
+            for i in range(4)
+        ]
+        respuesta = self._bulk(filas, 'application/json')
+        self.assertEqual(respuesta.status_code, 413)
+        self.assertFalse(Producto.objects.filter(nombre__startswith='Producto').exists())
+
+    def test_import_menu_con_bom(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+            f.write('nombre_producto,nombre_categoria,precio\r\nSuprema,Minutas,9.00\r\n'.encode('utf-8-sig'))
+        self.addCleanup(os.remove, f.name)
+        call_command('import_menu', f.name, stdout=StringIO())
+        self.assertTrue(Producto.objects.filter(nombre='Suprema', categoria=self.categoria).exists())
+
+    def test_alta_duplicada(self):
+        datos = {'nombre_producto': 'Milanesa 0', 'nombre_categoria': 'Minutas', 'precio': '1.00'}
+        respuesta = self.client.post('/api/productos/', datos, content_type='application/json')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json(), {'error': 'Ya existe un producto con ese nombre en la categoría'})
+        self.assertEqual(Producto.objects.get(pk=self.productos[0].pk).precio, Decimal('10.50'))
+
+
+class LoadMenuDataTests(TestCase):
+    """entrypoint.sh lo corre en cada arranque: no puede pisar lo que cambió la operación"""
+
+    def _cargar(self, *args):
+        salida = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_menu_data', *args, stdout=salida)
+        return salida.getvalue()
+
+    def test_segunda_carga_no_escribe(self):
+        self._cargar()
+        productos = list(Producto.objects.order_by('pk').values_list('pk', 'updated_at'))
+        self.assertIn('sin cambios', self._cargar())
+        self.assertEqual(list(Producto.objects.order_by('pk').values_list('pk', 'updated_at')), productos)
+
+    def test_primera_carga_lee_las_categorias_una_vez(self):
+        # Una lectura de categorías, sin importar cuántas tenga el menú
+        Categoria.objects.create(nombre='BEBIDAS')
+        with self.assertNumQueries(14):
+            self._cargar()
+        self.assertEqual(Categoria.objects.count(), len(load_menu_data.CATEGORIAS))
+        self.assertEqual(Producto.objects.filter(categoria__nombre='BEBIDAS').count(), 4)
+
+    def test_mismo_fixture_con_otra_ruta_no_se_recarga(self):
+        fixture = settings.BASE_DIR / 'fixtures' / 'initial_data.json'
+        self.assertIn('exitosamente', self._cargar('--archivo', str(fixture)))
+        relativa = os.path.relpath(fixture)
+        for ruta in (relativa, os.path.join('.', relativa)):
+            with self.subTest(ruta=ruta):
+                self.assertIn('sin cambios', self._cargar('--archivo', ruta))
+
+    def test_menu_nuevo_no_repone_stock(self):
+        Categoria.objects.create(nombre='pizzas', descripcion='Vieja')
+        self._cargar()
+        choripan = Producto.objects.get(nombre='Choripán')
+        reservar(choripan.pk, 5)
+        Producto.objects.filter(pk=choripan.pk).update(precio=Decimal('1300.00'))
+
+        menu = [('Choripán', 'Parrilla', 1100, 99), ('Provoleta', 'Parrilla', 1500, 10)]
+        categorias = [(nombre, 'Nueva') for nombre, _ in load_menu_data.CATEGORIAS]
+        with mock.patch.object(load_menu_data, 'PRODUCTOS', menu), \
+                mock.patch.object(load_menu_data, 'CATEGORIAS', categorias):
+            self.assertIn('1 productos nuevos', self._cargar())
+
+        choripan.refresh_from_db()
+        self.assertEqual((choripan.stock, choripan.precio), (20, Decimal('1300.00')))
+        self.assertEqual(Producto.objects.get(nombre='Provoleta').stock, 10)
+        self.assertEqual(
+            list(Categoria.objects.filter(nombre__iexact='pizzas').values_list('nombre', 'descripcion')),
+            [('pizzas', 'Nueva')],
+        )
+
+
+class MigracionProductoUnicoTests(TransactionTestCase):
+    """0003 tiene que poder aplicarse sobre una base con productos repetidos"""
+
+    ANTES = [('api', '0002_updated_at')]
+    DESPUES = [('api', '0003_producto_unico_por_categoria')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('api'))
+
+    def test_quita_duplicados(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.ANTES)
+        apps = executor.loader.project_state(self.ANTES).apps
+        Categoria_, Producto_ = apps.get_model('api', 'Categoria'), apps.get_model('api', 'Producto')
+        categoria = Categoria_.objects.create(nombre='Minutas')
+        vieja, _ = (
+            Producto_.objects.create(nombre='Milanesa', categoria=categoria, precio=precio, stock=stock)
+            for precio, stock in ((Decimal('10.00'), 3), (Decimal('12.00'), 8))
+        )
+        otra = Producto_.objects.create(nombre='Suprema', categoria=categoria, precio=Decimal('9.00'))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.DESPUES)
+        apps = executor.loader.project_state(self.DESPUES).apps
+        self.assertEqual(
+            list(apps.get_model('api', 'Producto').objects.order_by('pk').values_list('pk', 'precio', 'stock')),
+            [(vieja.pk, Decimal('12.00'), 8), (otra.pk, Decimal('9.00'), 0)],
+        )
+
+
+class MigracionCategoriaUnicaTests(TransactionTestCase):
+    """0005 tiene que poder aplicarse sobre categorías que sólo difieren en mayúsculas"""
+
+    ANTES = [('api', '0004_cargamenu')]
+    DESPUES = [('api', '0005_indices_busqueda_categoria')]
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('api'))
+
+    def test_une_categorias_repetidas(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.ANTES)
+        apps = executor.loader.project_state(self.ANTES).apps
+        Categoria_, Producto_ = apps.get_model('api', 'Categoria'), apps.get_model('api', 'Producto')
+        bebidas = Categoria_.objects.create(nombre='Bebidas')
+        repetida = Categoria_.objects.create(nombre='bebidas', descripcion='Frías')
+        agua = Producto_.objects.create(nombre='Agua', categoria=bebidas, precio=Decimal('2.00'), stock=1)
+        Producto_.objects.create(nombre='Agua', categoria=repetida, precio=Decimal('3.00'), stock=5)
+        soda = Producto_.objects.create(nombre='Soda', categoria=repetida, precio=Decimal('1.00'))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.DESPUES)
+        apps = executor.loader.project_state(self.DESPUES).apps
+        self.assertEqual(
+            list(apps.get_model('api', 'Categoria').objects.values_list('pk', 'nombre', 'descripcion')),
+            [(bebidas.pk, 'Bebidas', 'Frías')],
+        )
+        self.assertEqual(
+            list(apps.get_model('api', 'Producto').objects.order_by('pk').values_list('pk', 'categoria', 'precio', 'stock')),
+            [(agua.pk, bebidas.pk, Decimal('3.00'), 5), (soda.pk, bebidas.pk, Decimal('1.00'), 0)],
+        )
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Backend comida_al_paso.db.sqlite3')
+class SQLiteTests(TransactionTestCase):
+    """PRAGMAs y BEGIN IMMEDIATE de comida_al_paso.db.sqlite3"""
+
+    def _conexion(self, **opciones):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        conexion = SQLiteWrapper({
+            **connection.settings_dict, 'NAME': os.path.join(directorio.name, 'prueba.sqlite3'), 'OPTIONS': opciones,
+        }, alias='prueba')
+        self.addCleanup(conexion.close)
+        return conexion
+
+    def _pragma(self, conexion, nombre):
+        with conexion.cursor() as cursor:
+            cursor.execute('PRAGMA %s' % nombre)
+            return cursor.fetchone()[0]
+
+    def test_pragmas_en_cada_conexion(self):
+        conexion = self._conexion()
+        self.assertEqual(self._pragma(conexion, 'journal_mode'), 'wal')
+        self.assertEqual(self._pragma(conexion, 'synchronous'), 1)  # NORMAL
+        self.assertEqual(self._pragma(conexion, 'busy_timeout'), 5000)
+        self.assertEqual(self._pragma(conexion, 'temp_store'), 2)  # MEMORY
+        conexion.close()
+        self.assertEqual(self._pragma(conexion, 'synchronous'), 1)
+
+    def test_pragmas_de_options(self):
+        conexion = self._conexion(pragmas={'busy_timeout': 250, 'cache_size': -1024})
+        self.assertEqual(self._pragma(conexion, 'busy_timeout'), 250)
+        self.assertEqual(self._pragma(conexion, 'cache_size'), -1024)
+        self.assertEqual(self._pragma(conexion, 'journal_mode'), 'wal')
+        self.assertEqual(conexion.get_connection_params()['timeout'], 0.25)
+
+    def test_modo_de_transaccion_invalido(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self._conexion(transaction_mode='sin-lock').get_connection_params()
+
+    def test_atomic_toma_el_lock_de_escritura_al_empezar(self):
+        otra = sqlite3.connect(connection.settings_dict['NAME'], timeout=0, isolation_level=None)
+        self.addCleanup(otra.close)
+        with transaction.atomic():
+            # Todavía no escribió nada: con BEGIN DEFERRED el otro podría empezar
+            Producto.objects.count()
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                otra.execute('BEGIN IMMEDIATE')
+        otra.execute('BEGIN IMMEDIATE')
+        otra.execute('ROLLBACK')
+
+    def test_una_lectura_abierta_no_frena_el_commit(self):
+        Categoria.objects.create(nombre='Minutas')
+        otra = sqlite3.connect(connection.settings_dict['NAME'], timeout=0, isolation_level=None)
+        self.addCleanup(otra.close)
+        otra.execute('BEGIN')
+        self.assertEqual(otra.execute('SELECT COUNT(*) FROM api_categoria').fetchone()[0], 1)
+        # Sin WAL el commit espera a que el lector suelte su lock (busy_timeout) y falla
+        Categoria.objects.create(nombre='Postres')
+        # El lector sigue viendo su snapshot hasta terminar
+        self.assertEqual(otra.execute('SELECT COUNT(*) FROM api_categoria').fetchone()[0], 1)
+        otra.execute('COMMIT')
+        self.assertEqual(otra.execute('SELECT COUNT(*) FROM api_categoria').fetchone()[0], 2)
+
+    def test_is_usable(self):
+        conexion = self._conexion()
+        conexion.ensure_connection()
+        self.assertTrue(conexion.is_usable())
+        conexion.connection.close()
+        self.assertFalse(conexion.is_usable())
+
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    """Varias cajas venden los mismos productos a la vez, cada una desde su thread y su conexión"""
+
+    CAJAS = 8
+    VENTAS = 10
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nombre='Empanadas')
+        self.carne = Producto.objects.create(nombre='Carne', categoria=categoria, precio=Decimal('1.50'), stock=25)
+        self.pollo = Producto.objects.create(nombre='Pollo', categoria=categoria, precio=Decimal('1.50'), stock=40)
+
+    def _en_paralelo(self, vender):
+        """Cada caja llama VENTAS veces a vender(); cuenta las vendidas y las rechazadas"""
+        resultados = Counter()
+        errores = []
+        lock = threading.Lock()
+        largada = threading.Barrier(self.CAJAS)
+
+        def caja():
+            try:
+                largada.wait()
+                for _ in range(self.VENTAS):
+                    try:
+                        vender()
+                        resultado = 'vendidas'
+                    except (StockInsuficiente, ProductoNoDisponible):
+                        resultado = 'rechazadas'
+                    with lock:
+                        resultados[resultado] += 1
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connections.close_all()
+
+        cajas = [threading.Thread(target=caja) for _ in range(self.CAJAS)]
+        for hilo in cajas:
+            hilo.start()
+        for hilo in cajas:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        return resultados
+
+    def test_nunca_se_vende_de_mas(self):
+        resultados = self._en_paralelo(lambda: reservar_lote([(self.carne.pk, 1), (self.pollo.pk, 1)]))
+        self.assertEqual(resultados, {'vendidas': 25, 'rechazadas': self.CAJAS * self.VENTAS - 25})
+        carne = Producto.objects.get(pk=self.carne.pk)
+        self.assertEqual((carne.stock, carne.disponible), (0, False))
+        self.assertEqual(Producto.objects.get(pk=self.pollo.pk).stock, 15)
+
+    def test_pedidos_en_paralelo(self):
+        # 25 de carne de a 2: entran 12 pedidos y queda 1
+        resultados = self._en_paralelo(lambda: pedidos.crear_pedido([(self.carne.pk, 2), (self.pollo.pk, 1)]))
+        self.assertEqual(resultados, {'vendidas': 12, 'rechazadas': self.CAJAS * self.VENTAS - 12})
+        self.assertEqual(Pedido.objects.count(), 12)
+        self.assertEqual(
+            sorted(PedidoItem.objects.values_list('producto_id').annotate(total=Sum('cantidad'))),
+            sorted([(self.carne.pk, 24), (self.pollo.pk, 12)]),
+        )
+        carne = Producto.objects.get(pk=self.carne.pk)
+        self.assertEqual((carne.stock, carne.disponible), (1, True))
+        self.assertEqual(Producto.objects.get(pk=self.pollo.pk).stock, 28)
+
+
+@_sin_throttle()
+class SerializacionTests(TestCase):
+    """Los listados con values_list() (api/serializers.py) dan los mismos bytes que los serializers de DRF"""
+
+    @classmethod
+    def setUpTestData(cls):
+        sin_descripcion = Categoria.objects.create(nombre='Sin descripción', descripcion=None)
+        rara = Categoria.objects.create(
+            nombre='Bebidas "frías" \\ <b>', descripcion='Línea\u2028y párrafo\u2029 </script> ☕ 😀',
+        )
+        vacia = Categoria.objects.create(nombre='Postres', descripcion='')
+        for nombre, categoria, precio in (
+            ('Agua', sin_descripcion, Decimal('0')),
+            ('Caramelo', sin_descripcion, Decimal('0.01')),
+            ('Café "doble"\n\ttab', rara, Decimal('0.5')),
+            ('Té\u2028verde', rara, Decimal('10')),
+            ('Flan & dulce <de> leche', vacia, Decimal('99999999.99')),
+            ('Budín', vacia, Decimal('1E+2')),
+        ):
+            Producto.objects.create(nombre=nombre, categoria=categoria, precio=precio, stock=3)
+
+    def setUp(self):
+        backend = cache.get_backend()
+        if backend is not None:
+            backend.clear()
+
+    def _render(self, datos):
+        return JSONRendererMedido().render(datos)
+
+    def _serializer(self, productos):
+        return self._render(ProductoSerializer(productos.select_related('categoria'), many=True).data)
+
+    def test_representacion_igual_al_serializer(self):
+        productos = Producto.objects.order_by('id')
+        self.assertEqual(
+            self._render(representar_productos(productos_values(productos))), self._serializer(productos)
+        )
+
+    def test_precios_con_el_formato_de_decimalfield(self):
+        # Los Decimal del snapshot o de memoria no siempre vienen con dos decimales como de la base
+        categoria = Categoria(nombre='Minutas', descripcion=None)
+        for precio in (Decimal('1E+2'), Decimal('0.5'), Decimal('7'), Decimal('-0'), Decimal('2.345'), Decimal('2.355')):
+            with self.subTest(precio=precio):
+                producto = Producto(nombre='Milanesa', categoria=categoria, precio=precio, stock=1)
+                self.assertEqual(
+                    representar_productos([('Milanesa', 'Minutas', precio, 1, None)]),
+                    ProductoSerializer([producto], many=True).data,
+                )
+
+    def test_listados_iguales_al_serializer(self):
+        self.assertEqual(
+            self.client.get('/api/productos/').content, self._serializer(Producto.objects.order_by('id'))
+        )
+        self.assertEqual(
+            self.client.get('/api/productos/Postres/').content,
+            self._serializer(Producto.objects.filter(categoria__nombre='Postres').order_by('id')),
+        )
+
+    def test_pagina_igual_al_serializer(self):
+        contenido = self.client.get('/api/productos/?page_size=100').json()
+        esperado = self._serializer(Producto.objects.order_by('created_at', 'id'))
+        self.assertEqual(self._render(contenido['results']), esperado)
+
+    def test_categorias_iguales_al_serializer(self):
+        categorias = CategoriaSerializer(Categoria.objects.order_by('id'), many=True).data
+        self.assertEqual(
+            self.client.get('/api/categorias/').content,
+            self._render({'count': len(categorias), 'next': None, 'previous': None, 'results': categorias}),
+        )
+
+
+@_sin_throttle()
+class CompresionTests(CatalogoTestCase):
+    """Negociación de Accept-Encoding y compresión de CompresionMiddleware"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Un catálogo por encima de COMPRESION['MIN_BYTES']
+        for i in range(3, 20):
+            Producto.objects.create(nombre='Milanesa %d' % i, categoria=cls.categoria, precio=Decimal('10.50'), stock=10)
+
+    def setUp(self):
+        super().setUp()
+        parche = mock.patch.object(compresion, '_cuerpos', None)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def test_negociacion(self):
+        for accept_encoding, esperada in (
+            ('gzip', 'gzip'),
+            ('gzip, br', 'br'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('GZIP;q=0.8, deflate', 'gzip'),
+            ('*', 'br'),
+            ('br;q=0, *', 'gzip'),
+            ('gzip;q=0', None),
+            ('gzip;q=nada', None),
+            ('identity', None),
+            ('', None),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                self.assertEqual(compresion.negociar(accept_encoding), esperada)
+
+    def test_negociacion_sin_brotli(self):
+        with mock.patch.object(compresion, 'brotli', None):
+            self.assertIsNone(compresion.negociar('br'))
+            self.assertEqual(compresion.negociar('br, gzip;q=0.1'), 'gzip')
+
+    def test_comprime_el_catalogo(self):
+        original = self.client.get('/api/productos/')
+        self.assertFalse(original.has_header('Content-Encoding'))
+        for codificacion, descomprimir in (('gzip', gzip.decompress), ('br', brotli.decompress)):
+            with self.subTest(codificacion=codificacion):
+                respuesta = self.client.get('/api/productos/', HTTP_ACCEPT_ENCODING=codificacion)
+                self.assertEqual(respuesta['Content-Encoding'], codificacion)
+                self.assertEqual(descomprimir(respuesta.content), original.content)
+                self.assertEqual(respuesta['Content-Length'], str(len(respuesta.content)))
+                self.assertIn('Accept-Encoding', respuesta['Vary'])
+                self.assertEqual(respuesta['ETag'], 'W/' + original['ETag'])
+
+    @override_settings(COMPRESION={**settings.COMPRESION, 'MIN_BYTES': 0})
+    def test_comprime_los_tres_formatos(self):
+        for tipo in ('application/json', CompactoRenderer.media_type, 'application/msgpack'):
+            with self.subTest(tipo=tipo):
+                crudo = self.client.get('/api/productos/Minutas/', HTTP_ACCEPT=tipo).content
+                respuesta = self.client.get('/api/productos/Minutas/', HTTP_ACCEPT=tipo, HTTP_ACCEPT_ENCODING='gzip')
+                self.assertEqual(respuesta['Content-Type'], tipo)
+                self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(respuesta.content), crudo)
+
+    def test_etag_debil_da_304(self):
+        etag = self.client.get('/api/productos/', HTTP_ACCEPT_ENCODING='br')['ETag']
+        respuesta = self.client.get('/api/productos/', HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_cuerpo_comprimido_una_vez_por_version(self):
+        antes = compresion.estadisticas.as_dict()
+        primera = self.client.get('/api/productos/', HTTP_ACCEPT_ENCODING='gzip').content
+        segunda = self.client.get('/api/productos/', HTTP_ACCEPT_ENCODING='gzip').content
+        despues = compresion.estadisticas.as_dict()
+        self.assertEqual(primera, segunda)
+        self.assertEqual(despues['hits'] - antes['hits'], 1)
+
+    def test_lo_que_no_se_comprime(self):
+        chica = self.client.get('/api/categorias/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(chica.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', chica['Vary'])
+        # El HTML lleva el token CSRF (BREACH)
+        middleware = CompresionMiddleware(lambda request: HttpResponse('<p>Menú</p>' * 200))
+        html = middleware(RequestFactory().get('/api/productos/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertFalse(html.has_header('Content-Encoding'))
+        stream = self.client.get('/api/productos/?stream=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(stream.has_header('Content-Encoding'))
+        self.assertIn(b'Milanesa 19', b''.join(stream.streaming_content))
+
+
+@_sin_throttle()
+class FormatosTests(CatalogoTestCase):
+    """Representación compacta y MessagePack de los listados"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        otra = Categoria.objects.create(nombre='Postres', descripcion='Dulces')
+        Producto.objects.create(nombre='Flan', categoria=otra, precio=Decimal('4'), stock=2)
+
+    def _descompactar(self, datos):
+        filas = []
+        for valores in datos['filas']:
+            fila = dict(zip(datos['columnas'], valores))
+            categoria = datos['categorias'][fila['categoria']]
+            fila['categoria'] = categoria['nombre']
+            fila.update((clave, valor) for clave, valor in categoria.items() if clave != 'nombre')
+            filas.append(fila)
+        return filas
+
+    def test_compacto_con_las_categorias_una_vez(self):
+        json_ = self.client.get('/api/productos/').json()
+        respuesta = self.client.get('/api/productos/', HTTP_ACCEPT=CompactoRenderer.media_type)
+        self.assertEqual(respuesta['Content-Type'], CompactoRenderer.media_type)
+        datos = respuesta.json()
+        self.assertEqual([c['nombre'] for c in datos['categorias']], ['Minutas', 'Postres'])
+        self.assertEqual(self._descompactar(datos), json_)
+
+    def test_compacto_de_una_pagina(self):
+        respuesta = self.client.get('/api/productos/?page_size=2', HTTP_ACCEPT=CompactoRenderer.media_type)
+        datos = respuesta.json()
+        self.assertIsNotNone(datos['next'])
+        self.assertEqual(len(datos['results']['filas']), 2)
+
+    def test_compacto_de_lo_que_no_es_un_listado(self):
+        self.assertEqual(compactar({'error': 'No encontrado'}), {'error': 'No encontrado'})
+        self.assertEqual(compactar([]), {'columnas': [], 'filas': []})
+        self.assertEqual(
+            compactar([{'id': 1, 'nombre': 'Minutas'}]), {'columnas': ['id', 'nombre'], 'filas': [[1, 'Minutas']]}
+        )
+
+    def test_msgpack_igual_al_compacto(self):
+        compacto = self.client.get('/api/productos/', HTTP_ACCEPT=CompactoRenderer.media_type).json()
+        respuesta = self.client.get('/api/productos/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(respuesta['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(respuesta.content), compacto)
+
+
+@_sin_throttle()
+class CambiosTests(CatalogoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hub_original = cambios.hub
+        cambios.hub = cambios.HubCambios(intervalo=0)
+
+    def tearDown(self):
+        cambios.hub = self.hub_original
+
+    def _cambios(self, since):
+        return self.client.get('/api/productos/cambios/', {'since': since}).json()
+
+    def test_since_posterior_a_la_version_es_completo(self):
+        version = self._cambios(0)['version']
+        self.assertFalse(self._cambios(version)['completo'])
+        for since in (version + 1, 2**62):
+            with self.subTest(since=since):
+                datos = self._cambios(since)
+                self.assertTrue(datos['completo'])
+                self.assertEqual(datos['version'], version)
+
+    def test_since_anterior_a_la_base_es_completo(self):
+        version = self._cambios(0)['version']
+        self.assertTrue(self._cambios(version - 1)['completo'])
+
+    def test_versiones_anteriores_a_las_consultas(self):
+        # Lo que otro worker confirme después de la primera consulta tiene que
+        # quedar con una versión mayor que las de estos eventos
+        hub = cambios.hub
+        hub.sondear()
+        Producto.objects.filter(pk__in=[p.pk for p in self.productos]).update(stock=5, updated_at=timezone.now())
+        consultas = []
+
+        def primera_consulta(execute, sql, params, many, context):
+            consultas.append(time.time_ns() // 1000)
+            return execute(sql, params, many, context)
+
+        version = hub.version()
+        with connection.execute_wrapper(primera_consulta):
+            hub.sondear()
+        eventos = hub.desde(version)
+        self.assertEqual(len(eventos), 3)
+        self.assertLessEqual(eventos[-1].id, consultas[0])
+        self.assertEqual(hub.version(), eventos[-1].id)
+
+
+@_sin_throttle()
+class PresupuestoConsultasTests(CatalogoTestCase):
+    """Consultas por request (middleware incluido): no crecen con el catálogo ni con el pedido"""
+
+    LECTURAS = (
+        ('/api/productos/', 2),
+        ('/api/productos/Minutas/', 2),
+        ('/api/productos/?page_size=2', 2),
+        ('/api/categorias/', 3),
+    )
+
+    def _agrandar_catalogo(self):
+        for i in range(20):
+            categoria = Categoria.objects.create(nombre='Extra %d' % i)
+            Producto.objects.bulk_create(
+                Producto(nombre='Extra %d-%d' % (i, j), categoria=categoria, precio=Decimal('1.00'), stock=5)
+                for j in range(5)
+            )
+
+    def _lecturas(self):
+        for ruta, maximo in self.LECTURAS:
+            with self.subTest(ruta=ruta):
+                cache.get_backend().clear()
+                with assert_max_queries(maximo):
+                    respuesta = self.client.get(ruta)
+                self.assertEqual(respuesta.status_code, 200)
+
+    def test_todas_las_vistas_tienen_presupuesto(self):
+        acciones = set(View.http_method_names) | {'list', 'retrieve', 'create', 'update', 'partial_update', 'destroy'}
+        vistas = [
+            (modulo, nombre, vista) for modulo in (views, views_async) for nombre, vista in vars(modulo).items()
+        ]
+        for modulo, nombre, vista in vistas:
+            if nombre.startswith('_') or getattr(vista, '__module__', None) != modulo.__name__:
+                continue
+            with self.subTest(vista='%s.%s' % (modulo.__name__, nombre)):
+                # @api_view y los ViewSet: cada método o acción tiene el suyo
+                clase = vista if isinstance(vista, type) else getattr(vista, 'cls', None)
+                if clase is None:
+                    metodos = [vista]
+                else:
+                    metodos = [metodo for accion, metodo in vars(clase).items() if accion in acciones]
+                self.assertTrue(metodos)
+                for metodo in metodos:
+                    # El handler de @api_view llama a la función decorada sin copiar sus atributos
+                    metodo = inspect.getclosurevars(metodo).nonlocals.get('func', metodo)
+                    self.assertTrue(hasattr(metodo, 'query_budget'), metodo)
+
+    def test_lecturas_del_catalogo(self):
+        self._lecturas()
+        self._agrandar_catalogo()
+        self._lecturas()
+
+    def test_hit_de_la_cache_no_consulta(self):
+        self.client.get('/api/productos/')
+        with assert_max_queries(0):
+            respuesta = self.client.get('/api/productos/')
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+
+    def test_pedido_con_consultas_fijas(self):
+        self.client.force_login(User.objects.create_user('caja'))
+        self._agrandar_catalogo()
+        for cantidad in (1, 20):
+            ids = list(Producto.objects.order_by('id').values_list('pk', flat=True)[:cantidad])
+            with self.subTest(items=cantidad), assert_max_queries(8):
+                respuesta = self.client.post('/api/pedidos/', {
+                    'items': [{'producto': pk, 'cantidad': 1} for pk in ids],
+                }, content_type='application/json')
+            self.assertEqual(respuesta.status_code, 201)
+
+    def test_reserva_en_lote_con_consultas_fijas(self):
+        # Las del presupuesto (BEGIN, UPDATE y SELECT) más sesión, usuario y el
+        # RELEASE del savepoint del test; un rechazo suma el ROLLBACK TO
+        self.client.force_login(User.objects.create_user('caja'))
+        self._agrandar_catalogo()
+        for cantidad, unidades, maximo in ((1, 1, 6), (20, 1, 6), (20, 100, 7)):
+            ids = list(Producto.objects.order_by('id').values_list('pk', flat=True)[:cantidad])
+            with self.subTest(items=cantidad, unidades=unidades), assert_max_queries(maximo):
+                self.client.post('/api/productos/reservar/', {
+                    'items': [{'producto': pk, 'cantidad': unidades} for pk in ids],
+                }, content_type='application/json')
+
+    def test_excedido_lista_las_consultas(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'Se ejecutaron 2 consultas (máximo: 1)'):
+            with assert_max_queries(1):
+                list(Categoria.objects.all())
+                list(Producto.objects.all())
+
+
+class AutenticacionJWTTests(TestCase):
+    """Usuarios de CachedJWTAuthentication: cacheados por id e invalidados al guardarlos"""
+
+    def setUp(self):
+        autenticacion.usuarios.limpiar()
+        self.addCleanup(autenticacion.usuarios.limpiar)
+        self.usuario = User.objects.create_user(username='pos', password='clave-1')
+
+    def _autenticar(self, token=None):
+        token = token or AccessToken.for_user(self.usuario)
+        request = RequestFactory().get('/api/categorias/', headers={'Authorization': 'Bearer %s' % token})
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def _guardar(self, **campos):
+        for campo, valor in campos.items():
+            setattr(self.usuario, campo, valor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+
+    def test_segundo_request_sin_consultas(self):
+        self._autenticar()
+        with self.assertNumQueries(0):
+            usuario = self._autenticar()
+        self.assertEqual(usuario.pk, self.usuario.pk)
+
+    def test_cada_request_recibe_su_copia(self):
+        self._autenticar().is_staff = True
+        self.assertFalse(self._autenticar().is_staff)
+
+    def test_desactivar_invalida(self):
+        token = AccessToken.for_user(self.usuario)
+        self._autenticar(token)
+        self._guardar(is_active=False)
+        with self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)
+
+    def test_guardar_invalida(self):
+        self._autenticar()
+        self._guardar(is_staff=True)
+        with self.assertNumQueries(1):
+            self.assertTrue(self._autenticar().is_staff)
+
+    def test_borrar_invalida(self):
+        token = AccessToken.for_user(self.usuario)
+        self._autenticar(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)
+
+    # simplejwt no relee sus settings en los módulos que ya los importaron
+    # (override_settings no alcanza): se cambia el objeto que comparten
+    @mock.patch.object(autenticacion.api_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_cambio_de_contrasena_revoca_desde_la_cache(self):
+        token = AccessToken.for_user(self.usuario)
+        self._autenticar(token)
+        self.usuario.set_password('clave-2')
+        self._guardar()
+        with self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)
+        self._autenticar()
+        with self.assertRaises(AuthenticationFailed):
+            self._autenticar(token)  # ahora contra la copia cacheada
+
+    def test_lectura_que_se_cruza_con_una_invalidacion_no_se_guarda(self):
+        generacion = autenticacion.usuarios.generacion()
+        autenticacion.usuarios.invalidar(self.usuario.pk)
+        autenticacion.usuarios.set(self.usuario.pk, self.usuario, generacion)
+        self.assertIsNone(autenticacion.usuarios.get(self.usuario.pk))
+
+    def test_invalidar_en_un_worker_llega_a_los_demas(self):
+        compartido = caches['default']
+        self.addCleanup(compartido.clear)
+        worker_a, worker_b = (CacheUsuarios(compartido=compartido) for _ in range(2))
+        worker_a.set(self.usuario.pk, self.usuario, worker_a.generacion(self.usuario.pk))
+        self.assertIsNotNone(worker_a.get(self.usuario.pk))
+        worker_b.invalidar(self.usuario.pk)
+        self.assertIsNone(worker_a.get(self.usuario.pk))
+        worker_a.set(self.usuario.pk, self.usuario, worker_a.generacion(self.usuario.pk))
+        self.assertIsNotNone(worker_a.get(self.usuario.pk))
+
+    def test_alta_con_usuario_desactivado_es_401(self):
+        token = AccessToken.for_user(self.usuario)
+        self._autenticar(token)
+        self._guardar(is_active=False)
+        respuesta = self.client.post(
+            '/api/categorias/', {'nombre': 'Postres'}, content_type='application/json',
+            headers={'Authorization': 'Bearer %s' % token},
+        )
+        self.assertEqual(respuesta.status_code, 401)
+
+
+@_sin_throttle()
+class VistasAsyncTests(CatalogoTestCase):
+    """Las lecturas de api/views_async.py (SERVER_MODE=asgi) responden lo mismo que las sync"""
+
+    def setUp(self):
+        super().setUp()
+        self.fabrica = AsyncRequestFactory()
+
+    async def test_listado_async_pasa_por_la_cache(self):
+        primera = await views_async.productos_list(self.fabrica.get('/api/productos/'))
+        segunda = await views_async.productos_list(self.fabrica.get('/api/productos/'))
+        self.assertEqual((primera['X-Cache'], segunda['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(primera.content, segunda.content)
+
+    async def test_delegada_no_revisa_la_cache_dos_veces(self):
+        await views_async.productos_list(self.fabrica.get('/api/productos/?page_size=2'))
+        antes = cache.estadisticas.as_dict()
+        respuesta = await views_async.productos_list(self.fabrica.get('/api/productos/?page_size=2'))
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+        self.assertEqual(cache.estadisticas.as_dict()['hits'], antes['hits'] + 1)
+
+    @override_settings(QUERY_BUDGET={'RAISE': True})
+    async def test_listado_async_dentro_del_presupuesto(self):
+        respuesta = await views_async.productos_por_categoria(
+            self.fabrica.get('/api/productos/Minutas/'), 'Minutas'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+
+    async def test_mismos_bytes_que_la_vista_sync(self):
+        asincronica = await views_async.productos_list(self.fabrica.get('/api/productos/'))
+        cache.get_backend().clear()
+        sincronica = await sync_to_async(self.client.get)('/api/productos/')
+        self.assertEqual(asincronica.content, sincronica.content)
+
+    @override_settings(MENU_SNAPSHOT={'ACTIVO': True, 'INTERVALO': 1.0})
+    async def test_snapshot_con_los_mismos_bytes(self):
+        sin_snapshot = await sync_to_async(self.client.get)('/api/productos/Minutas/')
+        cache.get_backend().clear()
+        snapshot.motor.invalidar()
+        con_snapshot = await views_async.productos_por_categoria(
+            self.fabrica.get('/api/productos/Minutas/'), 'Minutas'
+        )
+        self.assertEqual(con_snapshot.content, sin_snapshot.content)
+
+    async def test_alta_con_jwt_pasa_el_csrf(self):
+        usuario = await User.objects.acreate(username='pos')
+        request = self.fabrica.post(
+            '/api/productos/',
+            {'nombre_producto': 'Napolitana', 'nombre_categoria': 'Minutas', 'precio': '12.00'},
+            content_type='application/json',
+            headers={'Authorization': 'Bearer %s' % AccessToken.for_user(usuario)},
+        )
+        request._dont_enforce_csrf_checks = False
+        csrf = CsrfViewMiddleware(views_async.productos_list)
+        self.assertIsNone(csrf.process_view(request, views_async.productos_list, (), {}))
+        respuesta = await views_async.productos_list(request)
+        self.assertEqual(respuesta.status_code, 201)
+
+    async def test_alta_con_sesion_exige_csrf(self):
+        datos = {'nombre_producto': 'Napolitana', 'nombre_categoria': 'Minutas', 'precio': '12.00'}
+        usuario = await User.objects.acreate(username='encargado')
+        for token in (None, 'ok'):
+            request = self.fabrica.post('/api/productos/', datos, content_type='application/json')
+            request._dont_enforce_csrf_checks = False
+            request.user = usuario  # autenticado por sesión (AuthenticationMiddleware)
+            if token:
+                request.COOKIES[settings.CSRF_COOKIE_NAME] = request.META['HTTP_X_CSRFTOKEN'] = get_token(request)
+            respuesta = await views_async.productos_list(request)
+            with self.subTest(token=token):
+                self.assertEqual(respuesta.status_code, 201 if token else 403)
+        self.assertEqual(await Producto.objects.filter(nombre='Napolitana').acount(), 1)
+
+
+def _resultado_benchmark(escenario=None, **meta):
+    return {
+        'meta': {'productos': 1000, 'categorias': 20, 'modo': 'cliente', 'servidor': 'wsgi', 'sin_cache': False, **meta},
+        'escenarios': {'productos_list': {
+            'requests': 200, 'errores': 0, 'rps': 500.0, 'p50_ms': 1.5, 'p95_ms': 2.0, 'p99_ms': 3.0,
+            'consultas': 1.0, 'bytes': 1000, **(escenario or {}),
+        }},
+        'rss_pico_kb': 60000,
+    }
+
+
+class BenchmarkTests(SimpleTestCase):
+    """manage.py benchmark --comparar: qué cuenta como regresión contra la línea base"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        self.base = self._guardar('base.json', _resultado_benchmark())
+
+    def _guardar(self, nombre, resultado):
+        archivo = os.path.join(self.directorio, nombre)
+        with open(archivo, 'w') as salida:
+            json.dump(resultado, salida)
+        return archivo
+
+    def _comparar(self, resultado, *opciones, salida=None):
+        salida = salida or StringIO()
+        call_command(
+            'benchmark', '--resultado', self._guardar('actual.json', resultado), '--comparar', self.base,
+            *opciones, stdout=salida,
+        )
+        return salida.getvalue()
+
+    def _regresiones(self, resultado, *opciones):
+        salida = StringIO()
+        with self.assertRaisesMessage(CommandError, 'regresiones contra %s' % self.base):
+            self._comparar(resultado, *opciones, salida=salida)
+        return [linea for linea in salida.getvalue().splitlines() if '✗' in linea]
+
+    def test_dentro_de_la_tolerancia(self):
+        salida = self._comparar(_resultado_benchmark({'p95_ms': 2.2, 'rps': 440.0}), '--tolerancia', '0.15')
+        self.assertIn('Sin regresiones', salida)
+
+    def test_regresiones(self):
+        actual = _resultado_benchmark({'p95_ms': 2.5, 'rps': 400.0, 'consultas': 2.0, 'errores': 1})
+        actual['rss_pico_kb'] = 90000
+        self.assertEqual(self._regresiones(actual), [
+            '✗ productos_list: p95 2.00 -> 2.50 ms',
+            '✗ productos_list: 500.0 -> 400.0 req/s',
+            '✗ productos_list: 1.0 -> 2.0 consultas por request',
+            '✗ productos_list: 0 -> 1 errores',
+            '✗ pico de RSS 60000 -> 90000 KB',
+        ])
+
+    def test_consultas_sin_tolerancia(self):
+        actual = _resultado_benchmark({'consultas': 1.01})
+        self.assertEqual(len(self._regresiones(actual, '--tolerancia', '10')), 1)
+
+    def test_tolerancia(self):
+        actual = _resultado_benchmark({'p95_ms': 2.5})
+        self.assertEqual(len(self._regresiones(actual, '--tolerancia', '0.2')), 1)
+        self.assertIn('Sin regresiones', self._comparar(actual, '--tolerancia', '0.3'))
+
+    def test_escenario_nuevo_no_se_compara(self):
+        actual = _resultado_benchmark()
+        actual['escenarios']['token'] = {**actual['escenarios']['productos_list'], 'p95_ms': 500.0}
+        self.assertIn('Sin regresiones', self._comparar(actual))
+
+    def test_otra_configuracion_avisa(self):
+        salida = self._comparar(_resultado_benchmark(productos=5000))
+        self.assertIn('La línea base usa otro productos (1000, ahora 5000)', salida)
+
+    def test_ambos_servidores_sin_linea_base(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--servidor', 'ambos', '--comparar', self.base, stdout=StringIO())
+
+    @mock.patch.dict(os.environ, {'LOG_ARCHIVO': ''})
+    def test_corrida_contra_su_propio_resultado(self):
+        salida = os.path.join(self.directorio, 'corrida.json')
+        opciones = [
+            '--productos', '20', '--categorias', '2', '--requests', '5', '--calentamiento', '1',
+            '--escenarios', 'productos_list,categorias_list', '--directorio', self.directorio,
+        ]
+        call_command('benchmark', *opciones, '--salida', salida, stdout=StringIO())
+        with open(salida) as archivo:
+            resultado = json.load(archivo)
+        self.assertEqual(list(resultado['escenarios']), ['productos_list', 'categorias_list'])
+        self.assertEqual(resultado['escenarios']['productos_list']['errores'], 0)
+        self.base = salida
+        self.assertIn('Sin regresiones', self._comparar(resultado))
+
+
+class RegistroTests(SimpleTestCase):
+    def _destinos(self, **opciones):
+        with tempfile.TemporaryDirectory() as directorio:
+            manejador = registro.crear_manejador_en_cola(
+                os.path.join(directorio, 'django.log'), consola=False, **opciones
+            )
+            atexit.unregister(manejador.listener.stop)
+            manejador.listener.stop()
+            for destino in manejador.listener.handlers:
+                destino.close()
+        return [type(destino) for destino in manejador.listener.handlers]
+
+    def test_un_proceso_rota_el_archivo(self):
+        self.assertEqual(self._destinos(), [RotatingFileHandler])
+
+    def test_varios_workers_no_rotan(self):
+        self.assertEqual(self._destinos(rotacion='externa'), [WatchedFileHandler])
+
+    def test_rotacion_desconocida(self):
+        with self.assertRaises(ValueError):
+            self._destinos(rotacion='worker')
+
+    def test_las_pruebas_no_escriben_logs(self):
+        if os.getenv('LOG_ARCHIVO') or os.getenv('LOG_CONSOLA', '').lower() in ('true', '1', 'yes'):
+            self.skipTest('Logs pedidos con LOG_ARCHIVO / LOG_CONSOLA')
+        self.assertTrue(settings.EJECUTANDO_TESTS)
+        self.assertEqual(logging.getLogger('api').handlers[0].listener.handlers, ())
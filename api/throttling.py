@@ -0,0 +1,276 @@
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .cache import LRUCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: sólo backend local
+    fcntl = None
+
+logger = logging.getLogger('api')
+
+PERIODOS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parsear_tasa(tasa):
+    """'120/min' -> (tokens por segundo, capacidad del bucket)"""
+    cantidad, periodo = tasa.split('/')
+    cantidad = int(cantidad)
+    return cantidad / PERIODOS[periodo.strip()[0]], cantidad
+
+
+def _recargar(tokens, ultimo, ahora, tasa, capacidad):
+    if ultimo is None or ahora < ultimo:
+        return float(capacidad)
+    return min(float(capacidad), tokens + (ahora - ultimo) * tasa)
+
+
+def _resultado(tokens, tasa, costo):
+    """(permitido, tokens que quedan, segundos hasta tener `costo` tokens)"""
+    if tokens >= costo:
+        return True, tokens - costo, 0.0
+    return False, tokens, (costo - tokens) / tasa
+
+
+class BucketsLocales:
+    """Token buckets en memoria de este proceso (cada worker limita por su cuenta)"""
+
+    def __init__(self, max_entries=100000):
+        self._buckets = LRUCache(max_entries=max_entries)
+        self._lock = threading.Lock()
+
+    def consumir(self, clave, tasa, capacidad, costo=1):
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, ultimo = self._buckets.get(clave, (None, None))
+            tokens = _recargar(tokens, ultimo, ahora, tasa, capacidad)
+            permitido, tokens, espera = _resultado(tokens, tasa, costo)
+            self._buckets.set(clave, (tokens, ahora))
+        return permitido, espera
+
+
+class BucketsCompartidos:
+    """
+    Token buckets en un archivo mapeado en memoria, compartido por todos los
+    workers de la máquina.
+
+    El archivo es una tabla hash de `slots` entradas (hash de la clave,
+    tokens, último acceso) con sondeo lineal; cuando no hay lugar se pisa el
+    bucket menos usado de la ventana. Cada operación toma un lock de fcntl
+    sobre el archivo (entre procesos) y un threading.Lock (entre threads).
+    """
+    SLOT = struct.Struct('<Qdd')
+    SONDEO = 8
+
+    def __init__(self, archivo, slots=65536):
+        self.archivo = archivo
+        self.slots = slots
+        self._lock = threading.Lock()
+        self._fd = None
+        self._mapa = None
+        self._pid = None
+
+    def _abrir(self):
+        # Se abre en cada proceso (después del fork de gunicorn)
+        if self._pid == os.getpid():
+            return
+        tamanio = self.slots * self.SLOT.size
+        fd = os.open(self.archivo, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size != tamanio:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size != tamanio:
+                    os.ftruncate(fd, tamanio)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+        self._fd = fd
+        self._mapa = mmap.mmap(fd, tamanio)
+        self._pid = os.getpid()
+
+    def consumir(self, clave, tasa, capacidad, costo=1):
+        digest = hashlib.blake2b(clave.encode('utf-8'), digest_size=8).digest()
+        codigo = int.from_bytes(digest, 'little') or 1
+        inicio = codigo % self.slots
+        ahora = time.monotonic()
+
+        with self._lock:
+            self._abrir()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                posicion, tokens, ultimo = self._buscar(codigo, inicio)
+                tokens = _recargar(tokens, ultimo, ahora, tasa, capacidad)
+                permitido, tokens, espera = _resultado(tokens, tasa, costo)
+                self.SLOT.pack_into(self._mapa, posicion, codigo, tokens, ahora)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return permitido, espera
+
+    def _buscar(self, codigo, inicio):
+        """(posición en el archivo, tokens, último acceso) del bucket de `codigo`"""
+        victima = None
+        for i in range(self.SONDEO):
+            posicion = ((inicio + i) % self.slots) * self.SLOT.size
+            guardado, tokens, ultimo = self.SLOT.unpack_from(self._mapa, posicion)
+            if guardado == codigo:
+                return posicion, tokens, ultimo
+            if guardado == 0:
+                return posicion, None, None
+            if victima is None or ultimo < victima[1]:
+                victima = (posicion, ultimo)
+        return victima[0], None, None
+
+
+class BucketsCache:
+    """
+    Token buckets en el cache de Django (Redis/Memcached entre máquinas).
+
+    La lectura y la escritura no son atómicas: con mucha concurrencia sobre
+    la misma clave puede pasar algún request de más.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consumir(self, clave, tasa, capacidad, costo=1):
+        ahora = time.time()
+        clave = 'throttle:' + clave
+        tokens, ultimo = self.cache.get(clave, (None, None))
+        tokens = _recargar(tokens, ultimo, ahora, tasa, capacidad)
+        permitido, tokens, espera = _resultado(tokens, tasa, costo)
+        self.cache.set(clave, (tokens, ahora), int(capacidad / tasa) + 1)
+        return permitido, espera
+
+
+def _config():
+    return getattr(settings, 'THROTTLE', {})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Store configurado en THROTTLE['BACKEND']: 'local', 'compartido' o 'cache'"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _crear_store(_config())
+    return _store
+
+
+def _crear_store(config):
+    backend = config.get('BACKEND', 'local')
+    if backend == 'compartido':
+        if fcntl is not None:
+            archivo = config.get('ARCHIVO') or os.path.join(
+                '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                'comida_al_paso_throttle',
+            )
+            return BucketsCompartidos(archivo, slots=config.get('SLOTS', 65536))
+        logger.warning("Throttle compartido no disponible en esta plataforma, se usa el local")
+    elif backend == 'cache':
+        return BucketsCache(config.get('CACHE_ALIAS', 'default'))
+    return BucketsLocales()
+
+
+def buscar_tasa(metodo, url_name, scope):
+    """
+    (regla, tasa) de THROTTLE['TASAS'] de lo más específico a lo más
+    general: 'POST categoria-list.anon', 'categoria-list.anon' y 'anon'.
+    (None, None) si ninguna aplica.
+    """
+    tasas = _config().get('TASAS', {})
+    candidatos = [scope]
+    if url_name:
+        candidatos[:0] = ['%s %s.%s' % (metodo, url_name, scope), '%s.%s' % (url_name, scope)]
+    for candidato in candidatos:
+        if candidato in tasas:
+            return candidato, tasas[candidato]
+    return None, None
+
+
+def consumir(regla, tasa, ident):
+    """(permitido, segundos de espera) para el cliente `ident` con la regla dada"""
+    por_segundo, capacidad = parsear_tasa(tasa)
+    permitido, espera = get_store().consumir('%s|%s' % (regla, ident), por_segundo, capacidad)
+    if not permitido:
+        logger.warning("Throttle %s para %s: reintentar en %.1fs", regla, ident, espera)
+    return permitido, espera
+
+
+def identificar(request, usuario):
+    """
+    (scope, identificador) del cliente: ('user', 'u<id>') o ('anon', IP).
+    `usuario` es el id que devolvió api.autenticacion.id_usuario (o None)
+    """
+    if usuario is not None:
+        return 'user', 'u%s' % usuario
+    return 'anon', BaseThrottle().get_ident(request)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttle de DRF con token bucket: tasa sostenida y ráfaga de hasta la
+    cantidad de la tasa.
+
+    La tasa se busca con buscar_tasa según el url_name de la ruta y el
+    scope del throttle. None desactiva el límite. Los requests que ya
+    limitó api.middleware.ThrottleMiddleware no se vuelven a contar.
+    """
+    scope = None
+
+    def get_tasa(self, request):
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match is not None else None
+        return buscar_tasa(request.method, url_name, self.scope)
+
+    def get_ident_cliente(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.espera = None
+        if getattr(request, 'throttle_revisado', False):
+            return True
+        ident = self.get_ident_cliente(request)
+        if ident is None:
+            return True
+        regla, tasa = self.get_tasa(request)
+        if tasa is None:
+            return True
+        permitido, self.espera = consumir(regla, tasa, ident)
+        return permitido
+
+    def wait(self):
+        return self.espera
+
+
+class AnonTokenBucketThrottle(TokenBucketThrottle):
+    """Limita a los clientes anónimos por IP"""
+    scope = 'anon'
+
+    def get_ident_cliente(self, request):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """Limita a los usuarios autenticados por id"""
+    scope = 'user'
+
+    def get_ident_cliente(self, request):
+        if request.user and request.user.is_authenticated:
+            return 'u%s' % request.user.pk
+        return None
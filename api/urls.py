@@ -1,18 +1,36 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import views, views_async
+
+# En modo ASGI las lecturas del catálogo usan las vistas async
+if settings.API_ASYNC:
+    from . import views_async as lecturas
+else:
+    lecturas = views
 
 router = DefaultRouter()
 router.register(r'categorias', views.CategoriaViewSet, basename='categoria')
 
 urlpatterns = [
-    path('', views.api_home, name='api-home'),
-    path('test/', views.test_api, name='test-api'),
+    path('', lecturas.api_home, name='api-home'),
+    path('test/', lecturas.test_api, name='test-api'),
+    path('cache/', views.cache_estadisticas, name='cache-estadisticas'),
+    path('estadisticas/', views.estadisticas_catalogo, name='estadisticas'),
+    path('metrics/', views.metricas, name='metricas'),
 
     # Rutas de Django REST Framework
     path('', include(router.urls)),
 
+    # PEDIDOS
+    path('pedidos/', views.pedidos_crear, name='pedidos-crear'),
+
     # PRODUCTOS
-    path('productos/', views.productos_list, name='productos-list'),
-    path('productos/<str:categoria_nombre>/', views.productos_por_categoria, name='productos-por-categoria'),
+    path('productos/', lecturas.productos_list, name='productos-list'),
+    path('productos/bulk/', views.productos_bulk, name='productos-bulk'),
+    path('productos/reservar/', views.productos_reservar_lote, name='productos-reservar-lote'),
+    path('productos/buscar/', views.productos_buscar, name='productos-buscar'),
+    path('productos/cambios/', views_async.productos_cambios, name='productos-cambios'),
+    path('productos/<int:pk>/reservar/', views.productos_reservar, name='productos-reservar'),
+    path('productos/<str:categoria_nombre>/', lecturas.productos_por_categoria, name='productos-por-categoria'),
 ]
@@ -1,67 +1,169 @@
 import logging
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_safe
+from comida_al_paso.db import pool
+from . import busqueda, cache, compresion, estadisticas, importacion, pedidos, snapshot
+from .autenticacion import AUTENTICACION_CON_USUARIO
+from .metricas import prometheus_pools, registro
+from .conditional import condicional, estado_categorias, estado_productos
+from .filtros import FiltroProductos
+from .importacion import DemasiadasFilas, FormatoInvalido, ImportadorProductos, decodificar, detectar_formato, leer_filas
 from .models import Categoria, Producto
+from .pagination import KeysetPagination
+from .permissions import IsStaffOrMetricsToken
+from .query_budget import query_budget
 from .serializers import (
     CategoriaSerializer,
-    ProductoSerializer,
+    PedidoSerializer,
     ProductoCreateSerializer,
+    ReservaLoteSerializer,
+    ReservaSerializer,
+    productos_values,
+    representador,
+    representar_productos,
 )
+from .stock import ProductoInexistente, ProductoNoDisponible, StockInsuficiente, reservar, reservar_lote
+from .streaming import ndjson_response
 
 # Configurar logger
 logger = logging.getLogger('api')
 
+API_INFO = {
+    'mensaje': 'Bienvenido a la API de Comida al Paso',
+    'version': '1.0.0',
+    'endpoints_disponibles': [
+        'GET  /api/ - Información de la API',
+        'GET  /api/test - Endpoint de prueba',
+        'POST /api/token/ - Obtener token JWT',
+        'POST /api/token/refresh/ - Refrescar token JWT',
+        'GET  /api/categorias/ - Obtener todas las categorías',
+        'POST /api/categorias/ - Crear nueva categoría (requiere autenticación)',
+        'GET  /api/productos/ - Obtener todos los productos (?precio_min, ?precio_max, ?disponible, ?stock_gt, ?categoria__in, ?ordering, ?fields, ?page_size, ?cursor, ?stream=1; Accept: application/vnd.comidaalpaso.compacto+json o application/msgpack para el formato compacto)',
+        'POST /api/productos/ - Crear nuevo producto (requiere autenticación)',
+        'POST /api/productos/bulk/ - Importación masiva de productos: JSON, CSV o NDJSON (requiere autenticación)',
+        'POST /api/productos/<id>/reservar/ - Reservar stock de un producto (requiere autenticación)',
+        'POST /api/productos/reservar/ - Reservar stock de varios productos (requiere autenticación)',
+        'POST /api/pedidos/ - Crear un pedido con varios items: descuenta stock y fija precios (requiere autenticación)',
+        'GET  /api/productos/buscar/?q= - Buscar productos por nombre, descripción o categoría',
+        'GET  /api/productos/cambios/?since= - Cambios del catálogo desde una versión (JSON, o SSE con Accept: text/event-stream)',
+        'GET  /api/productos/<categoria> - Productos por categoría',
+        'GET  /api/cache/ - Estadísticas de la cache del catálogo (requiere staff)',
+        'GET  /api/estadisticas/ - Productos, disponibilidad y valor del stock por categoría (requiere staff)',
+        'GET  /api/metrics/ - Métricas por vista en formato Prometheus (requiere staff o X-Metricas-Token)'
+    ],
+    'documentacion': 'Envía requests a los endpoints para interactuar con el inventario'
+}
+
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@query_budget(0)
 def api_home(request):
     """Página de inicio de la API"""
     logger.info("Acceso a la página de inicio de la API")
-    return Response({
-        'mensaje': 'Bienvenido a la API de Comida al Paso',
-        'version': '1.0.0',
-        'endpoints_disponibles': [
-            'GET  /api/ - Información de la API',
-            'GET  /api/test - Endpoint de prueba',
-            'POST /api/token/ - Obtener token JWT',
-            'POST /api/token/refresh/ - Refrescar token JWT',
-            'GET  /api/categorias/ - Obtener todas las categorías',
-            'POST /api/categorias/ - Crear nueva categoría (requiere autenticación)',
-            'GET  /api/productos/ - Obtener todos los productos',
-            'POST /api/productos/ - Crear nuevo producto (requiere autenticación)',
-            'GET  /api/productos/<categoria> - Productos por categoría'
-        ],
-        'documentacion': 'Envía requests a los endpoints para interactuar con el inventario'
-    })
+    return Response(API_INFO)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@query_budget(1)
 def test_api(request):
     """Endpoint de prueba"""
     logger.info("Test de API ejecutado")
-    total_categorias = Categoria.objects.count()
-    total_productos = Producto.objects.count()
+    # Los totales salen de las estadísticas cacheadas: a lo sumo una consulta
+    totales = estadisticas.obtener()['totales']
     return Response({
         'mensaje': 'API funcionando correctamente',
-        'total_categorias': total_categorias,
-        'total_productos': total_productos
+        'total_categorias': totales['categorias'],
+        'total_productos': totales['productos']
+    })
+
+
+@api_view(['GET'])
+@authentication_classes(AUTENTICACION_CON_USUARIO)
+@permission_classes([IsAdminUser])
+@query_budget(1)
+def estadisticas_catalogo(request):
+    """Productos, disponibilidad, stock y valor del stock por categoría (panel del encargado)"""
+    return Response(estadisticas.obtener())
+
+
+@require_safe
+@query_budget(0)
+def healthz(request):
+    """Chequeo de vida para balanceadores y monitores: no toca la base"""
+    respuesta = JsonResponse({'estado': 'ok'})
+    respuesta['Cache-Control'] = 'no-store'
+    return respuesta
+
+
+@api_view(['GET'])
+@authentication_classes(AUTENTICACION_CON_USUARIO)
+@permission_classes([IsAdminUser])
+@query_budget(0)
+def cache_estadisticas(request):
+    """Hits y misses de la cache del catálogo y de los cuerpos comprimidos en este proceso"""
+    backend = cache.get_backend()
+    return Response({
+        'backend': type(backend).__name__ if backend is not None else None,
+        'entradas': len(backend) if backend is not None else 0,
+        **cache.estadisticas.as_dict(),
+        'compresion': compresion.resumen(),
     })
 
 
+@api_view(['GET'])
+@authentication_classes(AUTENTICACION_CON_USUARIO)
+@permission_classes([IsStaffOrMetricsToken])
+@query_budget(0)
+def metricas(request):
+    """
+    Histogramas de tiempos, consultas y tamaño de respuesta por vista y
+    estado del pool de conexiones (Prometheus)
+    """
+    return HttpResponse(
+        registro.prometheus() + prometheus_pools(pool.estadisticas()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@method_decorator(cache.cache_catalogo('categoria'), name='dispatch')
+@method_decorator(condicional(estado_categorias), name='dispatch')
+@method_decorator(query_budget(2), name='list')
+@method_decorator(query_budget(1), name='retrieve')
+@method_decorator(query_budget(3), name='create')
+@method_decorator(query_budget(4), name='update')
+@method_decorator(query_budget(4), name='partial_update')
+@method_decorator(query_budget(6), name='destroy')
 class CategoriaViewSet(viewsets.ModelViewSet):
-    queryset = Categoria.objects.all()
+    queryset = Categoria.objects.order_by('id')
     serializer_class = CategoriaSerializer
-    permission_classes = [AllowAny]
+    # Listar y ver, público; crear, modificar y borrar, con usuario
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def list(self, request, *args, **kwargs):
+        """Listado con values(): mismo JSON que CategoriaSerializer sin instanciar modelos"""
+        queryset = self.filter_queryset(self.get_queryset())
+        filas = queryset.values(*CategoriaSerializer.Meta.fields)
+        pagina = self.paginate_queryset(filas)
+        if pagina is not None:
+            return self.get_paginated_response(list(pagina))
+        return Response(list(filas))
 
     def create(self, request, *args, **kwargs):
-        logger.info(f"Intento de crear categoría por usuario: {request.user}")
+        logger.info("Intento de crear categoría por usuario: %s", request.user)
         nombre = request.data.get('nombre')
         descripcion = request.data.get('descripcion', '')
 
@@ -72,36 +174,49 @@ class CategoriaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        serializer = self.get_serializer(data={'nombre': nombre, 'descripcion': descripcion})
+        if not serializer.is_valid():
+            logger.warning("Datos inválidos para crear categoría: %s", serializer.errors)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            categoria = Categoria.objects.create(
-                nombre=nombre,
-                descripcion=descripcion
-            )
-            serializer = self.get_serializer(categoria)
-            logger.info(f"Categoría creada exitosamente: {nombre}")
+            with transaction.atomic():
+                serializer.save()
+            logger.info("Categoría creada exitosamente: %s", nombre)
             return Response({
                 'mensaje': 'Categoría creada exitosamente',
                 'categoria': serializer.data
             }, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            # Otro request creó la misma categoría entre la validación y el INSERT
+            return Response(
+                {'nombre': ['Ya existe una categoría con ese nombre']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
-            logger.error(f"Error al crear categoría: {str(e)}")
+            logger.error("Error al crear categoría: %s", e)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
+@cache.cache_catalogo('producto', 'categoria')
+@condicional(estado_productos)
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
+@query_budget(3)
 def productos_list(request):
     """Listar todos los productos o crear uno nuevo"""
 
     # GET → abierto al público
     if request.method == 'GET':
         logger.info("Listado de productos solicitado")
-        productos = Producto.objects.all()
-        serializer = ProductoSerializer(productos, many=True)
-        return Response(serializer.data)
+        if snapshot.puede_responder(request):
+            # Del mismo estado que el ETag que le puso @condicional
+            return _respuesta_json(snapshot.motor.obtener(request.estado_catalogo).json_productos)
+
+        return _listar_productos(request, Producto.objects.all())
 
     # POST → requiere estar logueado
     if request.method == 'POST':
@@ -111,19 +226,21 @@ def productos_list(request):
                 status=status.HTTP_401_UNAUTHORIZED
             )
 
-        logger.info(f"Intento de crear producto por usuario: {request.user}")
+        logger.info("Intento de crear producto por usuario: %s", request.user)
         create_serializer = ProductoCreateSerializer(data=request.data)
 
         if not create_serializer.is_valid():
-            logger.warning(f"Datos inválidos para crear producto: {create_serializer.errors}")
+            logger.warning("Datos inválidos para crear producto: %s", create_serializer.errors)
             return Response(
                 create_serializer.errors,
                 status=status.HTTP_400_BAD_REQUEST
             )
 
         try:
-            producto = create_serializer.save()
-            logger.info(f"Producto creado exitosamente: {producto.nombre}")
+            # Savepoint propio: el IntegrityError no rompe una transacción de afuera
+            with transaction.atomic():
+                producto = create_serializer.save()
+            logger.info("Producto creado exitosamente: %s", producto.nombre)
 
             return Response({
                 'mensaje': 'Producto creado exitosamente',
@@ -134,25 +251,277 @@ def productos_list(request):
                     'stock': producto.stock
                 }
             }, status=status.HTTP_201_CREATED)
+        except IntegrityError:
+            # producto_unico_por_categoria: ya está, o lo creó otro request a la vez
+            logger.warning("Producto duplicado: %s", create_serializer.validated_data['nombre_producto'])
+            return Response(
+                {'error': 'Ya existe un producto con ese nombre en la categoría'},
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
-            logger.error(f"Error al crear producto: {str(e)}")
+            logger.error("Error al crear producto: %s", e)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@query_budget(importacion.CONSULTAS_MAXIMAS)
+def productos_bulk(request):
+    """Alta o actualización masiva de productos (array JSON, CSV o NDJSON)"""
+    if not request.user.is_authenticated:
+        return Response(
+            {"error": "Autenticación requerida para importar productos"},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    formato = detectar_formato(request.content_type)
+    logger.info("Importación masiva (%s) por usuario: %s", formato, request.user)
+
+    if formato == 'json':
+        filas = request.data
+        if not isinstance(filas, list):
+            return Response(
+                {'error': 'Se esperaba un array de productos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    else:
+        filas = leer_filas(decodificar(request.stream or ()), formato)
+
+    try:
+        chunk_size = int(request.query_params.get('chunk_size', 500))
+    except ValueError:
+        chunk_size = 500
+    # Lotes más chicos que CHUNK_MIN pasarían el presupuesto de consultas
+    chunk_size = min(max(chunk_size, importacion.CHUNK_MIN), importacion.CHUNK_MAX)
+
+    try:
+        resultado = ImportadorProductos(chunk_size=chunk_size, max_filas=importacion.MAX_FILAS).importar(filas)
+    except DemasiadasFilas as e:
+        logger.warning("Importación masiva rechazada: %s", e)
+        return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    except FormatoInvalido as e:
+        logger.warning("Importación masiva rechazada: %s", e)
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(resultado, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@query_budget(3)
+def productos_reservar(request, pk):
+    """Descontar stock de un producto sin riesgo de sobreventa"""
+    if not request.user.is_authenticated:
+        return Response(
+            {"error": "Autenticación requerida para reservar stock"},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    serializer = ReservaSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    cantidad = serializer.validated_data['cantidad']
+
+    try:
+        stock = reservar(pk, cantidad)
+    except ProductoInexistente:
+        return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+    except ProductoNoDisponible as e:
+        logger.warning("Reserva del producto %s rechazada: no disponible", pk)
+        return _respuesta_no_disponible(e)
+    except StockInsuficiente as e:
+        logger.warning("Stock insuficiente para el producto %s: pedido %d, hay %d", pk, cantidad, e.disponible)
+        return _respuesta_stock_insuficiente(e)
+
+    logger.info("Reserva de %d unidades del producto %s por usuario: %s", cantidad, pk, request.user)
+    return Response({'producto': pk, 'reservado': cantidad, 'stock': stock})
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@query_budget(3)
+def productos_reservar_lote(request):
+    """Descontar stock de varios productos en una transacción (todo o nada)"""
+    if not request.user.is_authenticated:
+        return Response(
+            {"error": "Autenticación requerida para reservar stock"},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    serializer = ReservaLoteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    items = [(item['producto'], item['cantidad']) for item in serializer.validated_data['items']]
+
+    try:
+        stock = reservar_lote(items)
+    except ProductoInexistente as e:
+        return Response(
+            {'error': 'Producto no encontrado', 'producto': e.producto_id},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except ProductoNoDisponible as e:
+        logger.warning("Reserva en lote rechazada: producto %s no disponible", e.producto_id)
+        return _respuesta_no_disponible(e)
+    except StockInsuficiente as e:
+        logger.warning("Reserva en lote rechazada por stock del producto %s", e.producto_id)
+        return _respuesta_stock_insuficiente(e)
+
+    logger.info("Reserva en lote de %d items por usuario: %s", len(items), request.user)
+    return Response({
+        'items': [{'producto': pk, 'stock': restante} for pk, restante in stock.items()]
+    })
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+@query_budget(6)
+def pedidos_crear(request):
+    """
+    Crear un pedido: valida todos los items, descuenta el stock y fija los
+    precios en una sola transacción (todo o nada, ver api/pedidos.py)
+    """
+    if not request.user.is_authenticated:
+        return Response(
+            {"error": "Autenticación requerida para crear pedidos"},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    serializer = PedidoSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    datos = serializer.validated_data
+    items = [(item['producto'], item['cantidad']) for item in datos['items']]
+
+    try:
+        pedido, items_pedido, creado = pedidos.crear_pedido(
+            items, usuario=request.user, referencia=datos.get('referencia')
+        )
+    except ProductoInexistente as e:
+        return Response(
+            {'error': 'Producto no encontrado', 'producto': e.producto_id},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    except pedidos.ReferenciaReutilizada as e:
+        logger.warning("Pedido rechazado: la referencia %s ya es del pedido %s", e.referencia, e.pedido_id)
+        return Response({
+            'error': 'La referencia ya se usó para un pedido con otros items',
+            'referencia': e.referencia,
+            'pedido': e.pedido_id,
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    except ProductoNoDisponible as e:
+        logger.warning("Pedido rechazado: producto %s no disponible", e.producto_id)
+        return _respuesta_no_disponible(e)
+    except StockInsuficiente as e:
+        logger.warning("Pedido rechazado por stock del producto %s", e.producto_id)
+        return _respuesta_stock_insuficiente(e)
+
+    if creado:
+        logger.info("Pedido %s de %d items creado por usuario: %s", pedido.pk, len(items_pedido), request.user)
+    return Response(
+        pedidos.representar_pedido(pedido, items_pedido),
+        status=status.HTTP_201_CREATED if creado else status.HTTP_200_OK
+    )
+
+
+def _respuesta_stock_insuficiente(error):
+    return Response({
+        'error': 'Stock insuficiente',
+        'producto': error.producto_id,
+        'solicitado': error.cantidad,
+        'stock': error.disponible,
+    }, status=status.HTTP_409_CONFLICT)
+
+
+def _respuesta_no_disponible(error):
+    return Response({
+        'error': 'Producto no disponible',
+        'producto': error.producto_id,
+    }, status=status.HTTP_409_CONFLICT)
+
+
+@cache.cache_catalogo('producto', 'categoria')
+@condicional(estado_productos)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@query_budget(4)
+def productos_buscar(request):
+    """Buscar productos sin importar acentos, por prefijo y con errores de tipeo (?q=, ?limite=)"""
+    consulta = request.query_params.get('q', '').strip()
+    if not consulta:
+        return Response(
+            {'error': 'El parámetro q es requerido'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        limite = int(request.query_params.get('limite', 20))
+    except ValueError:
+        limite = 20
+    limite = min(max(limite, 1), 100)
+
+    logger.info("Búsqueda de productos: %s", consulta)
+    ids = busqueda.buscar(consulta, limite)
+
+    # Una consulta por pk y se respeta el orden de relevancia del índice
+    filas = productos_values(Producto.objects.filter(pk__in=ids), 'id')
+    por_id = {fila[-1]: fila for fila in filas}
+    return Response(representar_productos(por_id[pk] for pk in ids if pk in por_id))
+
+
+@cache.cache_catalogo('producto', 'categoria')
+@condicional(estado_productos)
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@query_budget(3)
 def productos_por_categoria(request, categoria_nombre):
     """Obtener productos de una categoría específica"""
-    logger.info(f"Búsqueda de productos por categoría: {categoria_nombre}")
-    productos = Producto.objects.filter(
-        categoria__nombre__iexact=categoria_nombre
-    )
+    logger.info("Búsqueda de productos por categoría: %s", categoria_nombre)
+    if snapshot.puede_responder(request):
+        contenido = snapshot.listado_categoria(categoria_nombre, request.estado_catalogo)
+        if contenido is not None:
+            return _respuesta_json(contenido)
+
+    productos = Producto.objects.de_categoria(categoria_nombre)
+
+    # Una sola consulta: se revisa el resultado en lugar de usar exists()
+    respuesta = _listar_productos(request, productos)
+    if getattr(respuesta, 'data', None) == []:
+        logger.warning("No se encontraron productos para la categoría: %s", categoria_nombre)
+
+    return respuesta
+
+
+def _respuesta_json(contenido):
+    """Respuesta con JSON ya codificado, sin pasar por serializers ni renderers"""
+    return HttpResponse(contenido, content_type='application/json')
+
+
+def _listar_productos(request, productos):
+    """
+    Responde un queryset de productos completo, paginado (?cursor / ?page_size)
+    o en streaming (?stream=1), con los filtros, orden y campos pedidos
+    """
+    filtro = FiltroProductos(request.query_params)
+    productos = filtro.filtrar(productos)
+    campos = filtro.campos
+
+    if request.query_params.get('stream') in ('1', 'true'):
+        logger.info("Exportación de productos en streaming")
+        filas = productos_values(productos, campos=campos).iterator(chunk_size=500)
+        representar = representador(campos)
+        return ndjson_response(representar(fila) for fila in filas)
 
-    if not productos.exists():
-        logger.warning(f"No se encontraron productos para la categoría: {categoria_nombre}")
+    paginador = KeysetPagination()
+    if paginador.is_requested(request):
+        if filtro.orden:
+            raise ValidationError({'ordering': ['No se puede combinar con la paginación por cursor']})
+        pagina = paginador.paginate_queryset(
+            productos_values(productos, 'created_at', 'id', campos=campos), request
+        )
+        return paginador.get_paginated_response(representar_productos(pagina, campos))
 
-    serializer = ProductoSerializer(productos, many=True)
-    return Response(serializer.data)
+    return Response(representar_productos(productos_values(productos, campos=campos), campos))
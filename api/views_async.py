@@ -0,0 +1,241 @@
+"""
+Versiones async (ASGI) de las vistas de lectura del catálogo.
+
+Se usan cuando SERVER_MODE=asgi (ver comida_al_paso/settings.py y
+api/urls.py). El GET simple se resuelve con el ORM async sin ocupar un
+thread; todo lo demás (POST, paginación, streaming, browsable API) se
+delega a la vista sync equivalente. Pasan por la misma cache del catálogo,
+el snapshot del menú y los presupuestos de consultas que las vistas sync.
+
+productos_cambios se usa en los dos modos: en WSGI no mantiene abierta la
+conexión SSE.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+
+from . import cache, cambios, estadisticas, snapshot, views
+from .conditional import aestado_productos, aplicar_cabeceras, calcular_etag, calcular_last_modified
+from .models import Producto
+from .query_budget import query_budget
+from .renderers import TIPOS_COMPACTOS, JSONRendererMedido
+from .serializers import productos_values, representar_producto
+
+logger = logging.getLogger('api')
+
+
+def _json(datos):
+    return HttpResponse(JSONRendererMedido().render(datos), content_type='application/json')
+
+
+def _es_lectura_simple(request):
+    """GET sin query params pidiendo JSON: el único caso que se resuelve en async"""
+    accept = request.META.get('HTTP_ACCEPT', '')
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.GET
+        and 'text/html' not in accept
+        and not any(tipo in accept for tipo in TIPOS_COMPACTOS)
+    )
+
+
+@query_budget(0)
+async def api_home(request):
+    """Página de inicio de la API"""
+    if not _es_lectura_simple(request):
+        return await sync_to_async(views.api_home)(request)
+    logger.info("Acceso a la página de inicio de la API")
+    return _json(views.API_INFO)
+
+
+@query_budget(1)
+async def test_api(request):
+    """Endpoint de prueba"""
+    if not _es_lectura_simple(request):
+        return await sync_to_async(views.test_api)(request)
+    logger.info("Test de API ejecutado")
+    totales = (await sync_to_async(estadisticas.obtener)())['totales']
+    return _json({
+        'mensaje': 'API funcionando correctamente',
+        'total_categorias': totales['categorias'],
+        'total_productos': totales['productos'],
+    })
+
+
+async def _listar_productos(request, productos, categoria_nombre=None):
+    estado = await aestado_productos(request, categoria_nombre)
+    etag = calcular_etag(request, estado)
+    last_modified = calcular_last_modified(estado)
+
+    respuesta = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if respuesta is None and snapshot.activo():
+        respuesta = await _desde_snapshot(categoria_nombre, estado)
+    if respuesta is None:
+        # values_list().aiterator() no es async-safe en Django 4.2: se trae
+        # el resultado completo en un solo sync_to_async (QuerySet.__aiter__)
+        filas = [representar_producto(fila) async for fila in productos_values(productos)]
+        if categoria_nombre is not None and not filas:
+            logger.warning("No se encontraron productos para la categoría: %s", categoria_nombre)
+        respuesta = _json(filas)
+    return aplicar_cabeceras(respuesta, etag, last_modified)
+
+
+async def _desde_snapshot(categoria_nombre, estado):
+    """
+    El JSON ya codificado del snapshot del mismo `estado` que el ETag, como
+    views.productos_list / productos_por_categoria; None si responde la base
+    """
+    if categoria_nombre is None:
+        contenido = (await snapshot.aobtener(estado)).json_productos
+    else:
+        contenido = await snapshot.alistado_categoria(categoria_nombre, estado)
+        if contenido is None:
+            return None
+    return HttpResponse(contenido, content_type='application/json')
+
+
+# Los presupuestos incluyen la consulta de estado (ETag) y, cuando delegan,
+# lo que consulta la vista sync
+
+
+@cache.cache_catalogo('producto', 'categoria')
+@query_budget(4)
+async def productos_list(request):
+    """Listar todos los productos o crear uno nuevo"""
+    if not _es_lectura_simple(request):
+        return await sync_to_async(views.productos_list)(request)
+    logger.info("Listado de productos solicitado")
+    return await _listar_productos(request, Producto.objects.all())
+
+
+@cache.cache_catalogo('producto', 'categoria')
+@query_budget(4)
+async def productos_por_categoria(request, categoria_nombre):
+    """Obtener productos de una categoría específica"""
+    if not _es_lectura_simple(request):
+        return await sync_to_async(views.productos_por_categoria)(request, categoria_nombre)
+    logger.info("Búsqueda de productos por categoría: %s", categoria_nombre)
+    return await _listar_productos(
+        request, Producto.objects.de_categoria(categoria_nombre), categoria_nombre
+    )
+
+
+# Como @api_view: sólo leen en async; todo lo que escribe (POST) va a la
+# vista sync de DRF, que autentica y, con SessionAuthentication, exige el
+# token CSRF a quien usa sesión. Lo que se saltea es el chequeo de
+# CsrfViewMiddleware, que rechazaría también a los clientes con JWT. El
+# decorador csrf_exempt de Django 4.2 no acepta vistas async
+productos_list.csrf_exempt = True
+productos_por_categoria.csrf_exempt = True
+
+
+def _version_pedida(request):
+    """?since= o, si el navegador reconecta, Last-Event-ID. ValueError si no es un entero"""
+    valor = request.GET.get('since') or request.META.get('HTTP_LAST_EVENT_ID')
+    return int(valor) if valor else None
+
+
+def _completo_sse():
+    version, catalogo = cambios.hub.completo()
+    return 'id: %d\nevent: completo\ndata: %s\n\n' % (version, cambios._json(catalogo)), version
+
+
+async def _pendientes_sse(version):
+    """(texto SSE, versión nueva) con los deltas posteriores a `version`"""
+    if cambios.hub.toca_sondear():
+        await sync_to_async(cambios.hub.sondear)()
+    eventos = None if version is None else cambios.hub.desde(version)
+    if eventos is None:
+        return await sync_to_async(_completo_sse)()
+    if not eventos:
+        return '', version
+    return ''.join(evento.sse() for evento in eventos), max(version, eventos[-1].id)
+
+
+async def _stream_sse(version):
+    config = settings.CAMBIOS
+    hub = cambios.hub
+    aviso = hub.suscribir()
+    try:
+        yield 'retry: %d\n\n' % config['RETRY_MS']
+        inicio = ultimo_envio = time.monotonic()
+        while True:
+            aviso.clear()
+            texto, version = await _pendientes_sse(version)
+            ahora = time.monotonic()
+            if texto:
+                yield texto
+                ultimo_envio = ahora
+            elif ahora - ultimo_envio >= config['KEEPALIVE']:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ': ping\n\n'
+                ultimo_envio = ahora
+            if ahora - inicio >= config['DURACION_MAXIMA']:
+                return
+            # Los cambios de este proceso despiertan enseguida; los de otros
+            # workers se ven en el próximo sondeo
+            try:
+                await asyncio.wait_for(aviso.wait(), timeout=hub.intervalo)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        hub.desuscribir(aviso)
+
+
+# Un sondeo: el estado y, si cambió, la foto o los deltas con sus bajas. El
+# stream SSE de ASGI consulta después de devolver la respuesta, fuera del presupuesto
+@query_budget(5)
+async def productos_cambios(request):
+    """
+    Cambios del catálogo posteriores a una versión (?since= o Last-Event-ID).
+
+    Con Accept: text/event-stream responde Server-Sent Events: en ASGI la
+    conexión queda abierta y recibe cada delta al publicarse; en WSGI se
+    mandan los pendientes y el navegador reconecta a los `retry` ms. Si no,
+    JSON con la versión nueva y los deltas. Sin versión, si es más vieja
+    que el buffer o si es más nueva que la de este proceso (ver
+    api/cambios.py), se manda el catálogo completo ('completo': true).
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        version = _version_pedida(request)
+    except ValueError:
+        respuesta = _json({'error': 'since debe ser un número de versión'})
+        respuesta.status_code = 400
+        return respuesta
+
+    if 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+        if settings.API_ASYNC:
+            respuesta = StreamingHttpResponse(_stream_sse(version), content_type='text/event-stream')
+        else:
+            texto, _ = await _pendientes_sse(version)
+            respuesta = HttpResponse(
+                'retry: %d\n\n%s' % (settings.CAMBIOS['RETRY_MS'], texto),
+                content_type='text/event-stream',
+            )
+        respuesta['Cache-Control'] = 'no-cache'
+        # nginx no debe acumular el stream
+        respuesta['X-Accel-Buffering'] = 'no'
+        return respuesta
+
+    await sync_to_async(cambios.hub.sondear)()
+    actual = cambios.hub.version()
+    eventos = None if version is None else cambios.hub.desde(version)
+    if eventos is None:
+        version, catalogo = await sync_to_async(cambios.hub.completo)()
+        datos = {'version': version, 'completo': True, **catalogo}
+    else:
+        datos = {
+            'version': max([actual, version] + [evento.id for evento in eventos[-1:]]),
+            'completo': False,
+            'cambios': [evento.datos for evento in eventos],
+        }
+    respuesta = _json(datos)
+    respuesta['Cache-Control'] = 'no-store'
+    return respuesta
@@ -0,0 +1,65 @@
+"""
+Backend MySQL con pool de conexiones (ENGINE 'comida_al_paso.db.mysql').
+
+Igual al de Django, pero connect() toma la conexión de un pool del proceso
+(comida_al_paso.db.pool) y close() la devuelve en lugar de cerrarla: cada
+request se ahorra el handshake TCP y la autenticación contra el servidor.
+La configuración va en OPTIONS['pool'] (max_size, timeout, max_idle,
+max_lifetime, check_after); con OPTIONS['pool'] = None no se usa pool.
+"""
+from django.db.backends.mysql import base
+from django.utils.asyncio import async_unsafe
+
+from .. import pool as pools
+
+
+def _viva(conexion):
+    try:
+        conexion.ping()
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool = None
+    # La conexión actual salió del pool ya inicializada
+    reutilizada = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        opciones = params.pop('pool', {})
+        if opciones is not None:
+            self.pool = pools.get_pool(self.alias, _viva, **opciones)
+        return params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        conectar = super().get_new_connection
+        try:
+            conexion, nueva = self.pool.obtener(lambda: conectar(conn_params))
+        except pools.PoolAgotado as e:
+            # Django lo convierte en django.db.OperationalError
+            raise base.Database.OperationalError(str(e)) from e
+        self.reutilizada = not nueva
+        return conexion
+
+    def init_connection_state(self):
+        # SQL_AUTO_IS_NULL y el nivel de aislamiento son de la sesión: una
+        # conexión reutilizada ya los tiene
+        if not self.reutilizada:
+            super().init_connection_state()
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        # Una transacción sin terminar o un error sin diagnosticar no se le
+        # pasan al próximo request: esa conexión se cierra
+        descartar = (
+            self.in_atomic_block
+            or self.errors_occurred
+            or self.autocommit != self.settings_dict['AUTOCOMMIT']
+        )
+        self.pool.devolver(self.connection, descartar=descartar)
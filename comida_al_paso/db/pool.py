@@ -0,0 +1,199 @@
+"""
+Pool de conexiones por proceso para los backends de comida_al_paso.db.
+
+Django abre una conexión por thread y la cierra al terminar el request
+(CONN_MAX_AGE=0) o al vencer CONN_MAX_AGE. Con el pool ese cierre devuelve
+la conexión y el próximo connect() la reutiliza sin handshake TCP ni
+autenticación. El pool limita las conexiones abiertas del worker
+(max_size); cuando están todas en uso se espera hasta `timeout` segundos.
+
+Las conexiones ociosas más de `max_idle` segundos o abiertas hace más de
+`max_lifetime` se cierran antes de que el servidor las corte
+(wait_timeout de MySQL); las ociosas más de `check_after` se verifican con
+un ping al sacarlas del pool.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULTS = {
+    'max_size': 10,
+    'timeout': 5.0,
+    'max_idle': 300,
+    'max_lifetime': 3600,
+    'check_after': 30,
+}
+
+
+class PoolAgotado(Exception):
+    """No se liberó ninguna conexión dentro del timeout del pool"""
+
+
+class Pool:
+    """
+    Conexiones DB-API de un alias en este proceso.
+
+    `verificar` (opcional) devuelve si una conexión ociosa sigue viva. Las
+    ociosas se reutilizan de la más reciente a la más vieja, así las que
+    sobran después de un pico vencen por max_idle y se cierran.
+    """
+
+    def __init__(self, verificar=None, max_size=10, timeout=5.0, max_idle=300,
+                 max_lifetime=3600, check_after=30):
+        self.verificar = verificar
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._ociosas = deque()
+        # id(conexión) -> momento en que se abrió
+        self._abiertas = {}
+        # Conexiones abriéndose fuera del lock (ya cuentan para max_size)
+        self._reservadas = 0
+        self._condicion = threading.Condition()
+        self.creadas = 0
+        self.reutilizadas = 0
+        self.descartadas = 0
+        self.esperas = 0
+        self.tiempo_espera = 0.0
+        self.agotado = 0
+
+    def obtener(self, conectar):
+        """
+        (conexión, nueva): una ociosa o, si hay lugar, una nueva abierta con
+        conectar(). Con el pool lleno espera a que se devuelva una;
+        PoolAgotado si no llega en `timeout` segundos.
+        """
+        inicio = None
+        conexion = None
+        with self._condicion:
+            while True:
+                conexion = self._tomar_ociosa()
+                if conexion is not None:
+                    self.reutilizadas += 1
+                    break
+                if len(self._abiertas) + self._reservadas < self.max_size:
+                    self._reservadas += 1
+                    break
+                if inicio is None:
+                    inicio = time.monotonic()
+                    self.esperas += 1
+                restante = inicio + self.timeout - time.monotonic()
+                if restante <= 0:
+                    self.agotado += 1
+                    self.tiempo_espera += self.timeout
+                    raise PoolAgotado(
+                        'No hay conexiones libres (%d en uso) tras %.1fs' % (self.max_size, self.timeout)
+                    )
+                self._condicion.wait(restante)
+            if inicio is not None:
+                self.tiempo_espera += time.monotonic() - inicio
+        if conexion is not None:
+            return conexion, False
+
+        # El handshake se hace fuera del lock
+        try:
+            conexion = conectar()
+        except BaseException:
+            with self._condicion:
+                self._reservadas -= 1
+                self._condicion.notify()
+            raise
+        with self._condicion:
+            self._reservadas -= 1
+            self._abiertas[id(conexion)] = time.monotonic()
+            self.creadas += 1
+        return conexion, True
+
+    def _tomar_ociosa(self):
+        """La ociosa más reciente que siga sirviendo (con el lock tomado)"""
+        while self._ociosas:
+            conexion, devuelta = self._ociosas.pop()
+            ahora = time.monotonic()
+            vieja = ahora - self._abiertas[id(conexion)] > self.max_lifetime
+            if vieja or ahora - devuelta > self.max_idle:
+                self._cerrar(conexion)
+                continue
+            if self.verificar is not None and ahora - devuelta > self.check_after:
+                if not self.verificar(conexion):
+                    self._cerrar(conexion)
+                    continue
+            return conexion
+        return None
+
+    def devolver(self, conexion, descartar=False):
+        """Vuelve al pool; con descartar=True (transacción a medias, error) se cierra"""
+        with self._condicion:
+            if id(conexion) not in self._abiertas:
+                # Abierta por otro pool (antes de un fork): no se reutiliza
+                _cerrar_silencioso(conexion)
+                return
+            vieja = time.monotonic() - self._abiertas[id(conexion)] > self.max_lifetime
+            if descartar or vieja:
+                self._cerrar(conexion)
+            else:
+                self._ociosas.append((conexion, time.monotonic()))
+            self._condicion.notify()
+
+    def _cerrar(self, conexion):
+        del self._abiertas[id(conexion)]
+        self.descartadas += 1
+        _cerrar_silencioso(conexion)
+
+    def cerrar_todas(self):
+        """Cierra las ociosas (al terminar el proceso o en tests)"""
+        with self._condicion:
+            while self._ociosas:
+                self._cerrar(self._ociosas.pop()[0])
+
+    def estadisticas(self):
+        with self._condicion:
+            abiertas = len(self._abiertas) + self._reservadas
+            ociosas = len(self._ociosas)
+            return {
+                'max': self.max_size,
+                'abiertas': abiertas,
+                'ociosas': ociosas,
+                'en_uso': abiertas - ociosas,
+                'creadas': self.creadas,
+                'reutilizadas': self.reutilizadas,
+                'descartadas': self.descartadas,
+                'esperas': self.esperas,
+                'tiempo_espera': self.tiempo_espera,
+                'agotado': self.agotado,
+            }
+
+
+def _cerrar_silencioso(conexion):
+    # Si el servidor ya la cortó, close() puede fallar: da igual
+    try:
+        conexion.close()
+    except Exception:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, verificar=None, **opciones):
+    """
+    Pool del alias en este proceso. Se crea en el primer uso: con gunicorn,
+    después del fork, así cada worker tiene sus propias conexiones.
+    """
+    clave = (alias, os.getpid())
+    pool = _pools.get(clave)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(clave)
+            if pool is None:
+                pool = _pools[clave] = Pool(verificar, **{**DEFAULTS, **opciones})
+    return pool
+
+
+def estadisticas():
+    """{alias: estadísticas} de los pools de este proceso"""
+    pid = os.getpid()
+    return {alias: pool.estadisticas() for (alias, p), pool in list(_pools.items()) if p == pid}
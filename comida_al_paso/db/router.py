@@ -0,0 +1,69 @@
+"""
+Router de réplicas de lectura (DATABASE_ROUTERS, se activa con DB_REPLICAS).
+
+Las escrituras van siempre a 'default'. Las lecturas van a una réplica
+sólo dentro de un request GET/HEAD/OPTIONS de un cliente que no escribió
+hace poco (api.middleware.ReplicasMiddleware marca `lecturas_en_replica`);
+comandos (load_menu_data), signals, threads de fondo, transacciones y
+requests que escriben leen de la primaria. Sólo se replican las lecturas
+de las apps de REPLICAS['APPS'] (el catálogo): sesiones y usuarios se leen
+siempre de la primaria.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+lecturas_en_replica = ContextVar('lecturas_en_replica', default=False)
+
+
+def _config():
+    return getattr(settings, 'REPLICAS', {})
+
+
+def replicas():
+    return _config().get('ALIAS', ())
+
+
+def ventana():
+    """Segundos que un cliente lee de la primaria después de escribir"""
+    return _config().get('STICKY_SEGUNDOS', 10)
+
+
+def origen_lecturas():
+    """'replica' o 'primaria': de dónde salen las lecturas del contexto actual"""
+    return 'replica' if lecturas_en_replica.get() and replicas() else 'primaria'
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        alias = replicas()
+        if not alias or not lecturas_en_replica.get():
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label not in _config().get('APPS', ('api',)):
+            return DEFAULT_DB_ALIAS
+        # Dentro de un atomic() se lee lo que la transacción va a escribir
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Las relaciones de un objeto se leen de donde salió el objeto
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db:
+            return instancia._state.db
+        return random.choice(alias)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por replicación
+        if db in replicas():
+            return False
+        return None
@@ -1,5 +1,8 @@
 from pathlib import Path
+import importlib.util
 import os
+import sys
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -14,6 +17,9 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-change-this-in-production'
 # Environment
 ENV = os.getenv('ENV', 'development').lower()
 
+# manage.py test: sin archivos ni estado compartido con la aplicación
+EJECUTANDO_TESTS = sys.argv[1:2] == ['test']
+
 # DEBUG acepta: "True", "true", "1", "yes"
 DEBUG = os.getenv('DEBUG', 'False').lower() in ('true', '1', 'yes')
 
@@ -40,13 +46,23 @@ INSTALLED_APPS = [
 
 # Middleware
 MIDDLEWARE = [
+    # Primero, para medir el request completo (ver api/middleware.py)
+    'api.middleware.MetricasMiddleware',
+    'api.middleware.CompresionMiddleware',
+    'api.middleware.SobrecargaMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # WhiteNoise para archivos estáticos
+    # WhiteNoise para archivos estáticos. El de WhiteNoise es sólo sync: con
+    # ASGI haría pasar toda la cadena por un thread (ver api/middleware.py)
+    'api.middleware.EstaticosMiddleware',
     
     # CORS debe ir aquí, ANTES de Session y Auth
     'corsheaders.middleware.CorsMiddleware', 
     
     'django.contrib.sessions.middleware.SessionMiddleware',
+    # Antes de las vistas: también limita los HIT de cache y los 304
+    'api.middleware.ThrottleMiddleware',
+    # Después de Session: la ventana sticky se guarda por usuario
+    'api.middleware.ReplicasMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -73,6 +89,61 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'comida_al_paso.wsgi.application'
+ASGI_APPLICATION = 'comida_al_paso.asgi.application'
+
+# SERVER_MODE=asgi levanta gunicorn con workers de uvicorn (ver entrypoint.sh)
+# y las lecturas del catálogo pasan a las vistas async de api/views_async.py
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+API_ASYNC = SERVER_MODE == 'asgi'
+
+# Con ASGI, los middlewares de Django que sólo leen y escriben cabeceras
+# corren en el event loop en vez de saltar a un thread en cada método
+# (api.middleware.EnElLoopMixin). benchmark --modo gunicorn --servidor asgi:
+# de ~435 a ~540 req/s en los listados. CSRF, sesión y mensajes siguen
+# siendo los de Django; con WSGI no se reemplaza ninguno.
+EN_EL_LOOP = {
+    'django.middleware.security.SecurityMiddleware': 'api.middleware.SeguridadMiddleware',
+    'django.middleware.common.CommonMiddleware': 'api.middleware.ComunMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware': 'api.middleware.AutenticacionMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware': 'api.middleware.XFrameMiddleware',
+}
+if API_ASYNC:
+    MIDDLEWARE = [EN_EL_LOOP.get(clase, clase) for clase in MIDDLEWARE]
+
+# Procesos que atienden requests: gunicorn lee la misma variable (entrypoint.sh).
+# Con más de uno, lo que se comparte entre workers tiene que estar en un
+# cache compartido (ver CACHES y api/checks.py)
+WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# ---------------------------
+# CACHE
+# ---------------------------
+
+# CACHE_URL: redis://host:puerto/db (paquete redis) o memcached://host:puerto
+# (paquete pymemcache). Sin CACHE_URL, cada proceso tiene su propio cache en
+# memoria: sirve con un solo worker (runserver, comandos, tests).
+CACHE_URL = os.getenv('CACHE_URL', '')
+
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith('memcached://'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': CACHE_URL.removeprefix('memcached://'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
 
 # ---------------------------
 # BASE DE DATOS
@@ -81,28 +152,107 @@ WSGI_APPLICATION = 'comida_al_paso.wsgi.application'
 DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.sqlite3')
 
 if 'mysql' in DB_ENGINE.lower():
-    # Base de datos Railway MySQL
+    # Base de datos Railway MySQL. Con DB_POOL (por defecto) se usa
+    # comida_al_paso.db.mysql: cada worker reutiliza hasta DB_POOL_MAX
+    # conexiones en lugar de abrir una por request. DB_POOL_MAX_IDLE tiene
+    # que quedar por debajo del wait_timeout del servidor.
+    DB_POOL = os.getenv('DB_POOL', 'True').lower() in ('true', '1', 'yes')
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.mysql',
+            'ENGINE': 'comida_al_paso.db.mysql' if DB_POOL else 'django.db.backends.mysql',
             'NAME': os.getenv('MYSQLDATABASE', 'railway'),
             'USER': os.getenv('MYSQLUSER', 'root'),
             'PASSWORD': os.getenv('MYSQLPASSWORD', ''),
             'HOST': os.getenv('MYSQLHOST', 'localhost'),
             'PORT': os.getenv('MYSQLPORT', '3306'),
+            # Con pool cada request devuelve la conexión al terminar (0);
+            # sin pool, conexiones persistentes por thread
+            'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 0 if DB_POOL else 60)),
+            'CONN_HEALTH_CHECKS': True,
             'OPTIONS': {
                 'charset': 'utf8mb4',
             },
         }
     }
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'max_size': int(os.getenv('DB_POOL_MAX', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '5')),
+            'max_idle': int(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            'max_lifetime': int(os.getenv('DB_POOL_MAX_LIFETIME', '3600')),
+            'check_after': int(os.getenv('DB_POOL_CHECK_AFTER', '30')),
+        }
 else:
-    # Base SQLite local
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+    # Base SQLite local. Con SQLITE_PERFIL=produccion (por defecto) se usa
+    # comida_al_paso.db.sqlite3: WAL, PRAGMAs, BEGIN IMMEDIATE y conexiones
+    # persistentes; SQLITE_PERFIL=basico es el backend de Django sin cambios
+    if os.getenv('SQLITE_PERFIL', 'produccion') == 'basico':
+        DATABASES = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.getenv('SQLITE_NAME', BASE_DIR / 'db.sqlite3'),
+            }
+        }
+    else:
+        DATABASES = {
+            'default': {
+                'ENGINE': 'comida_al_paso.db.sqlite3',
+                'NAME': os.getenv('SQLITE_NAME', BASE_DIR / 'db.sqlite3'),
+                'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 600)),
+                'CONN_HEALTH_CHECKS': True,
+                # Los tests usan un archivo y no la base en memoria compartida: con
+                # varios threads ésta da "table is locked" en lugar de esperar
+                # busy_timeout (ver ReservasConcurrentesTests en api/tests.py).
+                # Uno por proceso: dos corridas en la misma máquina no se pisan
+                'TEST': {
+                    'NAME': os.getenv(
+                        'SQLITE_TEST_NAME',
+                        os.path.join(tempfile.gettempdir(), 'comida_al_paso_test_%d.sqlite3' % os.getpid()),
+                    ),
+                },
+                'OPTIONS': {
+                    'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+                    'pragmas': {
+                        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),
+                        'cache_size': -int(os.getenv('SQLITE_CACHE_KB', 65536)),
+                        'mmap_size': int(os.getenv('SQLITE_MMAP_BYTES', 268435456)),
+                    },
+                },
+            }
         }
-    }
+
+# ---------------------------
+# RÉPLICAS DE LECTURA
+# ---------------------------
+
+# DB_REPLICAS: réplicas separadas por coma, con la misma configuración que
+# 'default' salvo el host (MySQL, 'host' o 'host:puerto') o el archivo
+# (SQLite). Los GET del catálogo leen de una réplica; quien escribe lee de
+# la primaria durante STICKY_SEGUNDOS (api.middleware.ReplicasMiddleware: por
+# usuario en CACHES[CACHE_ALIAS], que con varios workers tiene que ser
+# compartido: sin CACHE_URL el arranque falla con api.E002; con una cookie
+# para los clientes sin usuario).
+DB_REPLICAS = [replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',') if replica.strip()]
+
+for numero, replica in enumerate(DB_REPLICAS, start=1):
+    config = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    if 'mysql' in DB_ENGINE.lower():
+        config['HOST'], _, puerto = replica.partition(':')
+        config['PORT'] = puerto or config['PORT']
+    else:
+        config['NAME'] = replica
+    DATABASES['replica_%d' % numero] = config
+
+REPLICAS = {
+    'ALIAS': tuple('replica_%d' % numero for numero in range(1, len(DB_REPLICAS) + 1)),
+    'APPS': ('api',),
+    'STICKY_SEGUNDOS': int(os.getenv('DB_STICKY_SEGUNDOS', '10')),
+    'COOKIE': 'db_primaria',
+    'CACHE_ALIAS': 'default',
+}
+
+if DB_REPLICAS:
+    DATABASE_ROUTERS = ['comida_al_paso.db.router.ReplicaRouter']
 
 # ---------------------------
 # Validación de contraseñas
@@ -165,9 +315,30 @@ CSRF_TRUSTED_ORIGINS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Ver JWT_USUARIOS más abajo
+        'api.autenticacion.StatelessReadJWTAuthentication'
+        if os.getenv('JWT_SIN_ESTADO_EN_LECTURAS', 'False').lower() in ('true', '1', 'yes')
+        else 'api.autenticacion.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
+    # Con Accept: application/vnd.comidaalpaso.compacto+json (o
+    # application/msgpack, si está instalado msgpack) los listados de
+    # productos mandan cada categoría una sola vez (ver api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.JSONRendererMedido',
+        'api.renderers.CompactoRenderer',
+        *(('api.renderers.MessagePackRenderer',) if importlib.util.find_spec('msgpack') else ()),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.AnonTokenBucketThrottle',
+        'api.throttling.UserTokenBucketThrottle',
+    ),
+    # Proxies delante de la app (Railway: 1). El throttle anónimo identifica
+    # al cliente por la IP que agregó el último proxy a X-Forwarded-For; con 0,
+    # por REMOTE_ADDR. Sin este valor DRF usa el X-Forwarded-For que manda el
+    # cliente, y cambiándolo en cada request tendría un bucket nuevo.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '1' if 'prod' in ENV else '0')),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
@@ -178,6 +349,191 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Usuarios autenticados por JWT cacheados por id en cada worker (ver
+# api/autenticacion.py). Guardar o borrar un usuario lo invalida en todos los
+# workers si CACHES[CACHE_ALIAS] es compartido (CACHE_URL): cada request
+# compara la versión del usuario guardada ahí. Sin CACHE_URL sólo se invalida
+# en el worker que hizo el cambio; en los demás un usuario desactivado o con
+# otra contraseña sigue entrando hasta CACHE_TIMEOUT segundos, por eso con
+# varios workers el TTL baja a 5.
+# JWT_SIN_ESTADO_EN_LECTURAS arma el usuario de los GET con los claims del token.
+JWT_USUARIOS = {
+    'CACHE_MAX_ENTRIES': int(os.getenv('JWT_CACHE_MAX_ENTRIES', '1024')),
+    'CACHE_TIMEOUT': int(os.getenv('JWT_CACHE_TIMEOUT', '60' if CACHE_URL or WORKERS == 1 else '5')),
+    'CACHE_ALIAS': 'default',
+}
+
+# ---------------------------
+# LÍMITES POR CLIENTE Y SOBRECARGA
+# ---------------------------
+
+# Token buckets por IP (anon) o usuario (user), ver api/throttling.py.
+# BACKEND: 'compartido' (archivo en /dev/shm para todos los workers de la
+# máquina), 'local' (por worker) o 'cache' (CACHES[CACHE_ALIAS]).
+# TASAS: 'scope', 'url_name.scope' o 'METODO url_name.scope'; None sin límite.
+# api.middleware.ThrottleMiddleware los aplica a las rutas de PREFIJOS antes
+# de la cache del catálogo y de las vistas async. Los tests usan 'local': el
+# archivo compartido es el mismo que el de la aplicación en esta máquina.
+THROTTLE = {
+    'BACKEND': os.getenv('THROTTLE_BACKEND', 'local' if EJECUTANDO_TESTS else 'compartido'),
+    'ARCHIVO': os.getenv('THROTTLE_ARCHIVO', ''),
+    'CACHE_ALIAS': 'default',
+    'PREFIJOS': ('/api/',),
+    'TASAS': {
+        'anon': os.getenv('THROTTLE_ANON', '120/min'),
+        'user': os.getenv('THROTTLE_USER', '600/min'),
+        'POST categoria-list.anon': '10/min',
+        'productos-bulk.user': '20/min',
+    },
+}
+
+# THROTTLE_ACTIVO=False quita todos los límites (benchmarks, pruebas de carga)
+if os.getenv('THROTTLE_ACTIVO', 'True').lower() not in ('true', '1', 'yes'):
+    THROTTLE['TASAS'] = {}
+
+# api.middleware.SobrecargaMiddleware: 503 con Retry-After cuando hay
+# demasiados requests en curso o esperando en el proxy (X-Request-Start).
+# EXCLUIDAS (rutas) nunca se descartan ni cuentan como en curso: un worker
+# cargado no tiene que parecerle caído al balanceador.
+SOBRECARGA = {
+    'ACTIVO': os.getenv('SOBRECARGA', 'False').lower() in ('true', '1', 'yes'),
+    'MAX_EN_CURSO': int(os.getenv('SOBRECARGA_MAX_EN_CURSO', '64')),
+    'MIN_EN_CURSO': 4,
+    'MAX_ESPERA_MS': int(os.getenv('SOBRECARGA_MAX_ESPERA_MS', '500')),
+    'OBJETIVO_MS': int(os.getenv('SOBRECARGA_OBJETIVO_MS', '250')),
+    'RETRY_AFTER': 2,
+    'PRIORITARIAS': (
+        'productos-list', 'productos-por-categoria', 'productos-buscar',
+        'categoria-list', 'categoria-detail',
+    ),
+    'EXCLUIDAS': ('/healthz',),
+}
+
+# ---------------------------
+# PRESUPUESTO DE CONSULTAS
+# ---------------------------
+
+# RAISE=True hace fallar las vistas que superan su presupuesto (útil en tests);
+# en producción sólo se registra un warning.
+QUERY_BUDGET = {
+    'RAISE': os.getenv('QUERY_BUDGET_RAISE', 'False').lower() in ('true', '1', 'yes'),
+}
+
+# ---------------------------
+# CACHE DEL CATÁLOGO
+# ---------------------------
+
+# BACKEND: 'lru' (memoria del proceso), 'django' (usa CACHES[ALIAS]) u 'off'.
+# Las versiones por tabla se guardan en CACHES[ALIAS]: una escritura
+# invalida en todos los workers sólo si ese cache es compartido. Con varios
+# workers y sin CACHE_URL la cache queda apagada por defecto, y encenderla
+# es un error de configuración (api.E001: migrate y check fallan al arrancar).
+CATALOGO_CACHE = {
+    'BACKEND': os.getenv('CATALOGO_CACHE_BACKEND', 'lru' if CACHE_URL or WORKERS == 1 else 'off'),
+    'ALIAS': 'default',
+    'MAX_ENTRIES': int(os.getenv('CATALOGO_CACHE_MAX_ENTRIES', '512')),
+    'TIMEOUT': int(os.getenv('CATALOGO_CACHE_TIMEOUT', '60')),
+}
+
+# Cache-Control de las respuestas del catálogo (ver api/conditional.py).
+# Los clientes y la CDN revalidan con ETag/Last-Modified y pueden servir la
+# copia vieja mientras revalidan en segundo plano.
+CATALOGO_CACHE_CONTROL = {
+    'public': True,
+    'max_age': int(os.getenv('CATALOGO_MAX_AGE', '10')),
+    'stale_while_revalidate': int(os.getenv('CATALOGO_STALE_WHILE_REVALIDATE', '60')),
+}
+
+# ---------------------------
+# COMPRESIÓN DE RESPUESTAS
+# ---------------------------
+
+# api.middleware.CompresionMiddleware: brotli (si está instalado) o gzip
+# para las respuestas de datos de al menos MIN_BYTES. Las que tienen ETag
+# (catálogo) se comprimen una vez por versión con los niveles *_CACHE y se
+# guardan hasta CACHE_ENTRADAS cuerpos por worker.
+COMPRESION = {
+    'ACTIVO': os.getenv('COMPRESION', 'True').lower() in ('true', '1', 'yes'),
+    'MIN_BYTES': int(os.getenv('COMPRESION_MIN_BYTES', '512')),
+    'NIVEL_GZIP': int(os.getenv('COMPRESION_NIVEL_GZIP', '6')),
+    'NIVEL_BROTLI': int(os.getenv('COMPRESION_NIVEL_BROTLI', '5')),
+    'NIVEL_GZIP_CACHE': int(os.getenv('COMPRESION_NIVEL_GZIP_CACHE', '9')),
+    'NIVEL_BROTLI_CACHE': int(os.getenv('COMPRESION_NIVEL_BROTLI_CACHE', '9')),
+    'CACHE_ENTRADAS': int(os.getenv('COMPRESION_CACHE_ENTRADAS', '64')),
+}
+
+# ---------------------------
+# ESTADÍSTICAS DEL CATÁLOGO
+# ---------------------------
+
+# Segundos que se reutilizan las estadísticas de /api/estadisticas/ y
+# /api/test/ mientras el catálogo no cambie (ver api/estadisticas.py)
+ESTADISTICAS = {
+    'TIMEOUT': int(os.getenv('ESTADISTICAS_TIMEOUT', '5')),
+}
+
+# ---------------------------
+# SNAPSHOT DEL MENÚ
+# ---------------------------
+
+# Con ACTIVO cada worker guarda el menú completo en memoria y responde los
+# listados de productos con JSON precalculado. INTERVALO son los segundos
+# entre chequeos de cambios en la base (una consulta agregada). Los listados
+# que calculan su ETag en el request no esperan al chequeo: si el snapshot
+# es de otro estado se reconstruye antes de responder.
+MENU_SNAPSHOT = {
+    'ACTIVO': os.getenv('MENU_SNAPSHOT', 'False').lower() in ('true', '1', 'yes'),
+    'INTERVALO': float(os.getenv('MENU_SNAPSHOT_INTERVALO', '1.0')),
+}
+
+# ---------------------------
+# FEED DE CAMBIOS
+# ---------------------------
+
+# /api/productos/cambios/ (ver api/cambios.py). BUFFER es la cantidad de
+# deltas que se guardan para reanudar; INTERVALO, los segundos entre
+# chequeos de cambios hechos por otros workers. Con SSE (sólo en ASGI) se
+# manda un comentario cada KEEPALIVE segundos y la conexión se cierra a los
+# DURACION_MAXIMA segundos: el navegador reconecta con Last-Event-ID.
+CAMBIOS = {
+    'BUFFER': int(os.getenv('CAMBIOS_BUFFER', '1000')),
+    'INTERVALO': float(os.getenv('CAMBIOS_INTERVALO', '1.0')),
+    'MARGEN': float(os.getenv('CAMBIOS_MARGEN', '5.0')),
+    'KEEPALIVE': int(os.getenv('CAMBIOS_KEEPALIVE', '15')),
+    'DURACION_MAXIMA': int(os.getenv('CAMBIOS_DURACION_MAXIMA', '300')),
+    'RETRY_MS': int(os.getenv('CAMBIOS_RETRY_MS', '3000')),
+}
+
+# ---------------------------
+# BÚSQUEDA DE PRODUCTOS
+# ---------------------------
+
+# MOTOR: 'indice' (índice invertido en memoria de cada worker) o 'fulltext'
+# (índice FULLTEXT de MySQL; en otras bases se usa el índice en memoria).
+# INTERVALO son los segundos entre chequeos de cambios hechos por otros workers.
+BUSQUEDA = {
+    'MOTOR': os.getenv('BUSQUEDA_MOTOR', 'indice'),
+    'INTERVALO': float(os.getenv('BUSQUEDA_INTERVALO', '5.0')),
+}
+
+# ---------------------------
+# MÉTRICAS
+# ---------------------------
+
+# api.middleware.MetricasMiddleware: Server-Timing, una línea JSON por request
+# en el logger api.metricas y histogramas por vista en /api/metrics/, de
+# cada worker por separado (etiqueta worker con su pid).
+# TOKEN habilita el scrape con la cabecera X-Metricas-Token sin ser staff.
+# EXCLUIDAS (rutas) no se miden: los chequeos del balanceador llenarían los
+# histogramas y el log.
+METRICAS = {
+    'ACTIVO': os.getenv('METRICAS', 'True').lower() in ('true', '1', 'yes'),
+    'SERVER_TIMING': os.getenv('METRICAS_SERVER_TIMING', 'True').lower() in ('true', '1', 'yes'),
+    'LOG': os.getenv('METRICAS_LOG', 'True').lower() in ('true', '1', 'yes'),
+    'TOKEN': os.getenv('METRICAS_TOKEN', ''),
+    'EXCLUIDAS': ('/healthz',),
+}
+
 # ---------------------------
 # Auto primary key
 # ---------------------------
@@ -188,29 +544,40 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # LOGGING
 # ---------------------------
 
+# Los handlers sólo encolan; un thread aparte escribe en la consola y en
+# LOG_ARCHIVO (logs/django.log, fuera de git; vacío: sin archivo). Con
+# manage.py test no hay archivo ni consola salvo que se pidan con estas
+# variables: las pruebas no ensucian el árbol ni la salida. LOG_FORMATO: 'json'
+# (una línea por registro) o 'texto'. LOG_ROTACION: 'proceso' rota el
+# archivo cada LOG_MAX_BYTES, sólo para un proceso (runserver, comandos);
+# con varios workers, 'externa' (WatchedFileHandler, rota logrotate).
+# entrypoint.sh levanta gunicorn sin archivo: los workers escriben en la
+# consola, que recoge la plataforma. Ver api/registro.py.
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
-    'formatters': {
-        'verbose': {
-            'format': '[{levelname}] {asctime} {name} - {message}',
-            'style': '{',
-        },
-    },
     'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+        'cola': {
+            '()': 'api.registro.crear_manejador_en_cola',
+            'archivo': os.getenv(
+                'LOG_ARCHIVO', '' if EJECUTANDO_TESTS else str(BASE_DIR / 'logs' / 'django.log')
+            ) or None,
+            'formato': os.getenv('LOG_FORMATO', 'json'),
+            'consola': os.getenv('LOG_CONSOLA', str(not EJECUTANDO_TESTS)).lower() in ('true', '1', 'yes'),
+            'max_bytes': int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+            'backups': int(os.getenv('LOG_BACKUPS', '5')),
+            'rotacion': os.getenv('LOG_ROTACION', 'proceso'),
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['console'],
+            'handlers': ['cola'],
             'level': 'INFO',
         },
         'api': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
+            'handlers': ['cola'],
+            'level': os.getenv('LOG_NIVEL_API', 'DEBUG'),
         },
     },
 }
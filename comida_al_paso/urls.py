@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from api.views import healthz
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -9,6 +10,9 @@ from rest_framework_simplejwt.views import (
 urlpatterns = [
     path('admin/', admin.site.urls),
 
+    # Chequeo de vida (sin base de datos)
+    path('healthz', healthz, name='healthz'),
+
     # API principal
     path('api/', include('api.urls')),
 
@@ -4,6 +4,11 @@ set -e
 
 echo "Iniciando aplicación Comida al Paso API"
 
+# Cantidad de workers de gunicorn. Los settings la leen: con más de uno,
+# lo compartido entre workers necesita CACHE_URL y migrate (que corre los
+# system checks) falla si falta. Ver api/checks.py
+export WEB_CONCURRENCY="${WEB_CONCURRENCY:-3}"
+
 # Ejecutar migraciones
 echo "Ejecutando migraciones de base de datos..."
 python manage.py migrate --noinput
@@ -12,17 +17,35 @@ python manage.py migrate --noinput
 echo "Recopilando archivos estáticos..."
 python manage.py collectstatic --noinput
 
-# Cargar datos iniciales si la base está vacía
+# Cargar datos iniciales: sólo escribe si el menú cambió desde la última carga
+# y nunca borra productos o categorías editados en producción
 echo "Verificando datos iniciales..."
 python manage.py load_menu_data || echo "Datos ya cargados o comando no disponible"
 
 echo "Aplicación preparada exitosamente"
 
-# Siempre usar gunicorn en Railway
+# Varios workers: sin logs/django.log, cada uno rotaría el archivo por su
+# cuenta. Los logs van a la consola; con LOG_ARCHIVO, rotación externa
+# (logrotate). Ver LOGGING en comida_al_paso/settings.py
+export LOG_ARCHIVO="${LOG_ARCHIVO:-}"
+export LOG_ROTACION="${LOG_ROTACION:-externa}"
+
+# Siempre usar gunicorn en Railway; SERVER_MODE=asgi usa workers de uvicorn
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    echo "Iniciando en modo PRODUCCIÓN con GUNICORN + UVICORN (ASGI)..."
+    exec gunicorn comida_al_paso.asgi:application \
+        --worker-class uvicorn_worker.UvicornWorker \
+        --bind 0.0.0.0:8000 \
+        --workers ${WEB_CONCURRENCY} \
+        --timeout 120 \
+        --access-logfile - \
+        --error-logfile -
+fi
+
 echo "Iniciando en modo PRODUCCIÓN con GUNICORN..."
 exec gunicorn comida_al_paso.wsgi:application \
     --bind 0.0.0.0:8000 \
-    --workers 3 \
+    --workers ${WEB_CONCURRENCY} \
     --timeout 120 \
     --access-logfile - \
     --error-logfile -
\ No newline at end of file